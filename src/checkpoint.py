@@ -0,0 +1,131 @@
+from service import StripZsndState, DropoutCollector
+from wav_io import ZsndWavWriter
+from dropout_runs import ZsndDropoutRuns
+from util import ZsndLogMixin, ZsndError
+
+from i18n import t as _
+import io
+import json
+import os
+import time
+from dataclasses import dataclass, field, asdict
+
+@dataclass
+class ZsndCheckpoint:
+    input_size: int
+    input_mtime_ns: int
+    min_duration: int
+    threshold: float
+    input_frames: int
+    output_frames: int
+    num_trailing_zeros: int
+    num_dropouts: int = 0
+    # the range of the input to strip, in frames
+    start: int = 0
+    end: int|None = None
+    # saved by ZsndDropoutRuns.save() next to the JSON, not in it
+    dropouts: ZsndDropoutRuns = field(default_factory=ZsndDropoutRuns, repr=False)
+
+class ZsndCheckpointer(ZsndLogMixin):
+    '''
+    Periodically saves the progress of stripping next to the output file,
+    so that an interrupted run can be resumed.
+    '''
+    SUFFIX = '.zsnd-checkpoint'
+    # of the dropouts, next to the checkpoint
+    RUNS_SUFFIX = SUFFIX + '.runs'
+    _INTERVAL_IN_SECONDS = 10.0
+
+    def __init__(self, input_path: str, output_path: str, min_duration: int, threshold: float,
+            interval_in_seconds: float = _INTERVAL_IN_SECONDS,
+            frame_range: tuple[int, int|None] = (0, None)):
+        self._input_path = input_path
+        self.path = output_path + self.SUFFIX
+        self.runs_path = output_path + self.RUNS_SUFFIX
+        self._min_duration = min_duration
+        self._threshold = threshold
+        self._frame_range = frame_range
+        self._interval = interval_in_seconds
+        self._last_saved_at = time.monotonic()
+        # the latest consistent state (input frames, output frames, trailing zeros, dropouts)
+        self._snapshot: tuple[int, int, int, int]|None = None
+        self._writer: ZsndWavWriter|None = None
+
+    def load(self) -> ZsndCheckpoint|None:
+        '''
+        :raises ZsndError: when the checkpoint does not match the input or the options
+        '''
+        if not os.path.exists(self.path):
+            return None
+        with io.open(self.path, 'r', encoding='utf-8') as f:
+            checkpoint = ZsndCheckpoint(**json.load(f))
+        try:
+            runs = ZsndDropoutRuns.load(self.runs_path)
+        except (OSError, ValueError) as exc:
+            raise ZsndError(_('zsnd.checkpoint_runs_broken') % (self.path)) from exc
+        try:
+            if len(runs) < checkpoint.num_dropouts:
+                raise ZsndError(_('zsnd.checkpoint_runs_broken') % (self.path))
+            # the runs may be newer than the JSON, and are appended to when resumed
+            checkpoint.dropouts = runs[:checkpoint.num_dropouts]
+        finally:
+            runs.close()
+        st = os.stat(self._input_path)
+        if (st.st_size, st.st_mtime_ns) != (checkpoint.input_size, checkpoint.input_mtime_ns):
+            raise ZsndError(_('zsnd.checkpoint_input_changed') % (self.path))
+        if (self._min_duration, self._threshold, self._frame_range) \
+                != (checkpoint.min_duration, checkpoint.threshold,
+                        (checkpoint.start, checkpoint.end)):
+            raise ZsndError(_('zsnd.checkpoint_options_changed') % (self.path))
+        return checkpoint
+
+    def update(self, state: StripZsndState, out_file: io.BufferedIOBase, writer: ZsndWavWriter,
+            collector: DropoutCollector):
+        '''
+        Call this whenever `state` is consistent.
+        '''
+        self._snapshot = (state.pos, writer.tell(), state.num_prev_trailing_zeros,
+                len(collector.dropouts))
+        self._writer = writer
+        if time.monotonic() - self._last_saved_at >= self._interval:
+            self.save(out_file, collector)
+
+    def save(self, out_file: io.BufferedIOBase, collector: DropoutCollector):
+        if self._snapshot is None:
+            return
+        input_frames, output_frames, num_trailing_zeros, num_dropouts = self._snapshot
+        # the output must be durable before the checkpoint refers to it
+        if self._writer is not None:
+            # including the buffers not written yet by a write-behind thread
+            self._writer.flush()
+        out_file.flush()
+        os.fsync(out_file.fileno())
+        # the runs first, so that the JSON never refers to more runs than saved
+        runs = collector.dropouts
+        if len(runs) != num_dropouts:
+            runs = runs[:num_dropouts]
+        tmp_path = self.runs_path + '.tmp'
+        with io.open(tmp_path, 'wb') as f:
+            runs.save(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.runs_path)
+        st = os.stat(self._input_path)
+        checkpoint = ZsndCheckpoint(st.st_size, st.st_mtime_ns, self._min_duration, self._threshold,
+                input_frames, output_frames, num_trailing_zeros, num_dropouts,
+                *self._frame_range)
+        fields = asdict(checkpoint)
+        del fields['dropouts']
+        tmp_path = self.path + '.tmp'
+        with io.open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(fields, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._last_saved_at = time.monotonic()
+        self.get_logger().debug(f'checkpoint saved at input frame {input_frames}')
+
+    def remove(self):
+        for path in (self.path, self.runs_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,269 @@
+from wave_format import RiffScanner, RiffChunkIndex
+from util import ZsndLogMixin, ZsndError
+
+import io
+import json
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Iterable
+
+@dataclass(frozen=True)
+class ZsndMove:
+    '''
+    A byte range moved toward the start of the file. (dst <= src)
+    '''
+    src: int
+    dst: int
+    length: int
+
+class ZsndCompactionJournal(ZsndLogMixin):
+    '''
+    Write-ahead journal which makes in-place compaction crash-safe.
+
+    Layout::
+
+        header  MAGIC, u32 length of the JSON plan, JSON plan
+        slot 0  seq, move index, offset in the move, length, crc32, data
+        slot 1  (same as slot 0)
+
+    Every block is stored into a slot and synced before the file itself is touched,
+    so a block interrupted halfway can be replayed from the journal.
+    The slots are used alternately; the valid slot with the larger seq wins.
+    '''
+    MAGIC = b'ZSNDJRN1'
+    SUFFIX = '.zsnd-journal'
+    _SLOT_HEADER = struct.Struct('<QQQQI')
+
+    def __init__(self, f: io.BufferedRandom, plan: dict, block_size: int):
+        self._f = f
+        self.plan = plan
+        self.block_size = block_size
+        self._slot_base = f.tell()
+
+    @classmethod
+    def path_for(cls, path: str) -> str:
+        return path + cls.SUFFIX
+
+    @classmethod
+    def create(cls, path: str, plan: dict, block_size: int) -> 'ZsndCompactionJournal':
+        plan = dict(plan, block_size=block_size)
+        f = io.open(cls.path_for(path), 'w+b')
+        try:
+            plan_as_bytes = json.dumps(plan).encode('utf-8')
+            f.write(cls.MAGIC + struct.pack('<I', len(plan_as_bytes)) + plan_as_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+            return cls(f, plan, block_size)
+        except BaseException:
+            f.close()
+            raise
+
+    @classmethod
+    def open(cls, path: str) -> 'ZsndCompactionJournal':
+        f = io.open(cls.path_for(path), 'r+b')
+        try:
+            if cls.MAGIC != f.read(len(cls.MAGIC)):
+                raise ZsndError(f'Broken journal: {cls.path_for(path)}')
+            plan_len, = struct.unpack('<I', f.read(4))
+            plan = json.loads(f.read(plan_len).decode('utf-8'))
+            return cls(f, plan, plan['block_size'])
+        except BaseException:
+            f.close()
+            raise
+
+    def close(self):
+        self._f.close()
+
+    def remove(self):
+        name = self._f.name
+        self._f.close()
+        os.remove(name)
+
+    def record(self, seq: int, move_index: int, move_offset: int, data: bytes):
+        assert len(data) <= self.block_size
+        slot_header = self._SLOT_HEADER.pack(seq, move_index, move_offset, len(data),
+                self._checksum(seq, move_index, move_offset, data))
+        self._f.seek(self._slot_position(seq % 2))
+        self._f.write(slot_header)
+        self._f.write(data)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def last_record(self) -> tuple[int, int, int, bytes]|None:
+        '''
+        :return: (seq, move index, offset in the move, data) of the latest complete block
+        '''
+        latest = None
+        for slot in (0, 1):
+            self._f.seek(self._slot_position(slot))
+            slot_header = self._f.read(self._SLOT_HEADER.size)
+            if len(slot_header) < self._SLOT_HEADER.size:
+                continue
+            seq, move_index, move_offset, length, crc = self._SLOT_HEADER.unpack(slot_header)
+            if length > self.block_size:
+                continue
+            data = self._f.read(length)
+            if len(data) != length or crc != self._checksum(seq, move_index, move_offset, data):
+                self.get_logger().debug(f'journal slot {slot} is incomplete')
+                continue
+            if latest is None or latest[0] < seq:
+                latest = (seq, move_index, move_offset, data)
+        return latest
+
+    def _slot_position(self, slot: int) -> int:
+        return self._slot_base + slot * (self._SLOT_HEADER.size + self.block_size)
+
+    def _checksum(self, seq: int, move_index: int, move_offset: int, data: bytes) -> int:
+        crc = zlib.crc32(struct.pack('<QQQ', seq, move_index, move_offset))
+        return zlib.crc32(data, crc)
+
+class ZsndInPlaceCompactor(ZsndLogMixin):
+    '''
+    Removes zero runs from a WAV file by moving the kept audio toward the start of the data chunk,
+    without creating another copy of the file.
+    '''
+    _BLOCK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, block_size: int = _BLOCK_SIZE):
+        self._block_size = block_size
+
+    def plan(self, f: io.BufferedIOBase, dropouts: Iterable[tuple[int, int]],
+            num_frames: int, bytes_per_sample: int, index: RiffChunkIndex|None = None) -> dict:
+        '''
+        :param dropouts: (start, length) in frames, sorted by start
+        :param index: chunk index of `f`, if already scanned
+        '''
+        if index is None:
+            index = RiffScanner().scan(f)
+        data_chunk = index.get(b'data')
+        data_offset = data_chunk.offset
+        file_size = f.seek(0, io.SEEK_END)
+
+        moves: list[ZsndMove] = []
+        dst = data_offset
+        kept_start = 0
+        for start, length in dropouts:
+            dst = self._append_move(moves, data_offset + kept_start * bytes_per_sample, dst,
+                    (start - kept_start) * bytes_per_sample)
+            kept_start = start + length
+        dst = self._append_move(moves, data_offset + kept_start * bytes_per_sample, dst,
+                (num_frames - kept_start) * bytes_per_sample)
+        new_data_size = dst - data_offset
+        pad = new_data_size & 1
+
+        # a partial sample at the end of the data chunk is dropped, like the frames of
+        # ZsndWavReader, and the chunks following the data chunk (e.g. LIST) are kept
+        trailer_offset = data_chunk.get_padded_end()
+        trailer_dst = dst + pad
+        dst = self._append_move(moves, trailer_offset, trailer_dst,
+                max(0, file_size - trailer_offset))
+
+        # "fact" holds the number of samples, which stripping changes
+        fact_chunk = index.find(b'fact')
+        fact_offset = None
+        if fact_chunk is not None and 4 <= fact_chunk.size:
+            fact_offset = fact_chunk.offset
+            if trailer_offset <= fact_offset:
+                fact_offset += trailer_dst - trailer_offset
+
+        return {
+            'data_offset': data_offset,
+            'new_data_size': new_data_size,
+            'final_size': dst,
+            'pad': pad,
+            'fact_offset': fact_offset,
+            'new_num_samples': new_data_size // bytes_per_sample,
+            'moves': [[m.src, m.dst, m.length] for m in moves],
+        }
+
+    def compact(self, path: str, plan: dict) -> Iterable[tuple[int, int]]:
+        '''
+        :rtype: Iterable[tuple[int, int]] yield (moved bytes, total bytes to move)
+        '''
+        journal = ZsndCompactionJournal.create(path, plan, self._block_size)
+        yield from self._run(path, journal, 0, 0, 0)
+
+    def resume(self, path: str) -> Iterable[tuple[int, int]]:
+        '''
+        Completes the compaction interrupted by a crash.
+        '''
+        logger = self.get_logger()
+        journal = ZsndCompactionJournal.open(path)
+        record = journal.last_record()
+        if record is None:
+            yield from self._run(path, journal, 0, 0, 0)
+            return
+        seq, move_index, move_offset, data = record
+        logger.debug(f'replaying block {seq}: move {move_index} + {move_offset} bytes')
+        with io.open(path, 'r+b') as f:
+            move = self._moves(journal.plan)[move_index]
+            f.seek(move.dst + move_offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        yield from self._run(path, journal, seq + 1, move_index, move_offset + len(data))
+
+    def _run(self, path: str, journal: ZsndCompactionJournal,
+            seq: int, move_index: int, move_offset: int) -> Iterable[tuple[int, int]]:
+        logger = self.get_logger()
+        try:
+            plan = journal.plan
+            moves = self._moves(plan)
+            total = sum(m.length for m in moves)
+            done = sum(m.length for m in moves[:move_index]) + move_offset
+            with io.open(path, 'r+b') as f:
+                for i in range(move_index, len(moves)):
+                    move = moves[i]
+                    offset = move_offset if i == move_index else 0
+                    while offset < move.length:
+                        f.seek(move.src + offset)
+                        data = f.read(min(journal.block_size, move.length - offset))
+                        if 0 >= len(data):
+                            raise ZsndError(f'Unexpected EOF at {move.src + offset}')
+                        logger.trace(f'moving {len(data)} bytes: {move.src + offset} -> {move.dst + offset}')
+                        journal.record(seq, i, offset, data)
+                        f.seek(move.dst + offset)
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                        seq += 1
+                        offset += len(data)
+                        done += len(data)
+                        yield done, total
+                self._finalize(f, plan)
+            journal.remove()
+        finally:
+            journal.close()
+
+    def _finalize(self, f: io.BufferedRandom, plan: dict):
+        data_offset = plan['data_offset']
+        new_data_size = plan['new_data_size']
+        if plan['pad']:
+            f.seek(data_offset + new_data_size)
+            f.write(b'\0')
+        f.seek(data_offset - 4)
+        f.write(struct.pack('<I', new_data_size))
+        if plan.get('fact_offset') is not None:
+            f.seek(plan['fact_offset'])
+            f.write(struct.pack('<I', plan['new_num_samples']))
+        f.seek(4)
+        f.write(struct.pack('<I', plan['final_size'] - 8))
+        f.truncate(plan['final_size'])
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _append_move(self, moves: list[ZsndMove], src: int, dst: int, length: int) -> int:
+        '''
+        :return: the destination of the next move
+        '''
+        assert dst <= src
+        if 0 >= length:
+            return dst
+        if src != dst:
+            moves.append(ZsndMove(src, dst, length))
+        return dst + length
+
+    def _moves(self, plan: dict) -> list[ZsndMove]:
+        return [ZsndMove(*m) for m in plan['moves']]
@@ -1,45 +1,557 @@
-from service import StripZsndService
+from service import StripZsndService, StripZsndState, DropoutListener, DropoutCollector, \
+    DropoutCounter, ZsndPosition
+from checkpoint import ZsndCheckpointer, ZsndCheckpoint
+from metrics import ZsndMetricsExporter, ZsndFileMetrics
+from compaction import ZsndInPlaceCompactor, ZsndCompactionJournal
+from memory import ZsndMemoryBudget
+from io_policy import ZsndIoPolicy
+from pipeline import ZsndPrefetchingReader, ZsndWriteBehindWriter
+from reporting import ZsndDropoutReporter, ZsndDropoutReportWriter
+from sweep import ZsndParameterSweep, ZsndSweepResult
+from synth import ZsndSynthesizer, ZsndSynthSpec
+from envelope import ZsndEnvelopeCache, ZsndEnvelopeRecordingReader, ZsndPeakEnvelopeBuilder
+from timeline import ZsndTimelineMap
 from wav_io import ZsndWavReader, ZsndWavWriter
-from util import ZsndLogMixin
+from wav_logic import ZsndBackendProfile, BACKEND_AUTO
+from util import ZsndLogMixin, ZsndError
 import r_framework as r
 
+import rich.console
 import rich.live
 import rich.panel
 import rich.progress
+import rich.table
 import typer
 from i18n import t as _
+import contextlib
 import io
+import json
 import os
+import shutil
+import signal
+import threading
+from typing import Iterable
 from typing_extensions import override
 
 class StripZsndController(ZsndLogMixin):
-    def _do_strip(self, reader: ZsndWavReader, writer, min_duration, threshold, detect_only) -> int:
+    ON_CLEAN_CLONE = 'clone'
+    ON_CLEAN_LINK = 'link'
+    ON_CLEAN_SKIP = 'skip'
+    ON_CLEAN_ENCODE = 'encode'
+    ON_CLEAN_CHOICES = (ON_CLEAN_CLONE, ON_CLEAN_LINK, ON_CLEAN_SKIP, ON_CLEAN_ENCODE)
+
+    STATUS_CLEAN = 'clean'
+    STATUS_DIRTY = 'dirty'
+
+    STATUS_FAILED = 'failed'
+
+    # exit codes of check()
+    EXIT_CLEAN = 0
+    EXIT_FAILED = 1
+    EXIT_DROPOUTS = 3
+
+    # chunks in each queue of the pipelined mode
+    _PIPELINE_DEPTH = 4
+
+    def __init__(self, metrics_exporter: ZsndMetricsExporter|None = None,
+            show_progress: bool = True, memory_budget: ZsndMemoryBudget|None = None,
+            pipelined: bool = False, strided: bool = False,
+            max_log_lines_per_second: int|None = None, num_log_ends: int|None = None,
+            envelope_cache: ZsndEnvelopeCache|None = None, io_policy: str = ZsndIoPolicy.DEFAULT,
+            backend: str = BACKEND_AUTO, backend_profile: ZsndBackendProfile|None = None):
+        '''
+        :param pipelined: reads ahead and writes behind on threads
+        :param strided: see StripZsndService
+        :param max_log_lines_per_second: see ZsndDropoutReporter
+        :param num_log_ends: see ZsndDropoutReporter
+        :param envelope_cache: detects with the envelopes in it, and stores the missing ones
+        :param io_policy: one of ZsndIoPolicy.CHOICES
+        :param backend: a name in DETECTION_BACKENDS, or BACKEND_AUTO
+        :param backend_profile: the choices of BACKEND_AUTO on this machine
+        '''
+        # summary of the last strip(): STATUS_CLEAN, STATUS_DIRTY or None on failure
+        self.status: str|None = None
+        self._metrics_exporter = metrics_exporter
+        self._progress_enabled = show_progress
+        self._memory_budget = memory_budget
+        self._pipelined = pipelined
+        self._strided = strided
+        self._max_log_lines_per_second = max_log_lines_per_second
+        self._num_log_ends = num_log_ends
+        self._envelope_cache = envelope_cache
+        self._backend = backend
+        self._backend_profile = backend_profile
+        buffer_size = ZsndIoPolicy._BUFFER_SIZE
+        if memory_budget is not None:
+            # the buffers of the input, the output and O_DIRECT
+            buffer_size = memory_budget.get_buffer_size(buffer_size, 3)
+        self._io_policy = ZsndIoPolicy(io_policy, buffer_size)
+        self._reporter: ZsndDropoutReporter|None = None
+        self._file_metrics: ZsndFileMetrics|None = None
+        self._report_path: str|None = None
+        self._report: ZsndDropoutReportWriter|None = None
+        self._timeline = False
+        # the frames of the input to process in the last strip()
+        self._frame_range: tuple[int, int|None] = (0, None)
+        self._copy_outside = False
+
+    def _do_strip(self, reader: ZsndWavReader, writer, min_duration, threshold, detect_only,
+            listeners=()) -> int:
+        service = self._create_service(reader)
+        counter = DropoutCounter()
+        self._show_progress(
+                service.strip(reader, writer, min_duration, threshold, detect_only,
+                        (counter, *listeners, *self._get_listeners()),
+                        StripZsndState(self._frame_range[0]), self._frame_range[1]),
+                reader.count_frames(), reader, writer)
+        self._reporter.summarize()
+        self.status = self.STATUS_DIRTY if counter.count else self.STATUS_CLEAN
+        # Service classes should not depend on CLI-specific exit code semantics (0 = success, etc.).
+        return 0
+
+    def _do_checkpointed_strip(self, reader: ZsndWavReader, output_path: str,
+            out_file: io.BufferedIOBase, writer: ZsndWavWriter, min_duration: int, threshold: float,
+            checkpointer: ZsndCheckpointer, checkpoint: ZsndCheckpoint|None) -> int:
+        start, end = self._frame_range
+        state = StripZsndState(start)
+        collector = DropoutCollector()
+        if checkpoint is not None:
+            # the trailing zeros are read again, to be written if the zero run ends short
+            state = StripZsndState(checkpoint.input_frames - checkpoint.num_trailing_zeros)
+            collector.dropouts = checkpoint.dropouts
+        elif self._copy_outside:
+            self._copy_frames(reader, writer, 0, start)
+        service = self._create_service(reader)
+        progression = service.strip(reader, writer, min_duration, threshold, False,
+                (collector, *self._get_listeners()), state, end)
+
+        def checkpointed():
+            for progress in progression:
+                checkpointer.update(state, out_file, writer, collector)
+                yield progress
+
+        with self._sigterm_as_interrupt():
+            try:
+                self._show_progress(checkpointed(), reader.count_frames(), reader, writer)
+            except KeyboardInterrupt:
+                checkpointer.save(out_file, collector)
+                raise
+        if self._copy_outside and end is not None:
+            self._copy_frames(reader, writer, end, reader.count_frames())
+        self._save_timeline(output_path, collector.dropouts, reader)
+        checkpointer.remove()
+        self._reporter.summarize()
+        self.status = self.STATUS_DIRTY if collector.dropouts else self.STATUS_CLEAN
+        return 0
+
+    def _do_envelope_detect(self, input_path: str, reader: ZsndWavReader, min_duration: int,
+            threshold: float) -> int:
+        '''
+        Detects with the cached envelope of the input, or builds it while detecting as usual.
+        '''
+        service = self._create_service(reader)
+        counter = DropoutCounter()
+        listeners = (counter, *self._get_listeners())
+        envelope = self._envelope_cache.load(input_path)
+        if envelope is not None:
+            self._show_progress(
+                    service.detect_with_envelope(reader, envelope, min_duration, threshold,
+                            listeners),
+                    reader.count_frames(), reader)
+        else:
+            builder = ZsndPeakEnvelopeBuilder(reader.get_wave_format())
+            self._show_progress(
+                    service.strip(ZsndEnvelopeRecordingReader(reader, builder), None,
+                            min_duration, threshold, True, listeners),
+                    reader.count_frames(), reader)
+            if builder.num_frames == reader.count_frames():
+                self._envelope_cache.save(input_path, builder.finish())
+        self._reporter.summarize()
+        self.status = self.STATUS_DIRTY if counter.count else self.STATUS_CLEAN
+        return 0
+
+    @contextlib.contextmanager
+    def _sigterm_as_interrupt(self):
+        '''
+        Treats SIGTERM (e.g. preemption) like Ctrl-C, so that the last checkpoint is saved.
+        '''
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+        def handler(signum, frame):
+            raise KeyboardInterrupt()
+        previous_handler = signal.signal(signal.SIGTERM, handler)
+        try:
+            yield
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    def _probe_clean(self, reader: ZsndWavReader, min_duration: int, threshold: float) -> bool:
+        '''
+        Scans the input until the first dropout.
+
+        :return: True if the input has no dropouts
+        '''
+        collector = DropoutCollector(limit=1)
+        service = self._create_service(reader, quiet=True)
+        self._show_progress(
+                service.strip(reader, None, min_duration, threshold, True, (collector,),
+                        StripZsndState(self._frame_range[0]), self._frame_range[1]),
+                reader.count_frames(), reader)
+        reader.rewind()
+        return not collector.dropouts
+
+    def _copy_frames(self, reader: ZsndWavReader, writer: ZsndWavWriter, start: int, end: int):
+        '''
+        Copies the frames as they are, e.g. the ones out of the range to strip.
+        '''
+        chunk_size = self._get_chunk_size(reader)
+        reader.setpos(start)
+        pos = start
+        while pos < end:
+            chunk = reader.read(chunk_size)
+            if 0 >= len(chunk):  # EOF
+                break
+            num_frames = min(len(chunk), end - pos)
+            writer.write(chunk[0:num_frames])
+            pos += num_frames
+
+    def _resolve_frame_range(self, reader: ZsndWavReader, start: ZsndPosition|None,
+            end: ZsndPosition|None) -> tuple[int, int|None]:
+        '''
+        :raises ZsndError: when the range is empty or starts after the end of the input
+        '''
+        sample_rate = reader.get_sample_rate()
+        start_frame = 0 if start is None else start.to_frames(sample_rate)
+        end_frame = None if end is None else end.to_frames(sample_rate)
+        if start_frame > reader.count_frames() \
+                or end_frame is not None and end_frame <= start_frame:
+            raise ZsndError(_('zsnd.invalid_range') % {'start': start_frame,
+                    'end': reader.count_frames() if end_frame is None else end_frame})
+        if end_frame is not None and end_frame >= reader.count_frames():
+            end_frame = None
+        return start_frame, end_frame
+
+    def _create_service(self, reader: ZsndWavReader, quiet: bool = False) -> StripZsndService:
+        '''
+        :raises ZsndError: when the memory budget is too small for the format
+        '''
+        return StripZsndService(quiet, self._get_chunk_size(reader), self._strided,
+                self._reporter, self._backend, self._backend_profile)
+
+    def _get_chunk_size(self, reader: ZsndWavReader) -> int:
+        '''
+        :raises ZsndError: when the memory budget is too small for the format
+        '''
+        if self._memory_budget is None:
+            return StripZsndService._CHUNK_SIZE
+        copies = ZsndMemoryBudget.COPIES_PER_CHUNK
+        if self._pipelined:
+            copies += 2 * self._PIPELINE_DEPTH
+        return self._memory_budget.get_chunk_frames(
+                reader.get_wave_format().get_bytes_per_sample(), StripZsndService._CHUNK_SIZE,
+                copies)
+
+    def _show_progress(self, progression: Iterable[tuple[int, int]], total: int,
+            reader: ZsndWavReader|None = None, writer: ZsndWavWriter|None = None):
+        if not self._progress_enabled:
+            for _pos, _total in progression:
+                self._update_metrics(reader, writer)
+            return
         progress = rich.progress.Progress()
-        task = progress.add_task(
-                _('app.processing'), total=reader.count_frames())
+        task = progress.add_task(_('app.processing'), total=total)
         # use a rich Panel to suppress flicker
         with rich.live.Live(rich.panel.Panel(progress)):
-            service = StripZsndService()
-            for pos, total in \
-                    service.strip(reader, writer, min_duration, threshold, detect_only):
+            for pos, total in progression:
                 progress.update(task, completed=pos, total=total)
-        # Service classes should not depend on CLI-specific exit code semantics (0 = success, etc.).
-        return 0
+                self._update_metrics(reader, writer)
+
+    def _get_listeners(self) -> tuple[DropoutListener, ...]:
+        '''
+        :return: the metrics and the report of the current input, if enabled
+        '''
+        return tuple(listener for listener in (self._file_metrics, self._report)
+                if listener is not None)
+
+    def _open_report(self, reader: ZsndWavReader):
+        if self._report_path is not None:
+            self._report = ZsndDropoutReportWriter.open(self._report_path,
+                    reader.get_wave_format(), reader.get_sample_rate())
+
+    def _save_timeline(self, output_path: str, dropouts: Iterable[tuple[int, int]],
+            reader: ZsndWavReader):
+        '''
+        Saves the map of the output to the input next to the output, if enabled.
+        '''
+        if not self._timeline:
+            return
+        num_frames = reader.count_frames()
+        start, end = (0, num_frames) if self._copy_outside else self._frame_range
+        timeline = ZsndTimelineMap.from_runs(dropouts, reader.get_sample_rate(), start,
+                num_frames if end is None else end)
+        with io.open(output_path + ZsndTimelineMap.SUFFIX, 'wb') as f:
+            timeline.save(f)
+
+    def _update_metrics(self, reader: ZsndWavReader|None, writer: ZsndWavWriter|None):
+        if self._file_metrics is None or reader is None:
+            return
+        bytes_per_sample = reader.get_wave_format().get_bytes_per_sample()
+        self._file_metrics.update(reader.get_num_bytes_read() // bytes_per_sample,
+                0 if writer is None else writer.tell())
+        self._metrics_exporter.update()
 
     def strip(self, input_path: str, output_path: str|None, force_overwrite: bool, 
-            min_duration: int, threshold: float, detect_only: bool) -> int:
+            min_duration: int, threshold: float, detect_only: bool, in_place: bool = False,
+            on_clean: str = ON_CLEAN_CLONE, resume: bool = False, start: ZsndPosition|None = None,
+            end: ZsndPosition|None = None, copy_outside: bool = False,
+            report_path: str|None = None, timeline: bool = False) -> int:
+        '''
+        :param start: the position to start from
+        :param end: the position to stop at. Dropouts are reported at their positions in the input.
+        :param copy_outside: copies the frames out of the range to the output as they are.
+                Otherwise, the output has only the range.
+        :param report_path: writes the dropouts to it, see ZsndDropoutReportWriter.
+                After resuming, it has only the ones found since.
+        :param timeline: saves the map of the output to the input next to the output,
+                see ZsndTimelineMap
+        '''
+        self.status = None
+        self._file_metrics = None
+        self._report_path = report_path
+        self._timeline = timeline and not detect_only
+        self._frame_range = (0, None)
+        self._copy_outside = copy_outside
+        self._reporter = ZsndDropoutReporter(self._max_log_lines_per_second, self._num_log_ends)
+        result = 1
+        try:
+            result = self._strip(input_path, output_path, force_overwrite, min_duration, threshold,
+                    detect_only, in_place, on_clean, resume, start, end)
+            return result
+        finally:
+            if self._report is not None:
+                self._report.close()
+                self._report = None
+            self._report_path = None
+            if self._file_metrics is not None:
+                self._file_metrics.finish(self.status if 0 == result and self.status
+                        else self.STATUS_FAILED)
+                self._metrics_exporter.export()
+                self._file_metrics = None
+
+    def check(self, input_path: str, min_duration: int, threshold: float, max_dropouts: int = 1,
+            start: ZsndPosition|None = None, end: ZsndPosition|None = None) -> int:
+        '''
+        Scans the input until `max_dropouts` dropouts are found, without any output or progress,
+        and prints the result as a line of JSON.
+
+        :return: EXIT_CLEAN, EXIT_DROPOUTS or EXIT_FAILED
+        '''
+        self.status = None
+        self._file_metrics = None
+        collector = DropoutCollector(limit=max_dropouts)
+        in_file, reader = self._create_reader(input_path)
+        if reader is not None:
+            try:
+                self._frame_range = self._resolve_frame_range(reader, start, end)
+                self._scan_for_check(input_path, reader, min_duration, threshold, collector)
+                self.status = self.STATUS_DIRTY if collector.dropouts else self.STATUS_CLEAN
+            except Exception as exc:
+                logger = self.get_logger()
+                logger.error(str(exc))
+                logger.debug('', exc_info=True)
+            finally:
+                reader.close()
+                in_file.close()
+        if self._file_metrics is not None:
+            self._file_metrics.finish(self.status or self.STATUS_FAILED)
+            self._metrics_exporter.export()
+            self._file_metrics = None
+        sample_rate = None if reader is None else reader.get_sample_rate()
+        print(json.dumps({'path': input_path, 'status': self.status or self.STATUS_FAILED,
+                'dropouts': len(collector.dropouts), 'capped': collector.is_satisfied(),
+                'first_dropout_seconds': collector.dropouts[0][0] / sample_rate
+                        if collector.dropouts else None}), flush=True)
+        if self.status is None:
+            return self.EXIT_FAILED
+        return self.EXIT_DROPOUTS if collector.dropouts else self.EXIT_CLEAN
+
+    def _scan_for_check(self, input_path: str, reader: ZsndWavReader, min_duration: int,
+            threshold: float, collector: DropoutCollector):
+        service = self._create_service(reader, quiet=True)
+        envelope = None
+        if self._envelope_cache is not None and (0, None) == self._frame_range:
+            envelope = self._envelope_cache.load(input_path)
+        if envelope is not None:
+            progression = service.detect_with_envelope(reader, envelope, min_duration, threshold,
+                    (collector, *self._get_listeners()))
+        else:
+            progression = service.strip(reader, None, min_duration, threshold, True,
+                    (collector, *self._get_listeners()),
+                    StripZsndState(self._frame_range[0]), self._frame_range[1])
+        for _progress in progression:
+            self._update_metrics(reader, None)
+
+    def sweep(self, input_path: str, thresholds: Iterable[float], durations: Iterable[int]) -> int:
+        '''
+        Prints the dropouts found with each combination of the thresholds and the durations.
+        '''
+        in_file, reader = self._create_reader(input_path)
+        if reader is None:
+            return 1
+        try:
+            sweep = ZsndParameterSweep(thresholds, durations, self._get_chunk_size(reader),
+                    self._backend, self._backend_profile)
+            self._show_progress(sweep.sweep(reader), reader.count_frames(), reader)
+            self._print_sweep_result(input_path, sweep.result)
+            return 0
+        except Exception as exc:
+            logger = self.get_logger()
+            logger.error(str(exc))
+            logger.debug('', exc_info=True)
+            return 1
+        finally:
+            reader.close()
+            in_file.close()
+
+    def lookup_timeline(self, map_path: str, positions: Iterable[ZsndPosition],
+            from_input: bool = False) -> int:
+        '''
+        Prints the input position of each output position, or the output position of each input
+        position, as a line of JSON. Out of the map, the position looked up is null.
+
+        :param map_path: saved by strip() with `timeline`
+        '''
+        try:
+            timeline = ZsndTimelineMap.load(map_path)
+        except (OSError, ValueError) as exc:
+            self.get_logger().error(str(exc))
+            return 1
+        try:
+            sample_rate = timeline.sample_rate
+            for position in positions:
+                frame = position.to_frames(sample_rate)
+                if from_input:
+                    input_frame, output_frame = frame, timeline.to_output(frame)
+                else:
+                    input_frame, output_frame = timeline.to_input(frame), frame
+                print(json.dumps({
+                        'output_frame': output_frame,
+                        'output_seconds': None if output_frame is None
+                                else output_frame / sample_rate,
+                        'input_frame': input_frame,
+                        'input_seconds': None if input_frame is None
+                                else input_frame / sample_rate}), flush=True)
+        finally:
+            timeline.close()
+        return 0
+
+    def synth(self, output_path: str, spec: ZsndSynthSpec, truth_path: str,
+            force_overwrite: bool) -> int:
+        '''
+        Generates a recording of `spec`, and the ground truth of it as JSON.
+        '''
+        logger = self.get_logger()
+        block_size = ZsndSynthesizer._BLOCK_SIZE
+        if self._memory_budget is not None:
+            # the samples are generated as 64-bit values, in a few arrays at once
+            block_size = max(1, self._memory_budget.get_buffer_size(block_size * 8,
+                    ZsndSynthesizer.NUM_BLOCK_ARRAYS) // 8)
+        synthesizer = ZsndSynthesizer(spec, block_size)
+        bytes_per_sample = spec.format.bytes_per_sample
+        if ZsndWavWriter._HEADER.size - 8 + spec.num_frames * bytes_per_sample > 0xFFFFFFFF:
+            logger.error(_('zsnd.synth_too_long'))
+            return 1
+        try:
+            synthesizer.plan()
+            self._confirm_overwrite(output_path, force_overwrite)
+            self._confirm_overwrite(truth_path, force_overwrite)
+            with self._io_policy.open_output(output_path, 'wb') as out_file:
+                buffer_size = ZsndWavWriter._BUFFER_SIZE if self._memory_budget is None \
+                        else self._memory_budget.get_buffer_size(ZsndWavWriter._BUFFER_SIZE, 2)
+                writer = ZsndWavWriter(out_file, bytes_per_sample, spec.sample_rate,
+                        buffer_size=buffer_size, preallocate_frames=spec.num_frames,
+                        format_tag=spec.format.get_format_tag())
+                self._show_progress(synthesizer.synthesize(writer), spec.num_frames)
+                writer.close()
+            with io.open(truth_path, 'w', encoding='utf-8') as f:
+                synthesizer.save_truth(f)
+        except typer.Exit:
+            raise
+        except Exception as exc:
+            logger.error(str(exc))
+            logger.debug('', exc_info=True)
+            return 1
+        logger.info(_('zsnd.synth_done') % {'f': output_path, 'n': len(synthesizer.regions),
+                'truth': truth_path})
+        return 0
+
+    def _print_sweep_result(self, input_path: str, result: ZsndSweepResult):
+        table = rich.table.Table(title=input_path)
+        table.add_column(_('zsnd.sweep_header'))
+        for duration in result.durations:
+            table.add_column(f'{duration} ms', justify='right')
+        for threshold, counts, removed in zip(result.thresholds, result.counts, result.removed):
+            table.add_row(f'{threshold:g} dBFS', *(f'{count} ({length / result.sample_rate:.3f} s)'
+                    for count, length in zip(counts, removed)))
+        rich.console.Console().print(table)
+
+    def _strip(self, input_path: str, output_path: str|None, force_overwrite: bool,
+            min_duration: int, threshold: float, detect_only: bool, in_place: bool,
+            on_clean: str, resume: bool, start: ZsndPosition|None,
+            end: ZsndPosition|None) -> int:
+        if in_place and not detect_only:
+            if output_path is not None:
+                self.get_logger().error(_('zsnd.in_place_with_output'))
+                return 1
+            if start is not None or end is not None:
+                self.get_logger().error(_('zsnd.in_place_with_range'))
+                return 1
+            return self._strip_in_place(input_path, force_overwrite, min_duration, threshold)
+
         out_file: io.BufferedWriter|None = None
         writer = None
         in_file, reader = self._create_reader(input_path)
         if reader is None:
             return 1
+        metadata_chunks = reader.get_metadata_chunks()
         try:
+            self._open_report(reader)
+            self._frame_range = self._resolve_frame_range(reader, start, end)
+            is_whole_output = (0, None) == self._frame_range or self._copy_outside
+            if detect_only and self._envelope_cache is not None and (0, None) == self._frame_range:
+                return self._do_envelope_detect(input_path, reader, min_duration, threshold)
+            if self._pipelined:
+                reader = ZsndPrefetchingReader(reader, self._get_chunk_size(reader),
+                        self._PIPELINE_DEPTH)
             if not detect_only:
                 output_base, ext = os.path.splitext(input_path)
                 output_path = output_path or f'{output_base}-fix{ext}'
-                out_file, writer = self._create_writer(output_path, reader, force_overwrite)
+                checkpointer = ZsndCheckpointer(input_path, output_path, min_duration, threshold,
+                        frame_range=self._frame_range)
+                checkpoint = checkpointer.load() if resume else None
+                if checkpoint is not None:
+                    self.get_logger().info(_('zsnd.resuming_checkpoint') %
+                            {'f': output_path, 'pos': checkpoint.input_frames})
+                    out_file, writer = self._create_resumed_writer(output_path, reader,
+                            checkpoint.output_frames)
+                else:
+                    if self.ON_CLEAN_ENCODE != on_clean and is_whole_output \
+                            and self._probe_clean(reader, min_duration, threshold):
+                        self.status = self.STATUS_CLEAN
+                        self.get_logger().info(_('zsnd.clean') % (input_path))
+                        self._output_clean(input_path, output_path, force_overwrite, on_clean)
+                        if self.ON_CLEAN_SKIP != on_clean:
+                            self._save_timeline(output_path, (), reader)
+                        return 0
+                    out_file, writer = self._create_writer(output_path, reader, force_overwrite)
                 if writer is None:
                     return 1
+                if self._pipelined:
+                    writer = ZsndWriteBehindWriter(writer,
+                            reader.get_wave_format().get_bytes_per_sample(), self._PIPELINE_DEPTH)
+                writer.copy_chunks(in_file, metadata_chunks)
+                return self._do_checkpointed_strip(reader, output_path, out_file, writer,
+                        min_duration, threshold, checkpointer, checkpoint)
 
             return self._do_strip(reader, writer, min_duration, threshold, detect_only)
 
@@ -51,20 +563,118 @@ class StripZsndController(ZsndLogMixin):
             logger.debug('', exc_info=True)
             return 1
         finally:
+            # stops reading ahead before the writer copies the metadata chunks from in_file
+            reader.close()
             writer and writer.close()
             out_file and out_file.close()
+            in_file.close()
+
+    def _strip_in_place(self, path: str, force_overwrite: bool,
+            min_duration: int, threshold: float) -> int:
+        logger = self.get_logger()
+        compactor = ZsndInPlaceCompactor()
+        if self._memory_budget is not None:
+            # a block is held as read and as written to the journal
+            compactor = ZsndInPlaceCompactor(self._memory_budget.get_buffer_size(
+                    ZsndInPlaceCompactor._BLOCK_SIZE, 2))
+        try:
+            if os.path.exists(ZsndCompactionJournal.path_for(path)):
+                logger.info(_('zsnd.resuming_in_place') % (path))
+                self._show_progress(compactor.resume(path), 0)
+                return 0
+        except Exception as exc:
+            logger.error(str(exc))
+            logger.debug('', exc_info=True)
+            return 1
+
+        in_file, reader = self._create_reader(path)
+        if reader is None:
+            return 1
+        try:
+            self._open_report(reader)
+            collector = DropoutCollector()
+            self._do_strip(reader, None, min_duration, threshold, True, (collector,))
+            if not collector.dropouts:
+                self.get_logger().info(_('zsnd.clean') % (path))
+                return 0
+            plan = compactor.plan(in_file, collector.dropouts, reader.count_frames(),
+                    reader.get_wave_format().get_bytes_per_sample(), reader.get_chunk_index())
+        except Exception as exc:
+            logger.error(str(exc))
+            logger.debug('', exc_info=True)
+            return 1
+        finally:
             reader.close()
             in_file.close()
 
+        if not force_overwrite and not typer.confirm(_('zsnd.confirm_in_place') % (path)):
+            raise typer.Exit(0)
+        try:
+            self._save_timeline(path, collector.dropouts, reader)
+            self._show_progress(compactor.compact(path, plan), 0)
+            return 0
+        except Exception as exc:
+            logger.error(str(exc))
+            logger.debug('', exc_info=True)
+            return 1
+
+    def _output_clean(self, input_path: str, output_path: str, force_overwrite: bool,
+            on_clean: str):
+        logger = self.get_logger()
+        if self.ON_CLEAN_SKIP == on_clean:
+            return
+        if os.path.exists(output_path):
+            if os.path.samefile(input_path, output_path):
+                return
+            self._confirm_overwrite(output_path, force_overwrite)
+            os.remove(output_path)
+        if self.ON_CLEAN_LINK == on_clean:
+            try:
+                os.link(input_path, output_path)
+                return
+            except OSError as exc:
+                logger.debug(f'Hard link failed ({exc}), falling back to copy')
+        self._clone_file(input_path, output_path)
+
+    def _clone_file(self, src: str, dst: str):
+        '''
+        Copies the file in kernel space. (may be a reflink on CoW file systems)
+        '''
+        if hasattr(os, 'copy_file_range'):
+            try:
+                with io.open(src, 'rb') as fsrc, io.open(dst, 'wb') as fdst:
+                    remaining = os.fstat(fsrc.fileno()).st_size
+                    while remaining > 0:
+                        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                        if 0 >= copied:
+                            break
+                        remaining -= copied
+                if 0 >= remaining:
+                    return
+            except OSError as exc:
+                self.get_logger().debug(f'copy_file_range failed ({exc}), falling back to copy')
+        shutil.copyfile(src, dst)
+
+    def _confirm_overwrite(self, path: str, force_overwrite: bool):
+        if os.path.exists(path) and not force_overwrite:
+            if r.DEBUG:
+                self.get_logger().debug(os.stat(path))
+            if not typer.confirm(_('app.confirm_overwrite_output_file') % (path)):
+                raise typer.Exit(0)
+
     def _create_reader(self, path: str) -> tuple[io.BufferedIOBase|None, ZsndWavReader|None]:
         logger = self.get_logger()
         if r.DEBUG:
             logger.debug(os.stat(path))
         try:
-            f = io.open(path, 'rb')
+            f = self._io_policy.open_input(path)
             try:
-                # Wave_read does not close the file if it is created by an opend file
-                return (f, ZsndWavReader(f))
+                reader = ZsndWavReader(f)
+                if self._metrics_exporter is not None:
+                    self._file_metrics = self._metrics_exporter.metrics.start_file(path,
+                            reader.get_sample_rate(), reader.get_wave_format().get_bytes_per_sample(),
+                            reader.count_frames())
+                return (f, reader)
             except BaseException as exc:
                 f.close()
                 raise
@@ -73,19 +683,41 @@ class StripZsndController(ZsndLogMixin):
             logger.debug('', exc_info=True)
             return (None, None)
 
+    def _create_resumed_writer(self, path: str, reader: ZsndWavReader, num_frames: int) \
+            -> tuple[io.BufferedIOBase|None, ZsndWavWriter|None]:
+        logger = self.get_logger()
+        try:
+            outf = self._io_policy.open_output(path, 'r+b')
+            try:
+                wave_format = reader.get_wave_format()
+                return (outf, ZsndWavWriter(outf, wave_format.get_bytes_per_sample(),
+                        reader.get_sample_rate(), num_frames, self._get_copy_block_size(),
+                        self._get_write_buffer_size(reader), reader.count_frames(),
+                        wave_format.get_plain_format_tag()))
+            except BaseException as exc:
+                outf.close()
+                raise
+        except Exception as exc:
+            logger.error(_('app.output_file_cannot_be_opened'),
+                    {'f': path, 'exc': str(exc)})
+            logger.debug('', exc_info=True)
+            return (None, None)
+
     def _create_writer(self, path: str, reader: ZsndWavReader, force_overwrite: bool) \
             -> tuple[io.BufferedIOBase|None, ZsndWavWriter|None]:
         logger = self.get_logger()
         try:
-            if os.path.exists(path) and not force_overwrite:
-                if r.DEBUG:
-                    logger.debug(os.stat(path))
-                if not typer.confirm(_('app.confirm_overwrite_output_file') % (path)):
-                    raise typer.Exit(0)
-            outf = io.open(path, 'wb')
+            self._confirm_overwrite(path, force_overwrite)
+            outf = self._io_policy.open_output(path, 'wb')
             try:
-                bytes_per_sample = reader.get_wave_format().get_bytes_per_sample()
-                return (outf, ZsndWavWriter(outf, bytes_per_sample, reader.get_sample_rate()))
+                wave_format = reader.get_wave_format()
+                # the output is no longer than the input
+                return (outf, ZsndWavWriter(outf, wave_format.get_bytes_per_sample(),
+                        reader.get_sample_rate(),
+                        copy_block_size=self._get_copy_block_size(),
+                        buffer_size=self._get_write_buffer_size(reader),
+                        preallocate_frames=reader.count_frames(),
+                        format_tag=wave_format.get_plain_format_tag()))
             except BaseException as exc:
                 outf.close()
                 raise
@@ -96,3 +728,17 @@ class StripZsndController(ZsndLogMixin):
                     {'f': path, 'exc': str(exc)})
             logger.debug('', exc_info=True)
             return (None, None)
+
+    def _get_copy_block_size(self) -> int:
+        if self._memory_budget is None:
+            return ZsndWavWriter._COPY_BLOCK_SIZE
+        return self._memory_budget.get_buffer_size(ZsndWavWriter._COPY_BLOCK_SIZE)
+
+    def _get_write_buffer_size(self, reader: ZsndWavReader) -> int:
+        '''
+        :raises ZsndError: when the memory budget is too small for the format
+        '''
+        if self._memory_budget is None:
+            return ZsndWavWriter._BUFFER_SIZE
+        # counted in the chunks held by a job
+        return self._get_chunk_size(reader) * reader.get_wave_format().get_bytes_per_sample()
@@ -0,0 +1,291 @@
+from wav_io import ZsndWavReader, ZsndWavChunk
+from wave_format import WaveFormat
+from util import ZsndLogMixin
+
+from array import array
+import hashlib
+import io
+import math
+import os
+import struct
+import sys
+from typing import Iterable
+
+class ZsndPeakEnvelope:
+    '''
+    Pyramid of the peak levels of the blocks of a file.
+
+    Level 0 holds the largest absolute amplitude of each block of BLOCK_SIZE samples,
+    so a block at or under a threshold is all zero sound.
+    Each higher level holds the smallest value of FANOUT blocks of the level below,
+    so a block over a threshold contains no block of level 0 which is all zero sound.
+    '''
+    BLOCK_SIZE = 64
+    FANOUT = 64
+    NUM_LEVELS = 3
+
+    _MAGIC = b'ZSNDENV1'
+    # magic, source size, source mtime_ns, frames, bytes per sample, is float, levels
+    _HEADER = struct.Struct('<8sQqQBBH')
+
+    def __init__(self, num_frames: int, bytes_per_sample: int, is_float: bool,
+            levels: list[array]):
+        self.num_frames = num_frames
+        self.bytes_per_sample = bytes_per_sample
+        self.is_float = is_float
+        self.levels = levels
+
+    def iterate_zero_blocks(self, max_level: int|float) -> Iterable[tuple[int, int]]:
+        '''
+        Yields the maximal spans of blocks of level 0 which are all zero sound,
+        as (start, end) in frames.
+        '''
+        span_start = span_end = None
+        for block in self._iterate_zero_blocks(len(self.levels) - 1, 0,
+                len(self.levels[-1]), max_level):
+            if block == span_end:
+                span_end += 1
+                continue
+            if span_start is not None:
+                yield self._to_frames(span_start, span_end)
+            span_start, span_end = block, block + 1
+        if span_start is not None:
+            yield self._to_frames(span_start, span_end)
+
+    def _iterate_zero_blocks(self, level: int, start: int, end: int, max_level: int|float):
+        values = self.levels[level]
+        for i in range(start, min(end, len(values))):
+            if values[i] > max_level:
+                continue
+            if 0 == level:
+                yield i
+            else:
+                yield from self._iterate_zero_blocks(level - 1, i * self.FANOUT,
+                        (i + 1) * self.FANOUT, max_level)
+
+    def get_peak_level(self, start: int, end: int) -> int|float:
+        '''
+        :param start: in frames, at the start of a block
+        :param end: in frames, at the end of a block or of the file
+        '''
+        level0 = self.levels[0]
+        return max(level0[start // self.BLOCK_SIZE : -(-end // self.BLOCK_SIZE)], default=0)
+
+    def _to_frames(self, start_block: int, end_block: int) -> tuple[int, int]:
+        return (start_block * self.BLOCK_SIZE,
+                min(end_block * self.BLOCK_SIZE, self.num_frames))
+
+    def save(self, f: io.BufferedIOBase, source_size: int, source_mtime_ns: int):
+        f.write(self._HEADER.pack(self._MAGIC, source_size, source_mtime_ns, self.num_frames,
+                self.bytes_per_sample, self.is_float, len(self.levels)))
+        for values in self.levels:
+            f.write(struct.pack('<Q', len(values)))
+            if 'big' == sys.byteorder:
+                values = array(values.typecode, values)
+                values.byteswap()
+            values.tofile(f)
+
+    @classmethod
+    def load(cls, f: io.BufferedIOBase, source_size: int, source_mtime_ns: int) \
+            -> 'ZsndPeakEnvelope|None':
+        '''
+        :return: None if it is not of the source file as it is now
+        '''
+        header = f.read(cls._HEADER.size)
+        if len(header) < cls._HEADER.size:
+            return None
+        magic, size, mtime_ns, num_frames, bytes_per_sample, is_float, num_levels \
+                = cls._HEADER.unpack(header)
+        if cls._MAGIC != magic or source_size != size or source_mtime_ns != mtime_ns:
+            return None
+        levels = []
+        for _level in range(num_levels):
+            (count,) = struct.unpack('<Q', f.read(8))
+            values = array(_get_typecode(bool(is_float)))
+            values.fromfile(f, count)
+            if 'big' == sys.byteorder:
+                values.byteswap()
+            levels.append(values)
+        return cls(num_frames, bytes_per_sample, bool(is_float), levels)
+
+def _get_typecode(is_float: bool) -> str:
+    return 'd' if is_float else 'I'
+
+def _decode_levels(bytes_per_sample: int, is_float: bool, data: bytes) -> array:
+    '''
+    Returns the absolute amplitudes, measured like ZeroSoundPredicate.get_max_level().
+    '''
+    match (is_float, bytes_per_sample):
+        case (False, 1):
+            return array('I', (abs(sample - 0x80) for sample in data))
+        case (False, 3):
+            # into the upper bytes of 32-bit integers
+            widened = bytearray(len(data) // 3 * 4)
+            widened[1::4] = data[0::3]
+            widened[2::4] = data[1::3]
+            widened[3::4] = data[2::3]
+            samples = _to_array('i', widened)
+            return array('I', (abs(sample) >> 8 for sample in samples))
+        case (False, _):
+            samples = _to_array({2: 'h', 4: 'i'}[bytes_per_sample], data)
+            return array('I', map(abs, samples))
+        case (True, _):
+            samples = _to_array({4: 'f', 8: 'd'}[bytes_per_sample], data)
+            return array('d', map(abs, samples))
+
+def _to_array(typecode: str, data: bytes) -> array:
+    samples = array(typecode, data)
+    if 'big' == sys.byteorder:
+        samples.byteswap()
+    return samples
+
+class ZsndPeakMeter:
+    '''
+    Measures the peak level of samples, in the units of ZeroSoundPredicate.get_max_level().
+    '''
+    def __init__(self, wave_format: WaveFormat):
+        self._bytes_per_sample = wave_format.get_bytes_per_sample()
+        self._is_float = wave_format.is_float()
+        self._full_scale = 1.0 if self._is_float else 1 << (8 * self._bytes_per_sample - 1)
+
+    def measure(self, frames_as_bytes: bytes) -> int|float:
+        if not frames_as_bytes:
+            return 0
+        levels = _decode_levels(self._bytes_per_sample, self._is_float, frames_as_bytes)
+        if self._is_float and sum(levels) != sum(levels):
+            # NaN
+            return float('inf')
+        return max(levels)
+
+    def to_dbfs(self, level: int|float) -> float|None:
+        '''
+        :return: None for digital silence
+        '''
+        if 0 >= level:
+            return None
+        return 20 * math.log10(level / self._full_scale)
+
+class ZsndPeakEnvelopeBuilder:
+    '''
+    Builds ZsndPeakEnvelope from the samples of a file, read in chunks of any size.
+    '''
+    def __init__(self, wave_format: WaveFormat):
+        self._bytes_per_sample = wave_format.get_bytes_per_sample()
+        self._is_float = wave_format.is_float()
+        self._level0 = array(_get_typecode(self._is_float))
+        self._pending = b''
+        self.num_frames = 0
+
+    def add(self, frames_as_bytes: bytes):
+        self.num_frames += len(frames_as_bytes) // self._bytes_per_sample
+        data = self._pending + frames_as_bytes
+        block_bytes = ZsndPeakEnvelope.BLOCK_SIZE * self._bytes_per_sample
+        num_full = len(data) - len(data) % block_bytes
+        self._add_blocks(data[:num_full])
+        self._pending = data[num_full:]
+
+    def finish(self) -> ZsndPeakEnvelope:
+        self._add_blocks(self._pending)
+        self._pending = b''
+        levels = [self._level0]
+        for _level in range(1, ZsndPeakEnvelope.NUM_LEVELS):
+            lower = levels[-1]
+            fanout = ZsndPeakEnvelope.FANOUT
+            levels.append(array(lower.typecode, (min(lower[i:i + fanout])
+                    for i in range(0, len(lower), fanout))))
+        return ZsndPeakEnvelope(self.num_frames, self._bytes_per_sample, self._is_float, levels)
+
+    def _add_blocks(self, data: bytes):
+        if not data:
+            return
+        levels = _decode_levels(self._bytes_per_sample, self._is_float, data)
+        block_size = ZsndPeakEnvelope.BLOCK_SIZE
+        for i in range(0, len(levels), block_size):
+            block = levels[i:i + block_size]
+            peak = max(block)
+            if self._is_float and sum(block) != sum(block):
+                # NaN, which is never zero sound
+                peak = float('inf')
+            self._level0.append(peak)
+
+class ZsndEnvelopeRecordingReader(ZsndLogMixin):
+    '''
+    Passes the chunks read through ZsndPeakEnvelopeBuilder.
+    '''
+    def __init__(self, reader: ZsndWavReader, builder: ZsndPeakEnvelopeBuilder):
+        self._reader = reader
+        self._builder = builder
+
+    def read(self, num_frames: int) -> ZsndWavChunk:
+        chunk = self._reader.read(num_frames)
+        self._builder.add(chunk[0:len(chunk)])
+        return chunk
+
+    def tell(self) -> int:
+        return self._reader.tell()
+
+    def rewind(self):
+        self.setpos(0)
+
+    def setpos(self, pos: int):
+        # the envelope must be built of the samples in order
+        assert pos == self._reader.tell()
+        self._reader.setpos(pos)
+
+    def count_frames(self) -> int:
+        return self._reader.count_frames()
+
+    def get_sample_rate(self) -> int:
+        return self._reader.get_sample_rate()
+
+    def get_wave_format(self) -> WaveFormat:
+        return self._reader.get_wave_format()
+
+    def get_num_bytes_read(self) -> int:
+        return self._reader.get_num_bytes_read()
+
+    def close(self):
+        self._reader.close()
+
+class ZsndEnvelopeCache(ZsndLogMixin):
+    '''
+    Stores the envelopes of the input files in a directory, invalidated by their size and mtime.
+    '''
+    _SUFFIX = '.zenv'
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    def load(self, input_path: str) -> ZsndPeakEnvelope|None:
+        path = self._get_path(input_path)
+        st = os.stat(input_path)
+        try:
+            with io.open(path, 'rb') as f:
+                envelope = ZsndPeakEnvelope.load(f, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, struct.error) as exc:
+            self.get_logger().warning(f'{path}: ignored broken envelope ({exc})')
+            return None
+        if envelope is None:
+            self.get_logger().debug(f'{path}: outdated envelope')
+        return envelope
+
+    def save(self, input_path: str, envelope: ZsndPeakEnvelope):
+        path = self._get_path(input_path)
+        st = os.stat(input_path)
+        os.makedirs(self._directory, exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with io.open(temp_path, 'wb') as f:
+                envelope.save(f, st.st_size, st.st_mtime_ns)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.get_logger().debug(f'{path}: saved envelope of {input_path}')
+
+    def _get_path(self, input_path: str) -> str:
+        digest = hashlib.sha1(os.path.realpath(input_path).encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, digest + self._SUFFIX)
@@ -0,0 +1,266 @@
+from util import ZsndLogMixin
+
+import ctypes
+import ctypes.util
+import io
+import mmap
+import os
+from typing_extensions import override
+
+_SYNC_FILE_RANGE_WAIT_BEFORE = 1
+_SYNC_FILE_RANGE_WRITE = 2
+_SYNC_FILE_RANGE_WAIT_AFTER = 4
+
+def _load_sync_file_range():
+    '''
+    :return: sync_file_range(2) of Linux, or None if unavailable
+    '''
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        function = libc.sync_file_range
+    except (OSError, AttributeError, TypeError):
+        return None
+    function.argtypes = (ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_uint)
+    function.restype = ctypes.c_int
+    return function
+
+class _ZsndCacheDropper(ZsndLogMixin):
+    '''
+    Tells the kernel which pages of a file are no longer needed.
+    '''
+    _sync_file_range = None
+    _sync_file_range_loaded = False
+
+    def __init__(self, fd: int):
+        self._fd = fd
+
+    def advise(self, offset: int, length: int, advice: int):
+        try:
+            os.posix_fadvise(self._fd, offset, length, advice)
+        except OSError as exc:
+            self.get_logger().debug(f'posix_fadvise failed ({exc})')
+
+    def drop(self, start: int, end: int):
+        if start < end:
+            self.advise(start, end - start, os.POSIX_FADV_DONTNEED)
+
+    def write_back(self, start: int, end: int, wait: bool):
+        '''
+        Starts writing the range back to the disk, or waits until it is written if `wait`.
+        '''
+        if start >= end:
+            return
+        sync_file_range = self._get_sync_file_range()
+        if sync_file_range is None:
+            if wait:
+                os.fdatasync(self._fd)
+            return
+        flags = _SYNC_FILE_RANGE_WRITE
+        if wait:
+            flags |= _SYNC_FILE_RANGE_WAIT_BEFORE | _SYNC_FILE_RANGE_WAIT_AFTER
+        if 0 != sync_file_range(self._fd, start, end - start, flags):
+            os.fdatasync(self._fd)
+
+    @classmethod
+    def _get_sync_file_range(cls):
+        if not cls._sync_file_range_loaded:
+            cls._sync_file_range = _load_sync_file_range()
+            cls._sync_file_range_loaded = True
+        return cls._sync_file_range
+
+class _ZsndStreamingReader(io.BufferedReader):
+    '''
+    Reads ahead of the position, and drops the pages behind it from the page cache.
+    '''
+    def __init__(self, raw: io.RawIOBase, buffer_size: int, window_size: int):
+        super().__init__(raw, buffer_size)
+        self._dropper = _ZsndCacheDropper(raw.fileno())
+        self._window_size = window_size
+        self._dropped_until = 0
+        self._dropper.advise(0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    @override
+    def read(self, size=-1):
+        data = super().read(size)
+        pos = self.tell()
+        if pos - self._dropped_until >= self._window_size:
+            self._dropper.drop(self._dropped_until, pos)
+            self._dropper.advise(pos, self._window_size, os.POSIX_FADV_WILLNEED)
+            self._dropped_until = pos
+        return data
+
+    @override
+    def seek(self, offset, whence=io.SEEK_SET):
+        pos = super().seek(offset, whence)
+        # e.g. rewound for stripping after probing
+        self._dropped_until = min(self._dropped_until, pos)
+        return pos
+
+    @override
+    def close(self):
+        if not self.closed:
+            self._dropper.drop(0, 1 << 62)
+        super().close()
+
+class _ZsndStreamingWriter(io.BufferedWriter):
+    '''
+    Writes the data back to the disk in windows, and drops them from the page cache.
+
+    The last window is left to write back while the next one is filled.
+    '''
+    def __init__(self, raw: io.RawIOBase, buffer_size: int, window_size: int):
+        super().__init__(raw, buffer_size)
+        self._dropper = _ZsndCacheDropper(raw.fileno())
+        self._window_size = window_size
+        self._written_back_from = 0
+        self._dropped_until = 0
+
+    @override
+    def write(self, b):
+        written = super().write(b)
+        pos = self.tell()
+        if pos - self._written_back_from >= self._window_size:
+            super().flush()
+            # waits for the window before, which has been written back since
+            self._dropper.write_back(self._dropped_until, self._written_back_from, True)
+            self._dropper.drop(self._dropped_until, self._written_back_from)
+            self._dropped_until = self._written_back_from
+            self._dropper.write_back(self._written_back_from, pos, False)
+            self._written_back_from = pos
+        return written
+
+    @override
+    def seek(self, offset, whence=io.SEEK_SET):
+        pos = super().seek(offset, whence)
+        # e.g. resumed or patching the header; the pages written are left to the kernel
+        self._written_back_from = max(min(self._written_back_from, pos), self._dropped_until)
+        return pos
+
+    @override
+    def close(self):
+        if not self.closed:
+            super().flush()
+            self._dropper.write_back(0, 1 << 62, True)
+            self._dropper.drop(0, 1 << 62)
+        super().close()
+
+class _ZsndDirectRawReader(io.RawIOBase):
+    '''
+    Reads a file opened with O_DIRECT into an aligned buffer, bypassing the page cache.
+    '''
+    # the logical block size of most devices divides it
+    ALIGNMENT = 4096
+
+    def __init__(self, path: str, block_size: int):
+        self._fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+        self._block_size = max(self.ALIGNMENT, block_size - block_size % self.ALIGNMENT)
+        try:
+            # anonymous maps are aligned to pages
+            self._block = mmap.mmap(-1, self._block_size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+        self._size = os.fstat(self._fd).st_size
+        self._pos = 0
+        # the offset of the data in self._block, and its length
+        self._block_offset = 0
+        self._block_length = 0
+
+    @override
+    def readable(self):
+        return True
+
+    @override
+    def seekable(self):
+        return True
+
+    @override
+    def fileno(self):
+        return self._fd
+
+    @override
+    def tell(self):
+        return self._pos
+
+    @override
+    def seek(self, offset, whence=io.SEEK_SET):
+        match whence:
+            case io.SEEK_SET:
+                self._pos = offset
+            case io.SEEK_CUR:
+                self._pos += offset
+            case io.SEEK_END:
+                self._pos = self._size + offset
+        return self._pos
+
+    @override
+    def readinto(self, b):
+        if self._pos >= self._size:
+            return 0
+        if not self._block_offset <= self._pos < self._block_offset + self._block_length:
+            self._block_offset = self._pos - self._pos % self.ALIGNMENT
+            self._block_length = os.preadv(self._fd, [self._block], self._block_offset)
+            if self._pos >= self._block_offset + self._block_length:
+                return 0
+        start = self._pos - self._block_offset
+        length = min(len(b), self._block_length - start)
+        b[:length] = self._block[start:start + length]
+        self._pos += length
+        return length
+
+    @override
+    def close(self):
+        if not self.closed:
+            self._block.close()
+            os.close(self._fd)
+        super().close()
+
+class ZsndIoPolicy(ZsndLogMixin):
+    '''
+    Opens the input and the output files for bulk runs.
+
+    "stream" reads ahead and drops the pages behind from the page cache, and writes
+    the output back in windows and drops them, so that a run does not evict the working set
+    of other processes. "direct" also reads the input with O_DIRECT, bypassing the cache.
+    Without the system calls, e.g. on Windows or macOS, the files are opened as usual.
+    '''
+    DEFAULT = 'default'
+    STREAM = 'stream'
+    DIRECT = 'direct'
+    CHOICES = (DEFAULT, STREAM, DIRECT)
+
+    _BUFFER_SIZE = 1024 * 1024
+    # bytes read ahead, or written back at once
+    _WINDOW_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, name: str = DEFAULT, buffer_size: int = _BUFFER_SIZE):
+        '''
+        :param buffer_size: bytes read at once through O_DIRECT, and buffered in user space
+        '''
+        self.name = name
+        self._buffer_size = buffer_size
+        if self.DEFAULT != name and not hasattr(os, 'posix_fadvise'):
+            self.get_logger().debug(f'I/O policy "{name}" is unavailable on this platform')
+            self.name = self.DEFAULT
+
+    def open_input(self, path: str) -> io.BufferedIOBase:
+        if self.DIRECT == self.name and hasattr(os, 'O_DIRECT'):
+            try:
+                raw = _ZsndDirectRawReader(path, self._buffer_size)
+            except OSError as exc:
+                # e.g. tmpfs
+                self.get_logger().debug(f'{path}: O_DIRECT is unsupported ({exc})')
+            else:
+                return io.BufferedReader(raw, self._buffer_size)
+        if self.DEFAULT == self.name:
+            return io.open(path, 'rb')
+        return _ZsndStreamingReader(io.FileIO(path, 'rb'), self._buffer_size, self._WINDOW_SIZE)
+
+    def open_output(self, path: str, mode: str) -> io.BufferedIOBase:
+        '''
+        :param mode: "wb" or "r+b"
+        '''
+        if self.DEFAULT == self.name:
+            return io.open(path, mode)
+        return _ZsndStreamingWriter(io.FileIO(path, mode.replace('b', '')), self._buffer_size,
+                self._WINDOW_SIZE)
@@ -1,15 +1,30 @@
 from controller import StripZsndController
+from metrics import ZsndMetrics, ZsndMetricsExporter
+from watch import ZsndWatchDaemon, ZsndStripOptions
+from work_queue import ZsndQueueRunner
+from server import ZsndStripServer
+from envelope import ZsndEnvelopeCache
+from synth import ZsndSynthSpec, SYNTH_FORMATS
+from io_policy import ZsndIoPolicy
+from memory import ZsndMemoryBudget, parse_byte_size
+from service import ZsndPosition
+from wav_logic import ZsndBackendProfile, DETECTION_BACKENDS, BACKEND_AUTO
+from util import ZsndError
 from r_framework import TyperApp, LazyHelp
 import r_framework as r
 
 import typer
 import click
+from i18n import t as _
+import multiprocessing
+import os
 from pathlib import Path
 import sys
 from typing_extensions import override
 from typing import Annotated, Optional
 
 def main():
+    multiprocessing.freeze_support()
     app_dir = ''
     if getattr(sys, 'frozen', False):
         # executed inside a PyInstaller frozen app
@@ -21,14 +36,49 @@ def main():
     the_app.boot(sys.argv)
     the_app.run(*sys.argv[1:])
 
+class _PositionType(click.ParamType):
+    name = 'position'
+
+    @override
+    def convert(self, value, param, ctx):
+        if isinstance(value, ZsndPosition):
+            return value
+        try:
+            return ZsndPosition.parse(value)
+        except ValueError as exc:
+            self.fail(str(exc), param, ctx)
+
+class _ByteSizeType(click.ParamType):
+    name = 'size'
+
+    @override
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        try:
+            return parse_byte_size(value)
+        except ValueError as exc:
+            self.fail(str(exc), param, ctx)
+
 class StripZsndApp(TyperApp):
+    _SWEEP_THRESHOLDS = (-90.0, -80.0, -70.0, -60.0)
+    _SWEEP_DURATIONS = (5, 10, 20, 50)
+    # in the per-user app directory
+    _BACKEND_PROFILE_NAME = 'backends.json'
+
     def __init__(self, app_dir: Path):
         super().__init__('strip-zsnd', app_dir)
 
     @override
     def boot(self, args):
         super().boot(args)
-        self.register_command(self._do_strip, 'strip')
+        self.register_command(self._do_strip, 'strip', default=True)
+        self.register_command(self._do_watch, 'watch', help_key='zsnd.watch_description')
+        self.register_command(self._do_serve, 'serve', help_key='zsnd.serve_description')
+        self.register_command(self._do_sweep, 'sweep', help_key='zsnd.sweep_description')
+        self.register_command(self._do_queue, 'queue', help_key='zsnd.queue_description')
+        self.register_command(self._do_synth, 'synth', help_key='zsnd.synth_description')
+        self.register_command(self._do_timeline, 'timeline', help_key='zsnd.timeline_description')
 
     def _do_strip(self,
             input_path: Annotated[Path, typer.Argument(
@@ -56,10 +106,100 @@ class StripZsndApp(TyperApp):
                 '--detect',
                 help='zsnd.args.detect',
                 ), LazyHelp()] = False,
+            check: Annotated[Optional[bool], typer.Option(
+                '--check',
+                help='zsnd.args.check',
+                ), LazyHelp()] = False,
+            max_dropouts: Annotated[Optional[int], typer.Option(
+                '--max-dropouts',
+                help='zsnd.args.max_dropouts',
+                click_type=click.IntRange(min=1),
+                ), LazyHelp()] = 1,
+            in_place: Annotated[Optional[bool], typer.Option(
+                '--in-place',
+                help='zsnd.args.in_place',
+                ), LazyHelp()] = False,
+            on_clean: Annotated[Optional[str], typer.Option(
+                '--on-clean',
+                help='zsnd.args.on_clean',
+                click_type=click.Choice(StripZsndController.ON_CLEAN_CHOICES),
+                ), LazyHelp()] = StripZsndController.ON_CLEAN_CLONE,
+            resume: Annotated[Optional[bool], typer.Option(
+                '--resume',
+                help='zsnd.args.resume',
+                ), LazyHelp()] = False,
+            start: Annotated[Optional[ZsndPosition], typer.Option(
+                '--start',
+                help='zsnd.args.start',
+                click_type=_PositionType(),
+                ), LazyHelp()] = None,
+            end: Annotated[Optional[ZsndPosition], typer.Option(
+                '--end',
+                help='zsnd.args.end',
+                click_type=_PositionType(),
+                ), LazyHelp()] = None,
+            copy_outside: Annotated[Optional[bool], typer.Option(
+                '--copy-outside',
+                help='zsnd.args.copy_outside',
+                ), LazyHelp()] = False,
+            pipeline: Annotated[Optional[bool], typer.Option(
+                '--pipeline',
+                help='zsnd.args.pipeline',
+                ), LazyHelp()] = False,
+            strided: Annotated[Optional[bool], typer.Option(
+                '--strided',
+                help='zsnd.args.strided',
+                ), LazyHelp()] = False,
+            log_rate: Annotated[Optional[int], typer.Option(
+                '--log-rate',
+                help='zsnd.args.log_rate',
+                click_type=click.IntRange(min=0),
+                ), LazyHelp()] = None,
+            log_ends: Annotated[Optional[int], typer.Option(
+                '--log-ends',
+                help='zsnd.args.log_ends',
+                click_type=click.IntRange(min=0),
+                ), LazyHelp()] = None,
+            report: Annotated[Optional[Path], typer.Option(
+                '--report',
+                help='zsnd.args.report',
+                dir_okay=False,
+                writable=True,
+                ), LazyHelp()] = None,
+            timeline: Annotated[Optional[bool], typer.Option(
+                '--timeline',
+                help='zsnd.args.timeline',
+                ), LazyHelp()] = False,
+            envelope_cache: Annotated[Optional[Path], typer.Option(
+                '--envelope-cache',
+                help='zsnd.args.envelope_cache',
+                file_okay=False,
+                ), LazyHelp()] = None,
+            metrics_out: Annotated[Optional[Path], typer.Option(
+                '--metrics-out',
+                help='zsnd.args.metrics_out',
+                dir_okay=False,
+                writable=True,
+                ), LazyHelp()] = None,
             force: Annotated[Optional[bool], typer.Option(
                 '-f/-i', '--force',
                 help='app.args.force',
             ), LazyHelp()] = False,
+            io_policy: Annotated[Optional[str], typer.Option(
+                '--io-policy',
+                help='zsnd.args.io_policy',
+                click_type=click.Choice(ZsndIoPolicy.CHOICES),
+                ), LazyHelp()] = ZsndIoPolicy.DEFAULT,
+            max_memory: Annotated[Optional[int], typer.Option(
+                '--max-memory',
+                help='zsnd.args.max_memory',
+                click_type=_ByteSizeType(),
+                ), LazyHelp()] = None,
+            backend: Annotated[Optional[str], typer.Option(
+                '--backend',
+                help='zsnd.args.backend',
+                click_type=click.Choice((BACKEND_AUTO, *DETECTION_BACKENDS)),
+                ), LazyHelp()] = BACKEND_AUTO,
             verbose: TyperApp.Verbose = 0,
             debug: TyperApp.Debug = False,
             ctx: typer.Context = typer.Option(None)):
@@ -68,5 +208,462 @@ class StripZsndApp(TyperApp):
             self.get_logger().debug(ctx.params)
 
         output_path_str = None if output_path is None else str(output_path)
-        return StripZsndController().strip(str(input_path), output_path_str, force,
-                min_duration, threshold, detect_only)
+        metrics_exporter = None
+        if metrics_out is not None:
+            metrics_exporter = ZsndMetricsExporter(str(metrics_out), ZsndMetrics())
+        memory_budget = None
+        if max_memory is not None:
+            try:
+                memory_budget = ZsndMemoryBudget(max_memory)
+            except ZsndError as exc:
+                self.get_logger().error(str(exc))
+                return 1
+        if envelope_cache is not None:
+            envelope_cache = ZsndEnvelopeCache(str(envelope_cache))
+        controller = StripZsndController(metrics_exporter, memory_budget=memory_budget,
+                pipelined=pipeline, strided=strided, max_log_lines_per_second=log_rate,
+                num_log_ends=log_ends, envelope_cache=envelope_cache, io_policy=io_policy,
+                backend=backend, backend_profile=ZsndBackendProfile(self._get_backend_profile_path()))
+        if check:
+            if output_path is not None or in_place:
+                self.get_logger().error(_('zsnd.check_with_output'))
+                raise typer.Exit(StripZsndController.EXIT_FAILED)
+            raise typer.Exit(controller.check(str(input_path), min_duration, threshold,
+                    max_dropouts, start, end))
+        return controller.strip(str(input_path), output_path_str, force,
+                min_duration, threshold, detect_only, in_place, on_clean,
+                resume, start, end, copy_outside, None if report is None else str(report),
+                timeline)
+
+    def _do_watch(self,
+            dirs: Annotated[list[Path], typer.Argument(
+                help='zsnd.args.watch_dirs',
+                file_okay=False,
+                exists=True,
+                readable=True,
+                ), LazyHelp()],
+            output_dir: Annotated[Path, typer.Option(
+                '-o', '--output-dir',
+                help='zsnd.args.output_dir',
+                file_okay=False,
+                writable=True,
+                ), LazyHelp()],
+            pattern: Annotated[Optional[str], typer.Option(
+                '--pattern',
+                help='zsnd.args.pattern',
+                ), LazyHelp()] = '*.wav',
+            workers: Annotated[Optional[int], typer.Option(
+                '-j', '--workers',
+                help='zsnd.args.workers',
+                click_type=click.IntRange(min=1),
+                ), LazyHelp()] = max(1, (os.cpu_count() or 2) // 2),
+            settle: Annotated[Optional[float], typer.Option(
+                '--settle',
+                help='zsnd.args.settle',
+                min=0.0,
+                ), LazyHelp()] = 5.0,
+            poll: Annotated[Optional[float], typer.Option(
+                '--poll',
+                help='zsnd.args.poll',
+                click_type=click.FloatRange(min=0.1),
+                ), LazyHelp()] = 2.0,
+            no_inotify: Annotated[Optional[bool], typer.Option(
+                '--no-inotify',
+                help='zsnd.args.no_inotify',
+                ), LazyHelp()] = False,
+            state: Annotated[Optional[Path], typer.Option(
+                '--state',
+                help='zsnd.args.watch_state',
+                dir_okay=False,
+                writable=True,
+                ), LazyHelp()] = None,
+            min_duration: Annotated[Optional[int], typer.Option(
+                '-d', '--duration',
+                help='zsnd.args.min_duration',
+                click_type=click.IntRange(min=0, min_open=True),
+                ), LazyHelp()] = 10,
+            threshold: Annotated[Optional[float], typer.Option(
+                '-t', '--threshold',
+                help='zsnd.args.threshold',
+                max=-10.0,
+                ), LazyHelp()] = -80.0,
+            on_clean: Annotated[Optional[str], typer.Option(
+                '--on-clean',
+                help='zsnd.args.on_clean',
+                click_type=click.Choice(StripZsndController.ON_CLEAN_CHOICES),
+                ), LazyHelp()] = StripZsndController.ON_CLEAN_CLONE,
+            io_policy: Annotated[Optional[str], typer.Option(
+                '--io-policy',
+                help='zsnd.args.io_policy',
+                click_type=click.Choice(ZsndIoPolicy.CHOICES),
+                ), LazyHelp()] = ZsndIoPolicy.DEFAULT,
+            max_memory: Annotated[Optional[int], typer.Option(
+                '--max-memory',
+                help='zsnd.args.max_memory',
+                click_type=_ByteSizeType(),
+                ), LazyHelp()] = None,
+            backend: Annotated[Optional[str], typer.Option(
+                '--backend',
+                help='zsnd.args.backend',
+                click_type=click.Choice((BACKEND_AUTO, *DETECTION_BACKENDS)),
+                ), LazyHelp()] = BACKEND_AUTO,
+            verbose: TyperApp.Verbose = 0,
+            debug: TyperApp.Debug = False,
+            ctx: typer.Context = typer.Option(None)):
+
+        if r.DEBUG or verbose:
+            self.get_logger().debug(ctx.params)
+
+        try:
+            daemon = ZsndWatchDaemon([str(d) for d in dirs], str(output_dir), pattern,
+                    ZsndStripOptions(min_duration, threshold, on_clean, io_policy, backend,
+                            self._get_backend_profile_path()), workers, settle, poll,
+                    None if state is None else str(state), not no_inotify, max_memory)
+            daemon.run(self.name, self.app_dir, max(verbose or 0, 1 if r.DEBUG else 0))
+        except ZsndError as exc:
+            self.get_logger().error(str(exc))
+            return 1
+        return 0
+
+    def _do_queue(self,
+            queue_dir: Annotated[Path, typer.Argument(
+                help='zsnd.args.queue_dir',
+                file_okay=False,
+                exists=True,
+                readable=True,
+                ), LazyHelp()],
+            output_dir: Annotated[Path, typer.Option(
+                '-o', '--output-dir',
+                help='zsnd.args.output_dir',
+                file_okay=False,
+                writable=True,
+                ), LazyHelp()],
+            pattern: Annotated[Optional[str], typer.Option(
+                '--pattern',
+                help='zsnd.args.pattern',
+                ), LazyHelp()] = '*.wav',
+            workers: Annotated[Optional[int], typer.Option(
+                '-j', '--workers',
+                help='zsnd.args.workers',
+                click_type=click.IntRange(min=1),
+                ), LazyHelp()] = max(1, (os.cpu_count() or 2) // 2),
+            lease: Annotated[Optional[float], typer.Option(
+                '--lease',
+                help='zsnd.args.lease',
+                click_type=click.FloatRange(min=1.0),
+                ), LazyHelp()] = 600.0,
+            poll: Annotated[Optional[float], typer.Option(
+                '--poll',
+                help='zsnd.args.poll',
+                click_type=click.FloatRange(min=0.1),
+                ), LazyHelp()] = 10.0,
+            state_dir: Annotated[Optional[Path], typer.Option(
+                '--state-dir',
+                help='zsnd.args.queue_state_dir',
+                file_okay=False,
+                ), LazyHelp()] = None,
+            min_duration: Annotated[Optional[int], typer.Option(
+                '-d', '--duration',
+                help='zsnd.args.min_duration',
+                click_type=click.IntRange(min=0, min_open=True),
+                ), LazyHelp()] = 10,
+            threshold: Annotated[Optional[float], typer.Option(
+                '-t', '--threshold',
+                help='zsnd.args.threshold',
+                max=-10.0,
+                ), LazyHelp()] = -80.0,
+            on_clean: Annotated[Optional[str], typer.Option(
+                '--on-clean',
+                help='zsnd.args.on_clean',
+                click_type=click.Choice(StripZsndController.ON_CLEAN_CHOICES),
+                ), LazyHelp()] = StripZsndController.ON_CLEAN_CLONE,
+            io_policy: Annotated[Optional[str], typer.Option(
+                '--io-policy',
+                help='zsnd.args.io_policy',
+                click_type=click.Choice(ZsndIoPolicy.CHOICES),
+                ), LazyHelp()] = ZsndIoPolicy.DEFAULT,
+            max_memory: Annotated[Optional[int], typer.Option(
+                '--max-memory',
+                help='zsnd.args.max_memory',
+                click_type=_ByteSizeType(),
+                ), LazyHelp()] = None,
+            backend: Annotated[Optional[str], typer.Option(
+                '--backend',
+                help='zsnd.args.backend',
+                click_type=click.Choice((BACKEND_AUTO, *DETECTION_BACKENDS)),
+                ), LazyHelp()] = BACKEND_AUTO,
+            verbose: TyperApp.Verbose = 0,
+            debug: TyperApp.Debug = False,
+            ctx: typer.Context = typer.Option(None)):
+
+        if r.DEBUG or verbose:
+            self.get_logger().debug(ctx.params)
+
+        try:
+            runner = ZsndQueueRunner(str(queue_dir), str(output_dir), pattern,
+                    ZsndStripOptions(min_duration, threshold, on_clean, io_policy, backend,
+                            self._get_backend_profile_path()), workers,
+                    lease, poll, None if state_dir is None else str(state_dir), max_memory)
+            summary = runner.run(self.name, self.app_dir, max(verbose or 0, 1 if r.DEBUG else 0))
+        except ZsndError as exc:
+            self.get_logger().error(str(exc))
+            raise typer.Exit(StripZsndController.EXIT_FAILED)
+        # for batch schedulers, as typer ignores the return value
+        if summary.get(StripZsndController.STATUS_FAILED):
+            raise typer.Exit(StripZsndController.EXIT_FAILED)
+
+    def _do_synth(self,
+            output_path: Annotated[Path, typer.Argument(
+                help='zsnd.args.synth_output',
+                dir_okay=False,
+                writable=True,
+                ), LazyHelp()],
+            sample_format: Annotated[Optional[str], typer.Option(
+                '--format',
+                help='zsnd.args.synth_format',
+                click_type=click.Choice(tuple(SYNTH_FORMATS)),
+                ), LazyHelp()] = 'int16',
+            rate: Annotated[Optional[int], typer.Option(
+                '--rate',
+                help='zsnd.args.synth_rate',
+                click_type=click.IntRange(min=1),
+                ), LazyHelp()] = 44100,
+            seconds: Annotated[Optional[float], typer.Option(
+                '--seconds',
+                help='zsnd.args.synth_seconds',
+                click_type=click.FloatRange(min=0.0, min_open=True),
+                ), LazyHelp()] = 60.0,
+            size: Annotated[Optional[int], typer.Option(
+                '--size',
+                help='zsnd.args.synth_size',
+                click_type=_ByteSizeType(),
+                ), LazyHelp()] = None,
+            dropouts: Annotated[Optional[int], typer.Option(
+                '--dropouts',
+                help='zsnd.args.synth_dropouts',
+                click_type=click.IntRange(min=0),
+                ), LazyHelp()] = 100,
+            noises: Annotated[Optional[int], typer.Option(
+                '--noises',
+                help='zsnd.args.synth_noises',
+                click_type=click.IntRange(min=0),
+                ), LazyHelp()] = 0,
+            noise_level: Annotated[Optional[float], typer.Option(
+                '--noise-level',
+                help='zsnd.args.synth_noise_level',
+                max=0.0,
+                ), LazyHelp()] = -90.0,
+            min_length: Annotated[Optional[float], typer.Option(
+                '--min-length',
+                help='zsnd.args.synth_min_length',
+                click_type=click.FloatRange(min=0.0, min_open=True),
+                ), LazyHelp()] = 5.0,
+            max_length: Annotated[Optional[float], typer.Option(
+                '--max-length',
+                help='zsnd.args.synth_max_length',
+                click_type=click.FloatRange(min=0.0, min_open=True),
+                ), LazyHelp()] = 50.0,
+            distribution: Annotated[Optional[str], typer.Option(
+                '--distribution',
+                help='zsnd.args.synth_distribution',
+                click_type=click.Choice(ZsndSynthSpec.DISTRIBUTIONS),
+                ), LazyHelp()] = ZsndSynthSpec.DISTRIBUTION_LOG_UNIFORM,
+            seed: Annotated[Optional[int], typer.Option(
+                '--seed',
+                help='zsnd.args.synth_seed',
+                ), LazyHelp()] = 0,
+            truth: Annotated[Optional[Path], typer.Option(
+                '--truth',
+                help='zsnd.args.synth_truth',
+                dir_okay=False,
+                writable=True,
+                ), LazyHelp()] = None,
+            force: Annotated[Optional[bool], typer.Option(
+                '-f/-i', '--force',
+                help='app.args.force',
+            ), LazyHelp()] = False,
+            io_policy: Annotated[Optional[str], typer.Option(
+                '--io-policy',
+                help='zsnd.args.io_policy',
+                click_type=click.Choice(ZsndIoPolicy.CHOICES),
+                ), LazyHelp()] = ZsndIoPolicy.DEFAULT,
+            max_memory: Annotated[Optional[int], typer.Option(
+                '--max-memory',
+                help='zsnd.args.max_memory',
+                click_type=_ByteSizeType(),
+                ), LazyHelp()] = None,
+            verbose: TyperApp.Verbose = 0,
+            debug: TyperApp.Debug = False,
+            ctx: typer.Context = typer.Option(None)):
+
+        if r.DEBUG or verbose:
+            self.get_logger().debug(ctx.params)
+
+        memory_budget = None
+        if max_memory is not None:
+            try:
+                memory_budget = ZsndMemoryBudget(max_memory)
+            except ZsndError as exc:
+                self.get_logger().error(str(exc))
+                return 1
+        synth_format = SYNTH_FORMATS[sample_format]
+        num_frames = round(seconds * rate) if size is None \
+                else size // synth_format.bytes_per_sample
+        spec = ZsndSynthSpec(synth_format, num_frames, rate, dropouts, noises, noise_level,
+                min_length, max(min_length, max_length), distribution, seed)
+        truth_path = f'{output_path}.truth.json' if truth is None else str(truth)
+        controller = StripZsndController(memory_budget=memory_budget, io_policy=io_policy)
+        return controller.synth(str(output_path), spec, truth_path, force)
+
+    def _do_serve(self,
+            socket_path: Annotated[Optional[Path], typer.Option(
+                '--socket',
+                help='zsnd.args.socket',
+                dir_okay=False,
+                ), LazyHelp()] = None,
+            host: Annotated[Optional[str], typer.Option(
+                '--host',
+                help='zsnd.args.host',
+                ), LazyHelp()] = '127.0.0.1',
+            port: Annotated[Optional[int], typer.Option(
+                '-p', '--port',
+                help='zsnd.args.port',
+                click_type=click.IntRange(min=0, max=65535),
+                ), LazyHelp()] = 8765,
+            jobs: Annotated[Optional[int], typer.Option(
+                '-j', '--jobs',
+                help='zsnd.args.jobs',
+                click_type=click.IntRange(min=1),
+                ), LazyHelp()] = 4,
+            min_duration: Annotated[Optional[int], typer.Option(
+                '-d', '--duration',
+                help='zsnd.args.min_duration',
+                click_type=click.IntRange(min=0, min_open=True),
+                ), LazyHelp()] = 10,
+            threshold: Annotated[Optional[float], typer.Option(
+                '-t', '--threshold',
+                help='zsnd.args.threshold',
+                max=-10.0,
+                ), LazyHelp()] = -80.0,
+            max_memory: Annotated[Optional[int], typer.Option(
+                '--max-memory',
+                help='zsnd.args.max_memory',
+                click_type=_ByteSizeType(),
+                ), LazyHelp()] = None,
+            backend: Annotated[Optional[str], typer.Option(
+                '--backend',
+                help='zsnd.args.backend',
+                click_type=click.Choice((BACKEND_AUTO, *DETECTION_BACKENDS)),
+                ), LazyHelp()] = BACKEND_AUTO,
+            verbose: TyperApp.Verbose = 0,
+            debug: TyperApp.Debug = False,
+            ctx: typer.Context = typer.Option(None)):
+
+        if r.DEBUG or verbose:
+            self.get_logger().debug(ctx.params)
+
+        try:
+            server = ZsndStripServer(jobs, min_duration, threshold, max_memory, backend,
+                    ZsndBackendProfile(self._get_backend_profile_path()))
+        except ZsndError as exc:
+            self.get_logger().error(str(exc))
+            raise typer.Exit(1)
+        try:
+            if socket_path is not None:
+                server.bind_unix(str(socket_path))
+                address = str(socket_path)
+            else:
+                address = 'http://%s:%d' % server.bind_tcp(host, port)
+        except OSError as exc:
+            # e.g. the address is in use
+            self.get_logger().error(f'{socket_path or f"{host}:{port}"}: {exc}')
+            raise typer.Exit(1)
+        self.get_logger().info(_('zsnd.serving') % address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    def _do_sweep(self,
+            input_paths: Annotated[list[Path], typer.Argument(
+                help='zsnd.args.sweep_inputs',
+                dir_okay=False,
+                exists=True,
+                readable=True,
+                ), LazyHelp()],
+            thresholds: Annotated[Optional[list[float]], typer.Option(
+                '-t', '--threshold',
+                help='zsnd.args.sweep_thresholds',
+                max=-10.0,
+                ), LazyHelp()] = None,
+            durations: Annotated[Optional[list[int]], typer.Option(
+                '-d', '--duration',
+                help='zsnd.args.sweep_durations',
+                click_type=click.IntRange(min=0, min_open=True),
+                ), LazyHelp()] = None,
+            io_policy: Annotated[Optional[str], typer.Option(
+                '--io-policy',
+                help='zsnd.args.io_policy',
+                click_type=click.Choice(ZsndIoPolicy.CHOICES),
+                ), LazyHelp()] = ZsndIoPolicy.DEFAULT,
+            max_memory: Annotated[Optional[int], typer.Option(
+                '--max-memory',
+                help='zsnd.args.max_memory',
+                click_type=_ByteSizeType(),
+                ), LazyHelp()] = None,
+            backend: Annotated[Optional[str], typer.Option(
+                '--backend',
+                help='zsnd.args.backend',
+                click_type=click.Choice((BACKEND_AUTO, *DETECTION_BACKENDS)),
+                ), LazyHelp()] = BACKEND_AUTO,
+            verbose: TyperApp.Verbose = 0,
+            debug: TyperApp.Debug = False,
+            ctx: typer.Context = typer.Option(None)):
+
+        if r.DEBUG or verbose:
+            self.get_logger().debug(ctx.params)
+
+        memory_budget = None
+        if max_memory is not None:
+            try:
+                memory_budget = ZsndMemoryBudget(max_memory)
+            except ZsndError as exc:
+                self.get_logger().error(str(exc))
+                return 1
+        controller = StripZsndController(memory_budget=memory_budget, io_policy=io_policy,
+                backend=backend,
+                backend_profile=ZsndBackendProfile(self._get_backend_profile_path()))
+        result = 0
+        for input_path in input_paths:
+            result = max(result, controller.sweep(str(input_path), thresholds or self._SWEEP_THRESHOLDS,
+                    durations or self._SWEEP_DURATIONS))
+        return result
+
+    def _do_timeline(self,
+            map_path: Annotated[Path, typer.Argument(
+                help='zsnd.args.timeline_map',
+                dir_okay=False,
+                exists=True,
+                readable=True,
+                ), LazyHelp()],
+            positions: Annotated[list[ZsndPosition], typer.Argument(
+                help='zsnd.args.timeline_positions',
+                click_type=_PositionType(),
+                ), LazyHelp()],
+            from_input: Annotated[Optional[bool], typer.Option(
+                '--from-input',
+                help='zsnd.args.timeline_from_input',
+                ), LazyHelp()] = False,
+            verbose: TyperApp.Verbose = 0,
+            debug: TyperApp.Debug = False,
+            ctx: typer.Context = typer.Option(None)):
+
+        if r.DEBUG or verbose:
+            self.get_logger().debug(ctx.params)
+
+        controller = StripZsndController(show_progress=False)
+        return controller.lookup_timeline(str(map_path), positions, from_input)
+
+    def _get_backend_profile_path(self) -> str:
+        return os.path.join(typer.get_app_dir(self.name), self._BACKEND_PROFILE_NAME)
@@ -0,0 +1,126 @@
+from util import ZsndLogMixin, ZsndError
+
+from i18n import t as _
+import os
+import re
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+def parse_byte_size(text: str) -> int:
+    '''
+    Parses sizes like "512M", "1.5G" or "300MiB". Units are binary.
+
+    :raises ValueError:
+    '''
+    m = re.fullmatch(r'\s*(\d+(?:\.\d*)?)\s*([KMGT]?)(?:I?B)?\s*', text, re.IGNORECASE)
+    if m is None:
+        raise ValueError(f'invalid size: {text!r}')
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2).upper()])
+
+def format_byte_size(size: int) -> str:
+    for unit in ('T', 'G', 'M', 'K'):
+        if size >= _SIZE_UNITS[unit]:
+            return f'{size / _SIZE_UNITS[unit]:.1f} {unit}iB'
+    return f'{size} B'
+
+def get_current_rss() -> int|None:
+    '''
+    :return: in bytes, or None if unavailable
+    '''
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    # the peak, as the closest approximation
+    return get_peak_rss()
+
+def get_peak_rss() -> int|None:
+    '''
+    :return: in bytes, or None if unavailable
+    '''
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if 'darwin' == sys.platform else max_rss * 1024
+
+class ZsndMemoryBudget(ZsndLogMixin):
+    '''
+    Shares a memory limit among the jobs of a process, and sizes their buffers from it.
+
+    The memory already used by the interpreter and the libraries when created is the baseline,
+    which the buffers cannot use.
+    '''
+    # Python objects of a job, besides its buffers
+    JOB_OVERHEAD = 1 << 20
+    # a chunk is held as read, as sliced and in the buffer of the output file
+    COPIES_PER_CHUNK = 3
+    MIN_CHUNK_FRAMES = 256
+
+    def __init__(self, limit: int, num_jobs: int = 1, baseline: int|None = None):
+        '''
+        :raises ZsndError: when the baseline already exceeds the limit
+        '''
+        self.limit = limit
+        self.baseline = get_current_rss() if baseline is None else baseline
+        if self.baseline is None:
+            self.get_logger().warning('memory usage is unavailable; the baseline is ignored')
+            self.baseline = 0
+        self.num_jobs = num_jobs
+        if self.get_job_share() < self.JOB_OVERHEAD:
+            self._fail(self.baseline + self.JOB_OVERHEAD * num_jobs)
+        self.get_logger().debug(f'memory budget {format_byte_size(limit)}: '
+                f'baseline {format_byte_size(self.baseline)}, {num_jobs} jobs')
+
+    @classmethod
+    def get_min_job_size(cls, bytes_per_sample: int, copies: int = COPIES_PER_CHUNK) -> int:
+        return cls.JOB_OVERHEAD + cls.MIN_CHUNK_FRAMES * copies * bytes_per_sample
+
+    def get_job_share(self) -> int:
+        return (self.limit - self.baseline) // self.num_jobs
+
+    def fit_jobs(self, requested: int, per_job: int) -> int:
+        '''
+        :param per_job: minimum bytes a job needs
+        :return: the number of jobs within the limit, up to `requested`
+        :raises ZsndError: when not even one job fits
+        '''
+        available = self.limit - self.baseline
+        num_jobs = min(requested, available // per_job)
+        if 0 >= num_jobs:
+            self._fail(self.baseline + per_job)
+        if num_jobs < requested:
+            self.get_logger().warning(f'{num_jobs} of {requested} jobs fit in '
+                    f'{format_byte_size(self.limit)}')
+        return num_jobs
+
+    def get_chunk_frames(self, bytes_per_sample: int, default: int,
+            copies: int = COPIES_PER_CHUNK) -> int:
+        '''
+        :param copies: chunks held at once by a job, e.g. including the ones in queues
+        :return: frames read at once, no more than `default`
+        :raises ZsndError: when the budget is too small for the format
+        '''
+        frames = (self.get_job_share() - self.JOB_OVERHEAD) // (copies * bytes_per_sample)
+        if frames < self.MIN_CHUNK_FRAMES:
+            self._fail(self.baseline
+                    + self.num_jobs * self.get_min_job_size(bytes_per_sample, copies))
+        return min(frames, default)
+
+    def get_buffer_size(self, default: int, num_buffers: int = 1) -> int:
+        '''
+        :param num_buffers: buffers of the size held at once by a job
+        :return: bytes of a buffer, no more than `default`
+        '''
+        return max(1, min(default, (self.get_job_share() - self.JOB_OVERHEAD) // num_buffers))
+
+    def _fail(self, needed: int):
+        raise ZsndError(_('zsnd.memory_budget_too_small') % {
+                'limit': format_byte_size(self.limit), 'needed': format_byte_size(needed)})
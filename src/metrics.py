@@ -0,0 +1,251 @@
+from service import DropoutListener
+from memory import get_peak_rss
+from util import ZsndLogMixin
+
+import bisect
+import io
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from typing_extensions import override
+
+class ZsndHistogram:
+    def __init__(self, bounds: tuple[float, ...]):
+        '''
+        :param bounds: upper bounds of the buckets, excluding +Inf
+        '''
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def merge(self, other: 'ZsndHistogram'):
+        assert self.bounds == other.bounds
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+
+    def get_count(self) -> int:
+        return sum(self.counts)
+
+    def to_dict(self) -> dict:
+        buckets = {str(bound): count for bound, count in zip(self.bounds, self.counts)}
+        buckets['+Inf'] = self.counts[-1]
+        return {'buckets': buckets, 'count': self.get_count(), 'sum': self.sum}
+
+class ZsndFileMetrics(DropoutListener):
+    # in seconds
+    DROPOUT_LENGTH_BOUNDS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+    def __init__(self, path: str, sample_rate: int, bytes_per_sample: int, num_frames: int):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.bytes_per_sample = bytes_per_sample
+        self.num_frames = num_frames
+        self.status = 'running'
+        self.started_at = time.time()
+        self._started_at_monotonic = time.monotonic()
+        self.processing_seconds = 0.0
+        self.frames_read = 0
+        self.frames_written = 0
+        self.dropouts = 0
+        self.removed_frames = 0
+        self.dropout_lengths = ZsndHistogram(self.DROPOUT_LENGTH_BOUNDS)
+
+    @override
+    def on_dropout(self, input_start, length):
+        self.dropouts += 1
+        self.removed_frames += length
+        self.dropout_lengths.observe(length / self.sample_rate)
+
+    def update(self, frames_read: int, frames_written: int):
+        self.frames_read = frames_read
+        self.frames_written = frames_written
+        self.processing_seconds = time.monotonic() - self._started_at_monotonic
+
+    def finish(self, status: str):
+        self.status = status
+        self.processing_seconds = time.monotonic() - self._started_at_monotonic
+
+    def get_frames_per_second(self) -> float:
+        if 0 >= self.processing_seconds:
+            return 0.0
+        return self.frames_read / self.processing_seconds
+
+    def to_dict(self) -> dict:
+        return {
+            'path': self.path,
+            'status': self.status,
+            'started_at': self.started_at,
+            'processing_seconds': self.processing_seconds,
+            'frames': self.num_frames,
+            'frames_read': self.frames_read,
+            'frames_written': self.frames_written,
+            'frames_per_second': self.get_frames_per_second(),
+            'bytes_read': self.frames_read * self.bytes_per_sample,
+            'bytes_written': self.frames_written * self.bytes_per_sample,
+            'dropouts': self.dropouts,
+            'removed_seconds': self.removed_frames / self.sample_rate,
+            'dropout_length_seconds': self.dropout_lengths.to_dict(),
+        }
+
+class ZsndMetrics:
+    '''
+    Per-file and aggregate metrics of a run.
+    '''
+    # in seconds
+    PROCESSING_TIME_BOUNDS = (1.0, 10.0, 60.0, 300.0, 1800.0, 3600.0, 4 * 3600.0)
+
+    def __init__(self):
+        self.files: list[ZsndFileMetrics] = []
+        self.started_at = time.time()
+
+    def start_file(self, path: str, sample_rate: int, bytes_per_sample: int, num_frames: int) \
+            -> ZsndFileMetrics:
+        file_metrics = ZsndFileMetrics(path, sample_rate, bytes_per_sample, num_frames)
+        self.files.append(file_metrics)
+        return file_metrics
+
+    def to_dict(self) -> dict:
+        processing_time = ZsndHistogram(self.PROCESSING_TIME_BOUNDS)
+        dropout_lengths = ZsndHistogram(ZsndFileMetrics.DROPOUT_LENGTH_BOUNDS)
+        statuses: dict[str, int] = {}
+        for f in self.files:
+            if 'running' != f.status:
+                processing_time.observe(f.processing_seconds)
+            dropout_lengths.merge(f.dropout_lengths)
+            statuses[f.status] = statuses.get(f.status, 0) + 1
+        files = [f.to_dict() for f in self.files]
+        total_seconds = sum(f['processing_seconds'] for f in files)
+        frames_read = sum(f['frames_read'] for f in files)
+        return {
+            'started_at': self.started_at,
+            'updated_at': time.time(),
+            'peak_rss_bytes': get_peak_rss(),
+            'aggregate': {
+                'files': len(files),
+                'statuses': statuses,
+                'frames_read': frames_read,
+                'frames_written': sum(f['frames_written'] for f in files),
+                'frames_per_second': frames_read / total_seconds if 0 < total_seconds else 0.0,
+                'bytes_read': sum(f['bytes_read'] for f in files),
+                'bytes_written': sum(f['bytes_written'] for f in files),
+                'dropouts': sum(f['dropouts'] for f in files),
+                'removed_seconds': sum(f['removed_seconds'] for f in files),
+                'processing_seconds': processing_time.to_dict(),
+                'dropout_length_seconds': dropout_lengths.to_dict(),
+            },
+            'files': files,
+        }
+
+class ZsndMetricsFormatter(ABC):
+    @abstractmethod
+    def format(self, metrics: dict) -> str:
+        pass
+
+class ZsndJsonMetricsFormatter(ZsndMetricsFormatter):
+    @override
+    def format(self, metrics):
+        return json.dumps(metrics, indent=2)
+
+class ZsndPrometheusMetricsFormatter(ZsndMetricsFormatter):
+    '''
+    Text format for the textfile collector of node_exporter
+    '''
+    PREFIX = 'strip_zsnd_'
+    _PER_FILE_GAUGES = (
+        ('frames_read', 'frames_read_total', 'counter', 'Frames read from the input'),
+        ('frames_written', 'frames_written_total', 'counter', 'Frames written to the output'),
+        ('bytes_read', 'read_bytes_total', 'counter', 'Audio bytes read from the input'),
+        ('bytes_written', 'written_bytes_total', 'counter', 'Audio bytes written to the output'),
+        ('dropouts', 'dropouts_total', 'counter', 'Detected dropouts'),
+        ('removed_seconds', 'removed_seconds_total', 'counter', 'Total duration of the dropouts'),
+        ('processing_seconds', 'file_processing_seconds', 'gauge', 'Time spent on the file'),
+        ('frames_per_second', 'frames_per_second', 'gauge', 'Throughput'),
+    )
+
+    @override
+    def format(self, metrics):
+        lines = []
+        for key, name, metric_type, help in self._PER_FILE_GAUGES:
+            self._header(lines, name, metric_type, help)
+            for f in metrics['files']:
+                lines.append(self._sample(name, {'file': f['path']}, f[key]))
+            aggregated = metrics['aggregate'][key]
+            if isinstance(aggregated, dict):
+                # a histogram, written below
+                continue
+            self._header(lines, 'aggregate_' + name, metric_type, help + ' (all files)')
+            lines.append(self._sample('aggregate_' + name, {}, aggregated))
+
+        aggregate = metrics['aggregate']
+        self._header(lines, 'files', 'gauge', 'Processed files by status')
+        for status, count in aggregate['statuses'].items():
+            lines.append(self._sample('files', {'status': status}, count))
+        self._histogram(lines, 'processing_seconds', 'Processing time per file',
+                aggregate['processing_seconds'])
+        self._histogram(lines, 'dropout_length_seconds', 'Length of dropouts',
+                aggregate['dropout_length_seconds'])
+        if metrics['peak_rss_bytes'] is not None:
+            self._header(lines, 'peak_rss_bytes', 'gauge', 'Peak resident set size')
+            lines.append(self._sample('peak_rss_bytes', {}, metrics['peak_rss_bytes']))
+        self._header(lines, 'last_update_timestamp_seconds', 'gauge', 'Time of the last update')
+        lines.append(self._sample('last_update_timestamp_seconds', {}, metrics['updated_at']))
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines: list[str], name: str, metric_type: str, help: str):
+        lines.append(f'# HELP {self.PREFIX}{name} {help}')
+        lines.append(f'# TYPE {self.PREFIX}{name} {metric_type}')
+
+    def _histogram(self, lines: list[str], name: str, help: str, histogram: dict):
+        self._header(lines, name, 'histogram', help)
+        cumulative = 0
+        for bound, count in histogram['buckets'].items():
+            cumulative += count
+            lines.append(self._sample(name + '_bucket', {'le': bound}, cumulative))
+        lines.append(self._sample(name + '_sum', {}, histogram['sum']))
+        lines.append(self._sample(name + '_count', {}, histogram['count']))
+
+    def _sample(self, name: str, labels: dict[str, str], value) -> str:
+        label_str = ','.join(f'{k}="{self._escape(str(v))}"' for k, v in labels.items())
+        if label_str:
+            label_str = '{' + label_str + '}'
+        return f'{self.PREFIX}{name}{label_str} {value}'
+
+    def _escape(self, value: str) -> str:
+        return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class ZsndMetricsExporter(ZsndLogMixin):
+    '''
+    Writes the metrics atomically, at most once per interval while running
+    so that they can be scraped during a long batch.
+    '''
+    _INTERVAL_IN_SECONDS = 5.0
+
+    def __init__(self, path: str, metrics: ZsndMetrics,
+            interval_in_seconds: float = _INTERVAL_IN_SECONDS):
+        self._path = path
+        self.metrics = metrics
+        self._interval = interval_in_seconds
+        self._last_exported_at: float|None = None
+        if path.endswith('.prom'):
+            self._formatter: ZsndMetricsFormatter = ZsndPrometheusMetricsFormatter()
+        else:
+            self._formatter = ZsndJsonMetricsFormatter()
+
+    def update(self):
+        now = time.monotonic()
+        if self._last_exported_at is None or now - self._last_exported_at >= self._interval:
+            self.export()
+
+    def export(self):
+        contents = self._formatter.format(self.metrics.to_dict())
+        tmp_path = self._path + '.tmp'
+        with io.open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(contents)
+        os.replace(tmp_path, self._path)
+        self._last_exported_at = time.monotonic()
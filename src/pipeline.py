@@ -0,0 +1,168 @@
+from wav_io import ZsndWavReader, ZsndWavChunk, ZsndWavWriter
+from wave_format import WaveFormat
+from util import ZsndLogMixin
+
+import queue
+import threading
+
+class ZsndPrefetchingReader(ZsndLogMixin):
+    '''
+    Reads the chunks ahead on a thread, so that reading the disk overlaps the detection.
+
+    Wraps ZsndWavReader for StripZsndService, which reads chunks of the same size.
+    The file must not be used by others until close().
+    '''
+    _POLL_INTERVAL_IN_SECONDS = 0.1
+
+    def __init__(self, reader: ZsndWavReader, chunk_size: int, depth: int):
+        '''
+        :param depth: chunks read ahead at most
+        '''
+        self._reader = reader
+        self._chunk_size = chunk_size
+        self._depth = depth
+        self._pos = reader.tell()
+        self._num_bytes_read = 0
+        self._is_eof = False
+        self._thread: threading.Thread|None = None
+        self._start()
+
+    def read(self, num_frames: int) -> ZsndWavChunk:
+        assert num_frames == self._chunk_size
+        bytes_per_sample = self._reader.get_wave_format().get_bytes_per_sample()
+        if self._is_eof:
+            return ZsndWavChunk(b'', bytes_per_sample)
+        item = self._queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        self._is_eof = 0 >= len(item)
+        self._pos += len(item)
+        self._num_bytes_read += len(item) * bytes_per_sample
+        return item
+
+    def tell(self) -> int:
+        return self._pos
+
+    def rewind(self):
+        self.setpos(0)
+
+    def setpos(self, pos: int):
+        self._stop()
+        self._reader.setpos(pos)
+        self._pos = pos
+        self._is_eof = False
+        self._start()
+
+    def count_frames(self) -> int:
+        return self._reader.count_frames()
+
+    def get_sample_rate(self) -> int:
+        return self._reader.get_sample_rate()
+
+    def get_wave_format(self) -> WaveFormat:
+        return self._reader.get_wave_format()
+
+    def get_num_bytes_read(self) -> int:
+        '''
+        Returns the number of audio bytes consumed so far, excluding the ones read ahead.
+        '''
+        return self._num_bytes_read
+
+    def close(self):
+        self._stop()
+        self._reader.close()
+
+    def _start(self):
+        self._queue: queue.Queue[ZsndWavChunk|BaseException] = queue.Queue(self._depth)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='zsnd-prefetch', daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                chunk = self._reader.read(self._chunk_size)
+                if not self._put(chunk) or 0 >= len(chunk):  # EOF
+                    return
+        except BaseException as exc:
+            self._put(exc)
+
+    def _put(self, item) -> bool:
+        while not self._stopping.is_set():
+            try:
+                self._queue.put(item, timeout=self._POLL_INTERVAL_IN_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+class ZsndWriteBehindWriter(ZsndLogMixin):
+    '''
+    Writes the output on a thread, so that writing the disk overlaps the detection.
+
+    An error on the thread is raised by the next call.
+    '''
+    def __init__(self, writer: ZsndWavWriter, bytes_per_sample: int, depth: int):
+        '''
+        :param depth: buffers waiting to be written at most
+        '''
+        self._writer = writer
+        self._bytes_per_sample = bytes_per_sample
+        self._num_frames = writer.tell()
+        self._error: BaseException|None = None
+        self._queue: queue.Queue[bytes|None] = queue.Queue(depth)
+        self._thread = threading.Thread(target=self._run, name='zsnd-write-behind', daemon=True)
+        self._thread.start()
+
+    def write(self, data: bytes):
+        self._raise_error()
+        self._queue.put(data)
+        self._num_frames += len(data) // self._bytes_per_sample
+
+    def tell(self) -> int:
+        return self._num_frames
+
+    def copy_chunks(self, f, chunks):
+        self._writer.copy_chunks(f, chunks)
+
+    def flush(self):
+        '''
+        Waits until all the buffers are written.
+        '''
+        self._queue.join()
+        self._raise_error()
+        self._writer.flush()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        try:
+            self._raise_error()
+        finally:
+            self._writer.close()
+
+    def _run(self):
+        while True:
+            data = self._queue.get()
+            try:
+                if data is None:
+                    return
+                if self._error is None:
+                    self._writer.write(data)
+            except BaseException as exc:
+                self._error = exc
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
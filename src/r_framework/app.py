@@ -43,12 +43,18 @@ class TyperApp(App):
         help='app.args.verbose',
     ), LazyHelp()]
 
-    def register_command(self, func: Callable, name: str):
+    def register_command(self, func: Callable, name: str,
+            help_key: str = 'app.description', default: bool = False):
+        '''
+        :param default: runs this command when the arguments do not start with a command name
+        '''
         self.typer.command(
             cls=self._TyperCommand,
             name = name,
-            help=_('app.description'),
+            help=_(help_key),
         )(func)
+        if default:
+            self._group_class.default_command_name = name
 
     @override
     def __init__(self, name, app_dir):
@@ -61,7 +67,10 @@ class TyperApp(App):
         base_type, *metadata = typing.get_args(self.Verbose)
         metadata[0].callback = self._verbose_callback
 
+        # a subclass per app, to hold its default command
+        self._group_class = type('_TyperGroup', (self._TyperGroup,), {})
         self.typer = typer.Typer(
+            cls=self._group_class,
             name=self.name,
             help=_('app.description'),
             options_metavar=_('click.options_metavar'),
@@ -76,11 +85,12 @@ class TyperApp(App):
         self.configure_log(max(verbosity, min_limit))
 
     @classmethod
-    def _translate_typer_parameters(cls, func: Callable, typer_params: list[click.Option|click.Argument]):
+    def _translate_typer_parameters(cls, func: Callable|None, typer_params: list[click.Option|click.Argument]):
         # lazy translation
-        signatures = inspect.signature(func)
-        for name, param in signatures.parameters.items():
-            cls._lazy_translate_for_a_param(name, param, typer_params)
+        if func is not None:
+            signatures = inspect.signature(func)
+            for name, param in signatures.parameters.items():
+                cls._lazy_translate_for_a_param(name, param, typer_params)
 
         # translate Typer internal options
         for p in typer_params:
@@ -112,7 +122,19 @@ class TyperApp(App):
             return super().format_help(ctx, formatter)
 
     class _TyperGroup(typer.core.TyperGroup):
+        default_command_name: str|None = None
+
         @override
         def format_help(self, ctx, formatter):
             TyperApp._translate_typer_parameters(self.callback, self.params)
             return super().format_help(ctx, formatter)
+
+        @override
+        def parse_args(self, ctx, args):
+            if self.default_command_name and args and args[0] not in self.commands:
+                group_options = set(self.get_help_option_names(ctx))
+                for p in self.get_params(ctx):
+                    group_options.update(p.opts)
+                if args[0] not in group_options:
+                    args = [self.default_command_name, *args]
+            return super().parse_args(ctx, args)
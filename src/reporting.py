@@ -0,0 +1,152 @@
+from metrics import ZsndHistogram, ZsndFileMetrics
+from service import DropoutListener, format_num_samples_in_seconds
+from envelope import ZsndPeakMeter
+from wave_format import WaveFormat
+from util import ZsndLogMixin
+
+from i18n import t as _
+import collections
+import csv
+import io
+import json
+import os
+import time
+from typing_extensions import override
+
+class ZsndDropoutReporter(ZsndLogMixin):
+    '''
+    Logs dropouts without flooding the console, and summarizes them at the end.
+
+    Only the log lines are limited; DropoutListener still receives every dropout.
+    '''
+    def __init__(self, max_lines_per_second: int|None = None, num_ends: int|None = None):
+        '''
+        :param max_lines_per_second: lines over it are counted but not logged
+        :param num_ends: logs only the first and the last this number of dropouts
+        '''
+        self._max_lines_per_second = max_lines_per_second
+        self._num_ends = num_ends
+        self._window_started_at = 0.0
+        self._num_lines_in_window = 0
+        self._num_suppressed = 0
+        self._tail: collections.deque[tuple[int, int, int]] = collections.deque(maxlen=num_ends)
+        self.count = 0
+        self.total_length_in_seconds = 0.0
+        self.longest_in_seconds = 0.0
+        self.lengths = ZsndHistogram(ZsndFileMetrics.DROPOUT_LENGTH_BOUNDS)
+
+    def report(self, abs_zero_run_start: int, zero_run_length: int, frame_rate: int):
+        length_in_seconds = zero_run_length / frame_rate
+        self.count += 1
+        self.total_length_in_seconds += length_in_seconds
+        self.longest_in_seconds = max(self.longest_in_seconds, length_in_seconds)
+        self.lengths.observe(length_in_seconds)
+
+        if self._num_ends is not None and self.count > self._num_ends:
+            if len(self._tail) == self._tail.maxlen:
+                self._num_suppressed += 1
+            self._tail.append((abs_zero_run_start, zero_run_length, frame_rate))
+            return
+        if self._max_lines_per_second is not None:
+            now = time.monotonic()
+            if 1.0 <= now - self._window_started_at:
+                self._window_started_at = now
+                self._num_lines_in_window = 0
+            if self._num_lines_in_window >= self._max_lines_per_second:
+                self._num_suppressed += 1
+                return
+            self._num_lines_in_window += 1
+        self._log_dropout(abs_zero_run_start, zero_run_length, frame_rate)
+
+    def summarize(self):
+        logger = self.get_logger()
+        if self._tail:
+            for start, length, rate in self._tail:
+                self._log_dropout(start, length, rate)
+            self._tail.clear()
+        elif 0 < self._num_suppressed:
+            logger.info(_('zsnd.dropouts_not_shown') % self._num_suppressed)
+            self._num_suppressed = 0
+        if 0 >= self.count:
+            return
+        logger.info(_('zsnd.dropout_summary') % {'count': self.count,
+                'removed': f'{self.total_length_in_seconds:.3f}',
+                'longest': f'{self.longest_in_seconds:.3f}'})
+        logger.info(_('zsnd.dropout_histogram') % ', '.join(
+                f'{label}: {count}' for label, count in self._iterate_histogram() if 0 < count))
+
+    def _log_dropout(self, abs_zero_run_start: int, zero_run_length: int, frame_rate: int):
+        if 0 < self._num_suppressed:
+            self.get_logger().info(_('zsnd.dropouts_not_shown') % self._num_suppressed)
+            self._num_suppressed = 0
+        self.get_logger().info(_('zsnd.zero_sound_detected') % {
+                'abs_start': format_num_samples_in_seconds(abs_zero_run_start, frame_rate),
+                'abs_end': format_num_samples_in_seconds(abs_zero_run_start + zero_run_length,
+                        frame_rate),
+                'length': zero_run_length})
+        self.get_logger().debug(f'(at sample {abs_zero_run_start})')
+
+    def _iterate_histogram(self):
+        bounds = self.lengths.bounds
+        for bound, count in zip(bounds, self.lengths.counts):
+            yield (f'<={bound * 1000:g}ms' if 1.0 > bound else f'<={bound:g}s'), count
+        yield f'>{bounds[-1]:g}s', self.lengths.counts[-1]
+
+class ZsndDropoutReportWriter(DropoutListener, ZsndLogMixin):
+    '''
+    Writes a record of each dropout to a file as it is found, as JSON Lines or CSV.
+
+    Nothing is kept in memory, so a report of millions of dropouts costs no more than one.
+    '''
+    FORMAT_JSONL = 'jsonl'
+    FORMAT_CSV = 'csv'
+    FIELDS = ('input_start', 'input_end', 'length', 'start_seconds', 'length_seconds',
+            'output_start', 'peak_level', 'peak_dbfs')
+
+    wants_details = True
+
+    def __init__(self, f: io.TextIOBase, report_format: str, wave_format: WaveFormat,
+            sample_rate: int):
+        '''
+        :param report_format: FORMAT_JSONL or FORMAT_CSV
+        '''
+        self._f = f
+        self._format = report_format
+        self._meter = ZsndPeakMeter(wave_format)
+        self._sample_rate = sample_rate
+        self._csv_writer = None
+        if self.FORMAT_CSV == report_format:
+            self._csv_writer = csv.writer(f)
+            self._csv_writer.writerow(self.FIELDS)
+        self.count = 0
+
+    @classmethod
+    def open(cls, path: str, wave_format: WaveFormat, sample_rate: int) \
+            -> 'ZsndDropoutReportWriter':
+        '''
+        Writes CSV to a path ending with ".csv", or JSON Lines otherwise.
+        '''
+        is_csv = '.csv' == os.path.splitext(path)[1].lower()
+        f = io.open(path, 'w', encoding='utf-8', newline='' if is_csv else None)
+        return cls(f, cls.FORMAT_CSV if is_csv else cls.FORMAT_JSONL, wave_format, sample_rate)
+
+    @override
+    def on_dropout(self, input_start, length):
+        pass
+
+    @override
+    def on_dropout_details(self, input_start, length, output_start, peak_level):
+        peak_dbfs = self._meter.to_dbfs(peak_level)
+        record = (input_start, input_start + length, length,
+                round(input_start / self._sample_rate, 6), round(length / self._sample_rate, 6),
+                output_start, peak_level,
+                None if peak_dbfs is None else round(peak_dbfs, 2))
+        if self._csv_writer is not None:
+            self._csv_writer.writerow('' if value is None else value for value in record)
+        else:
+            self._f.write(json.dumps(dict(zip(self.FIELDS, record))) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._f.close()
+        self.get_logger().debug(f'{self.count} dropouts reported')
@@ -0,0 +1,323 @@
+from service import StripZsndService, DropoutListener
+from memory import ZsndMemoryBudget
+from wav_io import ZsndWavReader, ZsndStreamingWavWriter
+from wav_logic import ZsndBackendProfile, BACKEND_AUTO
+from util import ZsndLogMixin, ZsndError
+
+from i18n import t as _
+import http.server
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import urllib.parse
+from typing_extensions import override
+
+class _ZsndChunkedBodyReader(io.RawIOBase):
+    '''
+    Decodes a request body sent with "Transfer-Encoding: chunked".
+    '''
+    def __init__(self, f: io.BufferedIOBase):
+        self._f = f
+        self._remaining = 0
+        self._eof = False
+
+    @override
+    def readable(self):
+        return True
+
+    @override
+    def readinto(self, b):
+        if self._eof:
+            return 0
+        if 0 == self._remaining:
+            size_line = self._f.readline(1024)
+            if not size_line:
+                raise ZsndError('unexpected end of the chunked body')
+            self._remaining = int(size_line.split(b';', 1)[0].strip(), 16)
+            if 0 == self._remaining:
+                self._eof = True
+                # trailers
+                while self._f.readline(1024).strip():
+                    pass
+                return 0
+        data = self._f.read(min(len(b), self._remaining))
+        if not data:
+            raise ZsndError('unexpected end of the chunked body')
+        b[:len(data)] = data
+        self._remaining -= len(data)
+        if 0 == self._remaining:
+            self._f.readline(1024)  # CRLF after the chunk data
+        return len(data)
+
+class _ZsndLengthLimitedReader(io.RawIOBase):
+    def __init__(self, f: io.BufferedIOBase, length: int):
+        self._f = f
+        self._remaining = length
+
+    @override
+    def readable(self):
+        return True
+
+    @override
+    def readinto(self, b):
+        if 0 >= self._remaining:
+            return 0
+        data = self._f.read(min(len(b), self._remaining))
+        b[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+class _ZsndChunkedResponseWriter(io.RawIOBase):
+    '''
+    Encodes a response body with "Transfer-Encoding: chunked".
+    Wrap it with io.BufferedWriter so that the chunks are not too small.
+    '''
+    def __init__(self, f: io.BufferedIOBase):
+        self._f = f
+
+    @override
+    def writable(self):
+        return True
+
+    @override
+    def write(self, b):
+        if 0 < len(b):
+            self._f.write(b'%x\r\n' % len(b))
+            self._f.write(b)
+            self._f.write(b'\r\n')
+        return len(b)
+
+    def finish(self):
+        self._f.write(b'0\r\n\r\n')
+        self._f.flush()
+
+class _ZsndDropoutStreamer(DropoutListener):
+    '''
+    Writes the elements of the JSON array of dropouts as soon as they are found.
+    '''
+    def __init__(self, out: io.BufferedIOBase, sample_rate: int):
+        self._out = out
+        self._sample_rate = sample_rate
+        self.count = 0
+
+    @override
+    def on_dropout(self, input_start, length):
+        element = json.dumps({'start': input_start, 'length': length,
+                'start_seconds': input_start / self._sample_rate,
+                'length_seconds': length / self._sample_rate})
+        self._out.write(((',' if self.count else '') + element).encode('utf-8'))
+        self.count += 1
+
+class ZsndRequestHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    POST /strip   WAV in, stripped WAV out
+    POST /detect  WAV in, JSON dropout report out
+
+    Query parameters `duration` and `threshold` override the defaults of the server.
+    '''
+    protocol_version = 'HTTP/1.1'
+    server: 'ZsndStripServer._HttpServerMixin'
+    _BUFFER_SIZE = 64 * 1024
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path not in ('/strip', '/detect'):
+            self._send_error(404, f'unknown path: {url.path}')
+            return
+        try:
+            min_duration, threshold = self._parse_params(url.query)
+        except ValueError as exc:
+            self._send_error(400, str(exc))
+            return
+        body = self._open_body()
+        if body is None:
+            self._send_error(411, 'Content-Length or chunked Transfer-Encoding is required')
+            return
+
+        with self.server.zsnd.get_job_slots():
+            try:
+                reader = ZsndWavReader(body)
+            except ZsndError as exc:
+                self._send_error(400, str(exc))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type',
+                    'audio/wav' if '/strip' == url.path else 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+
+            raw_out = _ZsndChunkedResponseWriter(self.wfile)
+            out = io.BufferedWriter(raw_out, self._BUFFER_SIZE)
+            try:
+                if '/strip' == url.path:
+                    self._strip(reader, out, min_duration, threshold)
+                else:
+                    self._detect(reader, out, min_duration, threshold)
+                out.flush()
+                raw_out.finish()
+            except (BrokenPipeError, ConnectionResetError):
+                self.server.zsnd.get_logger().debug(f'{self.client_address}: disconnected')
+            except Exception as exc:
+                # the status has been sent; the missing last chunk tells the client it failed
+                self.server.zsnd.get_logger().error(f'{self.requestline}: {exc!r}')
+
+    def _strip(self, reader: ZsndWavReader, out: io.BufferedIOBase, min_duration: int,
+            threshold: float):
+        wave_format = reader.get_wave_format()
+        writer = ZsndStreamingWavWriter(out, wave_format.get_bytes_per_sample(),
+                reader.get_sample_rate(), wave_format.get_plain_format_tag())
+        for _progress in self.server.zsnd.service.strip(reader, writer, min_duration, threshold):
+            pass
+        writer.close()
+
+    def _detect(self, reader: ZsndWavReader, out: io.BufferedIOBase, min_duration: int,
+            threshold: float):
+        sample_rate = reader.get_sample_rate()
+        streamer = _ZsndDropoutStreamer(out, sample_rate)
+        out.write(b'{"dropouts": [')
+        for _progress in self.server.zsnd.service.strip(reader, None, min_duration, threshold,
+                True, (streamer,)):
+            pass
+        out.write(('], ' + json.dumps({'count': streamer.count, 'sample_rate': sample_rate,
+                'frames': reader.count_frames()})[1:]).encode('utf-8'))
+
+    def _parse_params(self, query: str) -> tuple[int, float]:
+        '''
+        :raises ValueError:
+        '''
+        params = urllib.parse.parse_qs(query)
+        min_duration = int(params.get('duration', [self.server.zsnd.min_duration])[-1])
+        threshold = float(params.get('threshold', [self.server.zsnd.threshold])[-1])
+        if 0 >= min_duration:
+            raise ValueError(f'duration must be positive: {min_duration}')
+        if -10.0 < threshold:
+            raise ValueError(f'threshold must be -10.0 or less: {threshold}')
+        return min_duration, threshold
+
+    def _open_body(self) -> io.BufferedReader|None:
+        if 'chunked' == self.headers.get('Transfer-Encoding', '').lower():
+            raw = _ZsndChunkedBodyReader(self.rfile)
+        elif self.headers.get('Content-Length') is not None:
+            raw = _ZsndLengthLimitedReader(self.rfile, int(self.headers['Content-Length']))
+        else:
+            return None
+        return io.BufferedReader(raw, self._BUFFER_SIZE)
+
+    def _send_error(self, code: int, message: str):
+        body = json.dumps({'error': message}).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        self.wfile.write(body)
+
+    @override
+    def address_string(self):
+        # a Unix domain socket has no address of the client
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return 'unix'
+
+    @override
+    def log_message(self, format, *args):
+        self.server.zsnd.get_logger().info(f'{self.address_string()} {format % args}')
+
+class ZsndStripServer(ZsndLogMixin):
+    '''
+    Strips WAV files streamed over HTTP, on a Unix domain socket or a localhost port.
+
+    Requests are handled by threads, at most `num_jobs` of them at once.
+    The service and its predicates are shared by all requests.
+    '''
+    class _HttpServerMixin:
+        daemon_threads = True
+        zsnd: 'ZsndStripServer'
+
+    class _TcpServer(_HttpServerMixin, http.server.ThreadingHTTPServer):
+        pass
+
+    if hasattr(socketserver, 'UnixStreamServer'):  # not on Windows
+        class _UnixServer(_HttpServerMixin, socketserver.ThreadingMixIn,
+                socketserver.UnixStreamServer):
+            pass
+
+    # the largest sample, as any format may be requested
+    _MAX_BYTES_PER_SAMPLE = 8
+
+    def __init__(self, num_jobs: int, min_duration: int, threshold: float,
+            memory_limit: int|None = None, backend: str = BACKEND_AUTO,
+            backend_profile: ZsndBackendProfile|None = None):
+        '''
+        :param memory_limit: in bytes. Fewer jobs and smaller chunks are used to fit in it.
+        :param backend: see WavZeroSoundPredicateFactory
+        :param backend_profile: see WavZeroSoundPredicateFactory
+        :raises ZsndError: when not even one job fits in `memory_limit`
+        '''
+        self.min_duration = min_duration
+        self.threshold = threshold
+        chunk_size = StripZsndService._CHUNK_SIZE
+        if memory_limit is not None:
+            budget = ZsndMemoryBudget(memory_limit)
+            num_jobs = budget.fit_jobs(num_jobs,
+                    ZsndMemoryBudget.get_min_job_size(self._MAX_BYTES_PER_SAMPLE)
+                    + 2 * ZsndRequestHandler._BUFFER_SIZE)
+            budget = ZsndMemoryBudget(memory_limit, num_jobs, budget.baseline)
+            chunk_size = budget.get_chunk_frames(self._MAX_BYTES_PER_SAMPLE, chunk_size)
+        self.num_jobs = num_jobs
+        self.service = StripZsndService(quiet=True, chunk_size=chunk_size, backend=backend,
+                backend_profile=backend_profile)
+        self._jobs = threading.BoundedSemaphore(num_jobs)
+        self._server: ZsndStripServer._HttpServerMixin|None = None
+
+    def get_job_slots(self) -> threading.BoundedSemaphore:
+        '''
+        Hold one while processing a request.
+        '''
+        return self._jobs
+
+    def bind_tcp(self, host: str, port: int) -> tuple[str, int]:
+        self._server = self._TcpServer((host, port), ZsndRequestHandler)
+        self._server.zsnd = self
+        return self._server.server_address[:2]
+
+    def bind_unix(self, path: str):
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            # left by a server which did not exit cleanly
+            self._remove_stale_socket(path)
+        self._server = self._UnixServer(path, ZsndRequestHandler)
+        self._server.zsnd = self
+
+    def serve_forever(self):
+        assert self._server is not None
+        try:
+            self._server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        self._server.shutdown()
+
+    def close(self):
+        if self._server is None:
+            return
+        self._server.server_close()
+        if isinstance(self._server.server_address, str) and os.path.exists(self._server.server_address):
+            os.remove(self._server.server_address)
+        self._server = None
+
+    def _remove_stale_socket(self, path: str):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            try:
+                s.connect(path)
+            except ConnectionRefusedError:
+                os.remove(path)
+                return
+        raise ZsndError(_('zsnd.socket_in_use') % path)
@@ -1,17 +1,147 @@
-from wav_logic import WavZeroSoundPredicateFactory
+from wav_logic import WavZeroSoundPredicateFactory, ZsndBackendProfile, BACKEND_AUTO
 from wav_io import ZsndWavChunk, ZsndWavReader, ZsndWavWriter, ZeroSoundPredicate
+from envelope import ZsndPeakMeter
+from dropout_runs import ZsndDropoutRuns
 from util import LogMixin
 
 from i18n import t as _
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import Iterable
+from typing_extensions import override
+
+def format_num_samples_in_seconds(num_samples: int, frame_rate: int) -> str:
+    total_ms = num_samples * 1000 // frame_rate
+    minutes, ms = divmod(total_ms, 60_000)
+    seconds, ms = divmod(ms, 1000)
+    return f'{minutes:02}:{seconds:02}.{ms:03}'
+
+@dataclass
+class ZsndPosition:
+    '''
+    A position in an input, either in frames or in seconds.
+    '''
+    frames: int|None = None
+    seconds: float|None = None
+
+    @classmethod
+    def parse(cls, text: str) -> 'ZsndPosition':
+        '''
+        Parses a frame number like "5760000", or a time like "02:10:00", "10:00.5" or "90.5s".
+
+        :raises ValueError:
+        '''
+        text = text.strip()
+        if text.isdigit():
+            return cls(frames=int(text))
+        fields = text.removesuffix('s').split(':') if ':' in text or text.endswith('s') else []
+        if not 1 <= len(fields) <= 3:
+            raise ValueError(f'invalid position: {text!r}')
+        seconds = 0.0
+        for field in fields:
+            if not field or field.startswith(('-', '+')):
+                raise ValueError(f'invalid position: {text!r}')
+            seconds = seconds * 60 + float(field)
+        return cls(seconds=seconds)
+
+    def to_frames(self, frame_rate: int) -> int:
+        return self.frames if self.frames is not None else round(self.seconds * frame_rate)
+
+class DropoutListener(ABC):
+    # True to be notified through on_dropout_details() too, which costs measuring the peaks
+    wants_details = False
+
+    @abstractmethod
+    def on_dropout(self, input_start: int, length: int):
+        """
+        :param input_start: position of the zero run in the input, in frames
+        """
+        pass
+
+    def on_dropout_details(self, input_start: int, length: int, output_start: int|None,
+            peak_level: int|float):
+        """
+        Called after on_dropout() if `wants_details`.
+
+        :param output_start: position in the output where the zero run was removed, in frames,
+                or None without an output
+        :param peak_level: the largest absolute amplitude in the zero run,
+                in the units of ZeroSoundPredicate.get_max_level()
+        """
+        pass
+
+    def is_satisfied(self) -> bool:
+        """
+        Returning True stops the scan early.
+        """
+        return False
+
+class DropoutCollector(DropoutListener):
+    def __init__(self, limit: int|None = None):
+        self.dropouts = ZsndDropoutRuns()
+        self._limit = limit
+
+    @override
+    def on_dropout(self, input_start, length):
+        self.dropouts.append(input_start, length)
+
+    @override
+    def is_satisfied(self):
+        return self._limit is not None and len(self.dropouts) >= self._limit
+
+class DropoutCounter(DropoutListener):
+    def __init__(self):
+        self.count = 0
+        self.total_length = 0
+
+    @override
+    def on_dropout(self, input_start, length):
+        self.count += 1
+        self.total_length += length
+
+@dataclass
+class StripZsndState:
+    '''
+    Progress of StripZsndService.strip(), consistent whenever it yields.
+    '''
+    pos: int = 0
+    num_prev_trailing_zeros: int = 0
+    # peak level of the trailing zeros, measured only for DropoutListener.wants_details
+    prev_trailing_peak: int|float = 0
+    # the trailing zeros, held with an output while too short to be a dropout,
+    # to be written if the zero run ends short
+    prev_trailing_bytes: bytes = b''
 
 class StripZsndService(LogMixin):
     _CHUNK_SIZE = 8192
 
+    def __init__(self, quiet: bool = False, chunk_size: int = _CHUNK_SIZE, strided: bool = False,
+            reporter: 'ZsndDropoutReporter|None' = None, backend: str = BACKEND_AUTO,
+            backend_profile: ZsndBackendProfile|None = None):
+        '''
+        :param quiet: does not log each dropout
+        :param reporter: logs the dropouts instead, e.g. with a rate limit
+        :param chunk_size: frames read at once
+        :param strided: tests every `min_duration` samples for zero runs, and then their neighbors.
+                Faster on mostly clean audio, with the same results.
+        :param backend: see WavZeroSoundPredicateFactory
+        :param backend_profile: see WavZeroSoundPredicateFactory
+        '''
+        self._quiet = quiet
+        self._chunk_size = chunk_size
+        self._strided = strided
+        self._reporter = reporter
+        self._predicate_factory = WavZeroSoundPredicateFactory(backend, backend_profile)
+
     def strip(self, reader: ZsndWavReader, writer: ZsndWavWriter|None,
-                min_duration_in_ms: int = 10, threshold: float = -80.0, detect_only: bool = False) \
-            -> Iterable[tuple[int, int]]:
+                min_duration_in_ms: int = 10, threshold: float = -80.0, detect_only: bool = False,
+                listeners: Iterable[DropoutListener] = (), state: StripZsndState|None = None,
+                end: int|None = None) -> Iterable[tuple[int, int]]:
         '''
+        :param listeners: notified of every dropout with its position in the input
+        :param state: updated as the processing goes. Pass a saved one to resume from it,
+                or one at a frame to start from.
+        :param end: the frame to stop at. Zero runs over it are cut at it.
         :rtype: Iterable[tuple[int, int]] yield (postion, total)
         '''
         logger = self.get_logger()
@@ -23,49 +153,154 @@ class StripZsndService(LogMixin):
 
         min_duration_in_samples = (sample_rate * min_duration_in_ms) // 1000
 
-        zero_sound_predicate = WavZeroSoundPredicateFactory().create(reader, threshold)
+        zero_sound_predicate = self._predicate_factory.create(reader, threshold)
+        listeners = tuple(listeners)
+        meter = self._create_peak_meter(reader, listeners)
+
+        state = state if state is not None else StripZsndState()
+        if 0 < state.pos:
+            logger.debug(f'Resuming from frame {state.pos}')
+            reader.setpos(state.pos)
+        if end is not None:
+            num_frames = min(num_frames, end)
 
-        pos = 0
-        num_prev_trailing_zeros = 0
-        while (pos < num_frames):
-            logger.trace(f'Position: frame {pos}')
-            chunk = reader.read(self._CHUNK_SIZE)
+        while (state.pos < num_frames):
+            logger.trace(f'Position: frame {state.pos}')
+            chunk = reader.read(self._chunk_size)
             if 0 >= len(chunk):  # EOF
                 break
+            if end is not None and state.pos + len(chunk) > end:
+                # a whole chunk is read for the readers reading ahead in chunks
+                chunk = ZsndWavChunk(chunk[0 : end - state.pos],
+                        reader.get_wave_format().get_bytes_per_sample())
 
-            num_prev_trailing_zeros = self._collapse_chunk(chunk, num_prev_trailing_zeros, pos,
-                    zero_sound_predicate, writer, sample_rate, min_duration_in_samples)
+            self._collapse_chunk(chunk, state, zero_sound_predicate, writer, sample_rate,
+                    min_duration_in_samples, listeners, meter)
 
-            pos += len(chunk)
-            yield reader.tell(), reader.count_frames()
+            state.pos += len(chunk)
+            if end is None:
+                yield reader.tell(), reader.count_frames()
+            else:
+                yield state.pos, min(reader.count_frames(), end)
+            if any(listener.is_satisfied() for listener in listeners):
+                logger.debug(f'Stopped at frame {state.pos}')
+                return
+        pos = state.pos
+        num_prev_trailing_zeros = state.num_prev_trailing_zeros
+        num_frames = reader.count_frames()  # known at EOF for a stream of unknown length
+        if end is not None:
+            num_frames = min(num_frames, end)
         if pos != num_frames:
             self.get_logger().warning(
                     f'Processed data length "{pos}" does not match the length calculated at the start "{num_frames}]"')
         if num_prev_trailing_zeros >= min_duration_in_samples:
-            self._report_dropout(pos - num_prev_trailing_zeros, num_prev_trailing_zeros, sample_rate)
+            self._notify_dropout(listeners, pos - num_prev_trailing_zeros, num_prev_trailing_zeros,
+                    pos - num_prev_trailing_zeros, sample_rate,
+                    None if writer is None else writer.tell(), state.prev_trailing_peak)
+        elif writer:
+            writer.write(state.prev_trailing_bytes)
+
+    def detect_with_envelope(self, reader: ZsndWavReader, envelope: 'ZsndPeakEnvelope',
+                min_duration_in_ms: int = 10, threshold: float = -80.0,
+                listeners: Iterable[DropoutListener] = ()) -> Iterable[tuple[int, int]]:
+        '''
+        Detects the same dropouts as strip() in the detect-only mode, reading only the blocks
+        around the ones which the envelope shows to be all zero sound.
+
+        A run of 2 * BLOCK_SIZE - 1 samples or longer contains a whole block, so shorter
+        durations fall back to strip().
+
+        :rtype: Iterable[tuple[int, int]] yield (postion, total)
+        '''
+        sample_rate = reader.get_sample_rate()
+        num_frames = reader.count_frames()
+        min_duration_in_samples = (sample_rate * min_duration_in_ms) // 1000
+        if min_duration_in_samples < 2 * envelope.BLOCK_SIZE - 1:
+            self.get_logger().debug(f'{min_duration_in_samples} samples are too short for the envelope')
+            yield from self.strip(reader, None, min_duration_in_ms, threshold, True, listeners)
+            return
+
+        zero_sound_predicate = self._predicate_factory.create(reader, threshold)
+        listeners = tuple(listeners)
+        meter = self._create_peak_meter(reader, listeners)
+        for start, end in envelope.iterate_zero_blocks(zero_sound_predicate.get_max_level()):
+            peak = 0 if meter is None else envelope.get_peak_level(start, end)
+            if 0 < start:
+                # the block before is not all zero sound
+                reader.setpos(start - envelope.BLOCK_SIZE)
+                block = reader.read(envelope.BLOCK_SIZE)
+                num_zeros = block.count_trailing_zeros(zero_sound_predicate)
+                start -= num_zeros
+                if meter is not None:
+                    peak = max(peak, meter.measure(block[len(block) - num_zeros : len(block)]))
+            if end < num_frames:
+                reader.setpos(end)
+                block = reader.read(envelope.BLOCK_SIZE)
+                num_zeros = block.count_leading_zeros(zero_sound_predicate)
+                end += num_zeros
+                if meter is not None:
+                    peak = max(peak, meter.measure(block[0:num_zeros]))
+            if end - start >= min_duration_in_samples:
+                self._notify_dropout(listeners, start, end - start, start, sample_rate, None, peak)
+            yield end, num_frames
+            if any(listener.is_satisfied() for listener in listeners):
+                return
+        yield num_frames, num_frames
+
+    def _create_peak_meter(self, reader: ZsndWavReader,
+            listeners: tuple[DropoutListener, ...]) -> ZsndPeakMeter|None:
+        if not any(listener.wants_details for listener in listeners):
+            return None
+        return ZsndPeakMeter(reader.get_wave_format())
 
-    def _collapse_chunk(self, chunk: ZsndWavChunk, num_prev_trailing_zeros: int, pos: int,
+    def _collapse_chunk(self, chunk: ZsndWavChunk, state: StripZsndState,
                 zero_sound_predicate: ZeroSoundPredicate, writer: ZsndWavWriter,
-                sample_rate: int, min_duration_in_samples: int):
+                sample_rate: int, min_duration_in_samples: int,
+                listeners: tuple[DropoutListener, ...] = (), meter: ZsndPeakMeter|None = None):
+        '''
+        Updates the trailing zeros of `state`, but not its position.
+        '''
         logger = self.get_logger()
+        pos = state.pos
+        num_prev_trailing_zeros = state.num_prev_trailing_zeros
 
         num_leading_zeros = chunk.count_leading_zeros(zero_sound_predicate)
         logger.trace(f'Leading zeros: {num_leading_zeros}')
         zero_run_length = num_prev_trailing_zeros + num_leading_zeros
+        zero_run_peak = 0
+        if meter is not None:
+            zero_run_peak = max(state.prev_trailing_peak, meter.measure(chunk[0:num_leading_zeros]))
         if len(chunk) <= num_leading_zeros:
-            # all of the chunk is dropped
-            return zero_run_length
-        if zero_run_length >= min_duration_in_samples:
-            self._report_dropout(pos - num_prev_trailing_zeros, zero_run_length, sample_rate)
-
+            # all of the chunk is held, or dropped
+            state.num_prev_trailing_zeros = zero_run_length
+            state.prev_trailing_peak = zero_run_peak
+            state.prev_trailing_bytes = self._hold_short_zeros(state.prev_trailing_bytes,
+                    chunk[0:len(chunk)], writer, zero_run_length, min_duration_in_samples)
+            return
         processed_samples = num_leading_zeros
-        for zero_run_start, zero_run_length \
-                in chunk.iterate_inner_zero_runs(zero_sound_predicate):
+        if zero_run_length >= min_duration_in_samples:
+            self._notify_dropout(listeners, pos - num_prev_trailing_zeros, zero_run_length,
+                    pos - num_prev_trailing_zeros, sample_rate,
+                    None if writer is None else writer.tell(), zero_run_peak)
+        elif writer:
+            # too short to be a dropout, written with the frames after it
+            writer.write(state.prev_trailing_bytes)
+            processed_samples = 0
+        if self._strided:
+            inner_zero_runs = chunk.iterate_inner_zero_runs_strided(zero_sound_predicate,
+                    min_duration_in_samples)
+        else:
+            inner_zero_runs = chunk.iterate_inner_zero_runs(zero_sound_predicate)
+        for zero_run_start, zero_run_length in inner_zero_runs:
             if zero_run_length < min_duration_in_samples:
                 continue
-            self._report_dropout(
+            self._notify_dropout(listeners, pos + zero_run_start, zero_run_length,
                 (pos + zero_run_start) if writer is None else writer.tell(),
-                zero_run_length, sample_rate)
+                sample_rate,
+                # the frames before it in the chunk are not written yet
+                None if writer is None else writer.tell() + zero_run_start - processed_samples,
+                0 if meter is None else meter.measure(
+                        chunk[zero_run_start : zero_run_start + zero_run_length]))
             if writer:
                 sliced = chunk[processed_samples : zero_run_start]
                 logger.trace(f'writing {len(sliced)} bytes data')
@@ -78,9 +313,35 @@ class StripZsndService(LogMixin):
             sliced = chunk[processed_samples : len(chunk) - num_trailing_zeros]
             logger.trace(f'writing {len(sliced)} bytes data')
             writer.write(sliced)
-        return num_trailing_zeros
+        state.num_prev_trailing_zeros = num_trailing_zeros
+        state.prev_trailing_peak = 0 if meter is None \
+                else meter.measure(chunk[len(chunk) - num_trailing_zeros : len(chunk)])
+        state.prev_trailing_bytes = self._hold_short_zeros(b'',
+                chunk[len(chunk) - num_trailing_zeros : len(chunk)], writer, num_trailing_zeros,
+                min_duration_in_samples)
+
+    @staticmethod
+    def _hold_short_zeros(held: bytes, zeros: bytes, writer: ZsndWavWriter|None,
+            zero_run_length: int, min_duration_in_samples: int) -> bytes:
+        if writer is None or zero_run_length >= min_duration_in_samples:
+            return b''
+        return held + bytes(zeros)
+
+    def _notify_dropout(self, listeners: tuple[DropoutListener, ...], input_start: int,
+            zero_run_length: int, reported_start: int, frame_rate: int,
+            output_start: int|None = None, peak_level: int|float = 0):
+        if not self._quiet:
+            self._report_dropout(reported_start, zero_run_length, frame_rate)
+        for listener in listeners:
+            listener.on_dropout(input_start, zero_run_length)
+            if listener.wants_details:
+                listener.on_dropout_details(input_start, zero_run_length, output_start,
+                        peak_level)
 
     def _report_dropout(self, abs_zero_run_start: int, zero_run_length: int, frame_rate: int):
+        if self._reporter is not None:
+            self._reporter.report(abs_zero_run_start, zero_run_length, frame_rate)
+            return
         logger = self.get_logger()
         s_abs_start = self._format_num_samples_in_seconds(abs_zero_run_start, frame_rate)
         s_abs_end = self._format_num_samples_in_seconds(abs_zero_run_start + zero_run_length, frame_rate)
@@ -89,7 +350,4 @@ class StripZsndService(LogMixin):
         logger.debug(f'(at sample {abs_zero_run_start})')
 
     def _format_num_samples_in_seconds(self, num_samples: int, frame_rate: int):
-        total_ms = num_samples * 1000 // frame_rate
-        minutes, ms = divmod(total_ms, 60_000)
-        seconds, ms = divmod(ms, 1000)
-        return f'{minutes:02}:{seconds:02}.{ms:03}'
+        return format_num_samples_in_seconds(num_samples, frame_rate)
@@ -0,0 +1,146 @@
+from wav_logic import WavZeroSoundPredicateFactory, ZsndBackendProfile, BACKEND_AUTO
+from wav_io import ZsndWavReader, ZeroSoundPredicate
+from util import ZsndLogMixin
+
+from dataclasses import dataclass, field
+from typing import Iterable
+
+@dataclass
+class ZsndSweepResult:
+    '''
+    Dropouts found with each combination of a threshold and a minimum duration.
+
+    `counts[i][j]` and `removed[i][j]` are for `thresholds[i]` and `durations[j]`.
+    '''
+    thresholds: list[float]
+    durations: list[int]
+    sample_rate: int
+    counts: list[list[int]] = field(default_factory=list)
+    # in frames
+    removed: list[list[int]] = field(default_factory=list)
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [[0] * len(self.durations) for _t in self.thresholds]
+        if not self.removed:
+            self.removed = [[0] * len(self.durations) for _t in self.thresholds]
+
+class _ZsndZeroRunTracker:
+    '''
+    Joins the zero runs of a threshold across chunks, and counts them for each duration.
+    '''
+    def __init__(self, min_lengths: list[int], counts: list[int], removed: list[int]):
+        '''
+        :param min_lengths: in frames, in ascending order
+        '''
+        self._min_lengths = min_lengths
+        self._counts = counts
+        self._removed = removed
+        # length of the run touching the end of the last chunk
+        self._open_length = 0
+
+    def add_chunk(self, runs: list[tuple[int, int]], chunk_length: int):
+        '''
+        :param runs: maximal zero runs of the chunk, in order
+        '''
+        if 0 < self._open_length and (not runs or 0 != runs[0][0]):
+            self._close(self._open_length)
+            self._open_length = 0
+        for start, length in runs:
+            touches_end = start + length >= chunk_length
+            if 0 == start:
+                length += self._open_length
+            self._open_length = 0
+            if touches_end:
+                self._open_length = length
+            else:
+                self._close(length)
+
+    def finish(self):
+        if 0 < self._open_length:
+            self._close(self._open_length)
+            self._open_length = 0
+
+    def _close(self, length: int):
+        for i, min_length in enumerate(self._min_lengths):
+            if length < min_length:
+                break
+            self._counts[i] += 1
+            self._removed[i] += length
+
+class ZsndParameterSweep(ZsndLogMixin):
+    '''
+    Detects dropouts with several thresholds and minimum durations in a single read pass.
+
+    A sample within a threshold is within every higher one, so each threshold only scans
+    the zero runs of the next higher one; on mostly clean audio, all of them cost about
+    as much as the highest alone. The durations only filter the runs found.
+    '''
+    def __init__(self, thresholds: Iterable[float], durations_in_ms: Iterable[int],
+            chunk_size: int, backend: str = BACKEND_AUTO,
+            backend_profile: ZsndBackendProfile|None = None):
+        '''
+        :param chunk_size: frames read at once
+        :param backend: see WavZeroSoundPredicateFactory
+        :param backend_profile: see WavZeroSoundPredicateFactory
+        '''
+        self.thresholds = sorted(set(thresholds), reverse=True)
+        self.durations = sorted(set(durations_in_ms))
+        self._chunk_size = chunk_size
+        self._predicate_factory = WavZeroSoundPredicateFactory(backend, backend_profile)
+        self.result: ZsndSweepResult|None = None
+
+    def sweep(self, reader: ZsndWavReader) -> Iterable[tuple[int, int]]:
+        '''
+        Fills `result` as the processing goes.
+
+        :rtype: Iterable[tuple[int, int]] yield (postion, total)
+        '''
+        sample_rate = reader.get_sample_rate()
+        bytes_per_sample = reader.get_wave_format().get_bytes_per_sample()
+        self.result = ZsndSweepResult(self.thresholds, self.durations, sample_rate)
+        min_lengths = [(sample_rate * duration) // 1000 for duration in self.durations]
+        predicates = [self._predicate_factory.create(reader, threshold)
+                for threshold in self.thresholds]
+        trackers = [_ZsndZeroRunTracker(min_lengths, self.result.counts[i],
+                self.result.removed[i]) for i in range(len(self.thresholds))]
+
+        while True:
+            chunk = reader.read(self._chunk_size)
+            chunk_length = len(chunk)
+            if 0 >= chunk_length:  # EOF
+                break
+            frames_as_bytes = chunk[0:chunk_length]
+            runs = [(0, chunk_length)]
+            for predicate, tracker in zip(predicates, trackers):
+                runs = list(self._iterate_zero_runs(frames_as_bytes, bytes_per_sample,
+                        predicate, runs))
+                tracker.add_chunk(runs, chunk_length)
+            yield reader.tell(), reader.count_frames()
+        for tracker in trackers:
+            tracker.finish()
+
+    @staticmethod
+    def _iterate_zero_runs(frames_as_bytes: bytes, bytes_per_sample: int,
+            predicate: ZeroSoundPredicate, ranges: Iterable[tuple[int, int]]):
+        '''
+        Yields the maximal zero runs within each of `ranges`, as (start, length) in frames.
+        '''
+        for range_start, range_length in ranges:
+            range_end = range_start + range_length
+            if predicate.bulk:
+                yield from ((range_start + start, length) for start, length
+                        in predicate.find_zero_runs(frames_as_bytes[
+                                range_start * bytes_per_sample : range_end * bytes_per_sample],
+                                bytes_per_sample))
+                continue
+            run_start = None
+            for i in range(range_start, range_end):
+                if predicate.is_zero_sound_sample(frames_as_bytes, i * bytes_per_sample):
+                    if run_start is None:
+                        run_start = i
+                elif run_start is not None:
+                    yield (run_start, i - run_start)
+                    run_start = None
+            if run_start is not None:
+                yield (run_start, range_end - run_start)
@@ -0,0 +1,254 @@
+from wav_io import ZsndWavWriter
+from wave_format import WaveFormat
+from util import ZsndLogMixin, ZsndError
+
+from i18n import t as _
+from array import array
+import io
+import json
+import math
+import random
+import sys
+from dataclasses import dataclass, asdict
+from typing import Iterable
+
+try:
+    import numpy as np
+except ImportError:  # generated sample by sample instead
+    np = None
+
+@dataclass(frozen=True)
+class ZsndSynthFormat:
+    name: str
+    bytes_per_sample: int
+    is_float: bool
+
+    def get_format_tag(self) -> int:
+        return WaveFormat.FORMAT_TAG_FLOAT if self.is_float else WaveFormat.FORMAT_TAG_PCM
+
+    def get_full_scale(self) -> int|float:
+        '''
+        :return: the largest level, in the units of ZeroSoundPredicate.get_max_level()
+        '''
+        return 1.0 if self.is_float else (1 << (8 * self.bytes_per_sample - 1)) - 1
+
+SYNTH_FORMATS = {synth_format.name: synth_format for synth_format in (
+        ZsndSynthFormat('int8', 1, False),
+        ZsndSynthFormat('int16', 2, False),
+        ZsndSynthFormat('int24', 3, False),
+        ZsndSynthFormat('int32', 4, False),
+        ZsndSynthFormat('float32', 4, True),
+        ZsndSynthFormat('float64', 8, True))}
+
+@dataclass
+class ZsndSynthSpec:
+    '''
+    What ZsndSynthesizer generates: a signal which is never near silence,
+    with digital silence ("dropout") and faint noise ("noise") injected.
+    '''
+    DISTRIBUTION_UNIFORM = 'uniform'
+    DISTRIBUTION_LOG_UNIFORM = 'log-uniform'
+    DISTRIBUTIONS = (DISTRIBUTION_UNIFORM, DISTRIBUTION_LOG_UNIFORM)
+
+    format: ZsndSynthFormat
+    num_frames: int
+    sample_rate: int = 44100
+    num_dropouts: int = 100
+    num_noises: int = 0
+    # peak of the noise
+    noise_level: float = -90.0
+    # lengths of the injected regions, in ms
+    min_length: float = 5.0
+    max_length: float = 50.0
+    distribution: str = DISTRIBUTION_LOG_UNIFORM
+    seed: int = 0
+
+@dataclass(frozen=True)
+class ZsndSynthRegion:
+    KIND_DROPOUT = 'dropout'
+    KIND_NOISE = 'noise'
+
+    kind: str
+    # in frames
+    start: int
+    length: int
+    # the largest absolute amplitude, in the units of ZeroSoundPredicate.get_max_level()
+    peak_level: int|float
+
+class ZsndSynthesizer(ZsndLogMixin):
+    '''
+    Streams a synthetic recording with a known ground truth, in blocks.
+
+    The signal is at -26 dBFS or louder in every sample, so that only the injected regions
+    are detected at any threshold the CLI accepts. The regions depend only on the seed,
+    and the samples also on whether numpy is available.
+    '''
+    # the quietest and the loudest sample of the signal, relative to the full scale
+    SIGNAL_FLOOR = 0.05
+    SIGNAL_CEILING = 0.5
+    _BLOCK_SIZE = 1024 * 1024
+    # arrays of 64-bit values held at once while generating a block
+    NUM_BLOCK_ARRAYS = 4
+
+    def __init__(self, spec: ZsndSynthSpec, block_size: int = _BLOCK_SIZE):
+        '''
+        :param block_size: frames generated at once
+        '''
+        self._spec = spec
+        self._block_size = block_size
+        self.regions: list[ZsndSynthRegion] = []
+
+    def plan(self) -> list[ZsndSynthRegion]:
+        '''
+        Places the regions at random, apart by at least the shortest length.
+
+        :raises ZsndError: if they do not fit in the length
+        '''
+        spec = self._spec
+        rng = random.Random(spec.seed)
+        min_length = max(1, round(spec.sample_rate * spec.min_length / 1000))
+        max_length = max(min_length, round(spec.sample_rate * spec.max_length / 1000))
+        kinds = [ZsndSynthRegion.KIND_DROPOUT] * spec.num_dropouts \
+                + [ZsndSynthRegion.KIND_NOISE] * spec.num_noises
+        rng.shuffle(kinds)
+        lengths = [self._draw_length(rng, min_length, max_length) for _kind in kinds]
+        # gaps keep the regions from touching each other or the ends
+        min_gap = min_length
+        slack = spec.num_frames - sum(lengths) - (len(kinds) + 1) * min_gap
+        if slack < 0:
+            raise ZsndError(_('zsnd.synth_too_short') % {'n': len(kinds)})
+        cuts = sorted(rng.randint(0, slack) for _kind in kinds)
+        noise_peak = self._get_noise_peak()
+        self.regions = []
+        pos, prev_cut = 0, 0
+        for kind, length, cut in zip(kinds, lengths, cuts):
+            pos += min_gap + cut - prev_cut
+            prev_cut = cut
+            self.regions.append(ZsndSynthRegion(kind, pos, length,
+                    noise_peak if ZsndSynthRegion.KIND_NOISE == kind else 0))
+            pos += length
+        return self.regions
+
+    def synthesize(self, writer: ZsndWavWriter) -> Iterable[tuple[int, int]]:
+        '''
+        Writes the samples of the planned regions, and of the signal between them.
+
+        :rtype: Iterable[tuple[int, int]] yield (postion, total)
+        '''
+        spec = self._spec
+        generator = _NumpyBlockGenerator(spec) if np is not None else _PythonBlockGenerator(spec)
+        region_index = 0
+        for block_start in range(0, spec.num_frames, self._block_size):
+            block_end = min(block_start + self._block_size, spec.num_frames)
+            while region_index < len(self.regions) \
+                    and self.regions[region_index].start + self.regions[region_index].length \
+                            <= block_start:
+                region_index += 1
+            overlapping = []
+            for region in self.regions[region_index:]:
+                if region.start >= block_end:
+                    break
+                overlapping.append(region)
+            writer.write(generator.generate(block_start, block_end, overlapping))
+            yield block_end, spec.num_frames
+
+    def save_truth(self, f: io.TextIOBase):
+        spec = self._spec
+        json.dump({'format': spec.format.name, 'sample_rate': spec.sample_rate,
+                'num_frames': spec.num_frames, 'seed': spec.seed,
+                'full_scale': spec.format.get_full_scale(),
+                'regions': [asdict(region) for region in self.regions]}, f)
+        f.write('\n')
+
+    def _draw_length(self, rng: random.Random, min_length: int, max_length: int) -> int:
+        if ZsndSynthSpec.DISTRIBUTION_UNIFORM == self._spec.distribution:
+            return rng.randint(min_length, max_length)
+        # many short ones and a few long ones, like the dropouts of real recordings
+        return min(max_length, round(math.exp(rng.uniform(math.log(min_length),
+                math.log(max_length + 1)))))
+
+    def _get_noise_peak(self) -> int|float:
+        spec = self._spec
+        peak = spec.format.get_full_scale() * 10 ** (spec.noise_level / 20)
+        return peak if spec.format.is_float else int(peak)
+
+class _NumpyBlockGenerator:
+    def __init__(self, spec: ZsndSynthSpec):
+        self._format = spec.format
+        self._rng = np.random.default_rng(spec.seed)
+
+    def generate(self, start: int, end: int, regions: list[ZsndSynthRegion]) -> bytes:
+        synth_format = self._format
+        full_scale = synth_format.get_full_scale()
+        n = end - start
+        floor = ZsndSynthesizer.SIGNAL_FLOOR * full_scale
+        span = ZsndSynthesizer.SIGNAL_CEILING * full_scale - floor
+        if synth_format.is_float:
+            dtype = np.float32 if 4 == synth_format.bytes_per_sample else np.float64
+            samples = self._rng.random(n, dtype=dtype) * (2 * span) - span
+            # away from zero by the floor, keeping the sign
+            samples += np.copysign(floor, samples).astype(dtype)
+        else:
+            # integers are generated several times as fast as floats
+            floor, span = round(floor), round(span)
+            samples = self._rng.integers(-span, span + 1, n, dtype=np.int32)
+            samples += (np.sign(samples) | 1) * np.int32(floor)
+        for region in regions:
+            region_start = max(region.start, start) - start
+            region_end = min(region.start + region.length, end) - start
+            if 0 == region.peak_level:
+                samples[region_start:region_end] = 0
+            elif synth_format.is_float:
+                samples[region_start:region_end] = self._rng.uniform(-region.peak_level,
+                        region.peak_level, region_end - region_start)
+            else:
+                samples[region_start:region_end] = self._rng.integers(-region.peak_level,
+                        region.peak_level, region_end - region_start, endpoint=True)
+        match (synth_format.is_float, synth_format.bytes_per_sample):
+            case (True, 4):
+                return samples.astype('<f4', copy=False).tobytes()
+            case (True, 8):
+                return samples.astype('<f8', copy=False).tobytes()
+            case (False, 1):
+                return (samples + 0x80).astype(np.uint8).tobytes()
+            case (False, 3):
+                return samples.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+            case (False, bytes_per_sample):
+                return samples.astype(f'<i{bytes_per_sample}').tobytes()
+
+class _PythonBlockGenerator:
+    '''
+    Without numpy, about a hundred times slower.
+    '''
+    def __init__(self, spec: ZsndSynthSpec):
+        self._format = spec.format
+        self._rng = random.Random(spec.seed)
+
+    def generate(self, start: int, end: int, regions: list[ZsndSynthRegion]) -> bytes:
+        synth_format = self._format
+        full_scale = synth_format.get_full_scale()
+        rng = self._rng
+        floor, ceiling = ZsndSynthesizer.SIGNAL_FLOOR, ZsndSynthesizer.SIGNAL_CEILING
+        samples = [rng.choice((-1, 1)) * rng.uniform(floor, ceiling) * full_scale
+                for _i in range(end - start)]
+        for region in regions:
+            for i in range(max(region.start, start) - start,
+                    min(region.start + region.length, end) - start):
+                samples[i] = rng.uniform(-region.peak_level, region.peak_level)
+        if synth_format.is_float:
+            return self._to_bytes({4: 'f', 8: 'd'}[synth_format.bytes_per_sample], samples)
+        samples = [round(sample) for sample in samples]
+        match synth_format.bytes_per_sample:
+            case 1:
+                return bytes(sample + 0x80 for sample in samples)
+            case 3:
+                return b''.join(sample.to_bytes(3, 'little', signed=True) for sample in samples)
+            case bytes_per_sample:
+                return self._to_bytes({2: 'h', 4: 'i'}[bytes_per_sample], samples)
+
+    @staticmethod
+    def _to_bytes(typecode: str, samples: list) -> bytes:
+        values = array(typecode, samples)
+        if 'big' == sys.byteorder:
+            values.byteswap()
+        return values.tobytes()
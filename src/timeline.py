@@ -0,0 +1,107 @@
+from dropout_runs import write_int64_columns, map_int64_columns, unmap_int64_columns
+
+from array import array
+import bisect
+import io
+import mmap
+import struct
+from typing import Iterable
+
+class ZsndTimelineMap:
+    '''
+    Maps the frames of a stripped output to the frames of its input, and back.
+
+    It holds a splice point for each dropout removed: the output frame where it was removed,
+    and the number of frames removed up to and including it. Lookups are binary searches,
+    so they take O(log n) for n splice points, also on a map loaded by mmap.
+    '''
+    SUFFIX = '.zmap'
+    _MAGIC = b'ZSNDMAP1'
+    # magic, sample rate, input start, input end, number of splice points
+    _HEADER = struct.Struct('<8sQQQQ')
+
+    def __init__(self, sample_rate: int, input_start: int, input_end: int):
+        '''
+        :param input_start: the input frame at the start of the output
+        :param input_end: the input frame after the last one in the output
+        '''
+        self.sample_rate = sample_rate
+        self.input_start = input_start
+        self.input_end = input_end
+        self._output_positions = array('q')
+        self._removed = array('q')
+        self._mmap: mmap.mmap|None = None
+
+    @classmethod
+    def from_runs(cls, runs: Iterable[tuple[int, int]], sample_rate: int, input_start: int,
+            input_end: int) -> 'ZsndTimelineMap':
+        '''
+        :param runs: the dropouts removed, as (start, length) in input frames, sorted by start
+        '''
+        timeline = cls(sample_rate, input_start, input_end)
+        removed = 0
+        for start, length in runs:
+            removed += length
+            timeline._output_positions.append(start - input_start - removed + length)
+            timeline._removed.append(removed)
+        return timeline
+
+    def __len__(self):
+        return len(self._output_positions)
+
+    def get_num_output_frames(self) -> int:
+        return self.input_end - self.input_start - (self._removed[-1] if len(self) else 0)
+
+    def to_input(self, output_frame: int) -> int|None:
+        '''
+        :return: the input frame of the output frame, or None if it is out of the output
+        '''
+        if not 0 <= output_frame <= self.get_num_output_frames():
+            return None
+        # the last splice point at or before the frame
+        i = bisect.bisect_right(self._output_positions, output_frame) - 1
+        return self.input_start + output_frame + (self._removed[i] if 0 <= i else 0)
+
+    def to_output(self, input_frame: int) -> int|None:
+        '''
+        :return: the output frame of the input frame, or of the splice point if it was removed.
+                None if it is out of the range stripped.
+        '''
+        if not self.input_start <= input_frame <= self.input_end:
+            return None
+        # the number of the dropouts ending at or before the frame
+        i = bisect.bisect_right(range(len(self)), input_frame, key=self._get_input_end)
+        removed_before = self._removed[i - 1] if 0 < i else 0
+        if i < len(self) and input_frame >= self._get_input_end(i) - self._get_length(i):
+            return self._output_positions[i]
+        return input_frame - self.input_start - removed_before
+
+    def save(self, f: io.BufferedIOBase):
+        write_int64_columns(f, self._HEADER.pack(self._MAGIC, self.sample_rate, self.input_start,
+                self.input_end, len(self)), self._output_positions, self._removed)
+
+    @classmethod
+    def load(cls, path: str) -> 'ZsndTimelineMap':
+        '''
+        Maps the file saved by save() into memory. Call close() to unmap it.
+
+        :raises ValueError: if it is not saved by save()
+        '''
+        fields, columns, mapped = map_int64_columns(path, cls._HEADER, cls._MAGIC, 2,
+                'a timeline map')
+        _magic, sample_rate, input_start, input_end, _count = fields
+        timeline = cls(sample_rate, input_start, input_end)
+        (timeline._output_positions, timeline._removed), timeline._mmap = columns, mapped
+        return timeline
+
+    def close(self):
+        if self._mmap is not None:
+            unmap_int64_columns((self._output_positions, self._removed), self._mmap)
+            self._output_positions, self._removed = array('q'), array('q')
+            self._mmap = None
+
+    def _get_input_end(self, i: int) -> int:
+        return self.input_start + self._output_positions[i] + self._removed[i]
+
+    def _get_length(self, i: int) -> int:
+        return self._removed[i] - (self._removed[i - 1] if 0 < i else 0)
@@ -0,0 +1,361 @@
+from controller import StripZsndController
+from memory import ZsndMemoryBudget
+from io_policy import ZsndIoPolicy
+from wav_logic import ZsndBackendProfile, BACKEND_AUTO
+from util import ZsndLogMixin, ZsndError
+from r_framework.log import LogConfigurator
+from r_framework.r_i18n import I18nConfigurator
+import r_framework as r
+
+from i18n import t as _
+import concurrent.futures
+import ctypes
+import ctypes.util
+import fnmatch
+import io
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing_extensions import override
+
+class ZsndDirectoryWatcher(ABC):
+    # True if changes may have been missed since the last rescan, which the caller resets
+    overflowed = False
+
+    @abstractmethod
+    def wait(self, timeout: float) -> set[str]:
+        '''
+        :return: paths which may have been changed
+        '''
+        pass
+
+    def close(self):
+        pass
+
+    def is_event_driven(self) -> bool:
+        return False
+
+class ZsndPollingWatcher(ZsndDirectoryWatcher):
+    '''
+    Reports nothing, so that the caller rescans the directories on every call.
+    '''
+    @override
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return set()
+
+class ZsndInotifyWatcher(ZsndDirectoryWatcher, ZsndLogMixin):
+    '''
+    Linux inotify through ctypes
+    '''
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    _EVENT_HEADER = struct.Struct('iIII')
+    _READ_SIZE = 64 * 1024
+
+    def __init__(self, dirs: list[str]):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if 0 > self._fd:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs: dict[int, str] = {}
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        for d in dirs:
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(d), mask)
+            if 0 > wd:
+                errno = ctypes.get_errno()
+                os.close(self._fd)
+                raise OSError(errno, f'inotify_add_watch failed: {d}')
+            self._dirs[wd] = d
+
+    @override
+    def wait(self, timeout):
+        readable, _w, _x = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, self._READ_SIZE)
+        except BlockingIOError:
+            return set()
+        paths = set()
+        offset = 0
+        while offset + self._EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = self._EVENT_HEADER.unpack_from(data, offset)
+            offset += self._EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b'\0')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                self.overflowed = True
+            elif name and wd in self._dirs:
+                paths.add(os.path.join(self._dirs[wd], os.fsdecode(name)))
+        return paths
+
+    @override
+    def close(self):
+        os.close(self._fd)
+
+    @override
+    def is_event_driven(self):
+        return True
+
+@dataclass(frozen=True)
+class ZsndStripOptions:
+    min_duration: int
+    threshold: float
+    on_clean: str
+    io_policy: str = ZsndIoPolicy.DEFAULT
+    backend: str = BACKEND_AUTO
+    # of ZsndBackendProfile, opened by each worker
+    backend_profile_path: str|None = None
+
+class _ZsndWatchWorker(ZsndLogMixin):
+    '''
+    Runs in the worker processes, configured once when they start.
+    '''
+    instance: '_ZsndWatchWorker|None' = None
+    # the daemon decides when to stop; Ctrl+C reaches the whole process group
+    _IGNORES_SIGINT = True
+
+    def __init__(self, app_name: str, app_dir: Path, debug: bool, verbosity: int,
+            options: ZsndStripOptions, memory_limit: int|None):
+        if self._IGNORES_SIGINT:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+        r.DEBUG = debug
+        LogConfigurator().configure(verbosity)
+        I18nConfigurator().configure(app_name, app_dir)
+        self._options = options
+        self._memory_budget = None if memory_limit is None else ZsndMemoryBudget(memory_limit)
+        self._backend_profile = None if options.backend_profile_path is None \
+                else ZsndBackendProfile(options.backend_profile_path)
+
+    def strip(self, input_path: str, output_path: str) -> tuple[int, str|None]:
+        try:
+            return self._strip(input_path, output_path)
+        except BaseException as exc:
+            self.get_logger().error(f'{input_path}: {exc!r}')
+            return (1, None)
+
+    def _strip(self, input_path: str, output_path: str) -> tuple[int, str|None]:
+        options = self._options
+        controller = StripZsndController(show_progress=False, memory_budget=self._memory_budget,
+                io_policy=options.io_policy, backend=options.backend,
+                backend_profile=self._backend_profile)
+        # resumes the checkpoint of an interrupted run
+        result = controller.strip(input_path, output_path, True,
+                options.min_duration, options.threshold, False,
+                on_clean=options.on_clean, resume=True)
+        return (result, controller.status)
+
+def _init_watch_worker(*args):
+    _ZsndWatchWorker.instance = _ZsndWatchWorker(*args)
+
+def _run_watch_worker(input_path: str, output_path: str) -> tuple[int, str|None]:
+    return _ZsndWatchWorker.instance.strip(input_path, output_path)
+
+def _warm_up_watch_worker(_n: int) -> int:
+    return os.getpid()
+
+class ZsndCompletionRecord(ZsndLogMixin):
+    '''
+    Append-only JSON lines of the processed files, to skip them after a restart.
+    '''
+    def __init__(self, path: str):
+        self._path = path
+        self._done: dict[str, tuple[int, int]] = {}
+        is_torn = False
+        if os.path.exists(path):
+            with io.open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    is_torn = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn last line
+                        continue
+                    self._done[entry['path']] = (entry['size'], entry['mtime_ns'])
+        self._f = io.open(path, 'a', encoding='utf-8')
+        if is_torn:
+            self._f.write('\n')
+
+    def is_done(self, path: str, key: tuple[int, int]) -> bool:
+        return self._done.get(path) == key
+
+    def add(self, path: str, key: tuple[int, int], status: str):
+        self._done[path] = key
+        self._f.write(json.dumps({'path': path, 'size': key[0], 'mtime_ns': key[1],
+                'status': status, 'finished_at': time.time()}) + '\n')
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+class ZsndWatchDaemon(ZsndLogMixin):
+    RECORD_FILE_NAME = '.strip-zsnd-done.jsonl'
+    # even with inotify, rescans in case of missed events
+    _RESCAN_INTERVAL_IN_SECONDS = 60.0
+
+    def __init__(self, dirs: list[str], output_dir: str, pattern: str, options: ZsndStripOptions,
+            num_workers: int, settle_seconds: float, poll_interval: float,
+            record_path: str|None = None, use_inotify: bool = True,
+            memory_limit: int|None = None):
+        '''
+        :param output_dir: with a subdirectory for each of several `dirs`, named after it
+        :param memory_limit: in bytes, for this process and the workers altogether
+        :raises ZsndError: if several `dirs` have the same name
+        '''
+        self._dirs = [os.path.abspath(d) for d in dirs]
+        self._output_dir = os.path.abspath(output_dir)
+        # the files of the same name in several dirs go to different outputs
+        self._output_dirs = {d: self._output_dir if 1 == len(self._dirs)
+                else os.path.join(self._output_dir, os.path.basename(d)) for d in self._dirs}
+        if len(set(self._output_dirs.values())) < len(self._dirs):
+            raise ZsndError(_('zsnd.watch_dirs_same_name'))
+        self._pattern = pattern
+        self._options = options
+        self._num_workers = num_workers
+        self._settle_seconds = settle_seconds
+        self._poll_interval = poll_interval
+        self._record_path = record_path or os.path.join(self._dirs[0], self.RECORD_FILE_NAME)
+        self._use_inotify = use_inotify
+        self._memory_limit = memory_limit
+        # path -> ((size, mtime_ns), monotonic time when it is observed first)
+        self._observations: dict[str, tuple[tuple[int, int], float]] = {}
+        self._summary: dict[str, int] = {}
+
+    def run(self, app_name: str, app_dir: Path, verbosity: int):
+        logger = self.get_logger()
+        worker_memory_limit = self._fit_workers_in_memory()
+        for output_dir in self._output_dirs.values():
+            os.makedirs(output_dir, exist_ok=True)
+        record = ZsndCompletionRecord(self._record_path)
+        watcher = self._create_watcher()
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=self._num_workers,
+                initializer=_init_watch_worker,
+                initargs=(app_name, app_dir, r.DEBUG, verbosity, self._options,
+                        worker_memory_limit))
+        running: dict[concurrent.futures.Future, tuple[str, tuple[int, int]]] = {}
+        try:
+            self._warm_up(pool)
+            logger.info(_('zsnd.watch_started') % {'dirs': ', '.join(self._dirs),
+                    'n': self._num_workers})
+            candidates: set[str] = set()
+            next_rescan = 0.0
+            while True:
+                now = time.monotonic()
+                if now >= next_rescan or watcher.overflowed:
+                    candidates.update(self._scan())
+                    watcher.overflowed = False
+                    next_rescan = now + (self._RESCAN_INTERVAL_IN_SECONDS
+                            if watcher.is_event_driven() else self._poll_interval)
+                candidates.update(p for p in watcher.wait(self._poll_interval) if self._matches(p))
+                self._dispatch(candidates, running, record, pool)
+                self._collect(running, record, block=False)
+        except KeyboardInterrupt:
+            logger.info(_('zsnd.watch_stopping'))
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._collect(running, record, block=True)
+            watcher.close()
+            record.close()
+            logger.info(_('zsnd.watch_summary') % {'summary': ', '.join(
+                    f'{status}: {count}' for status, count in sorted(self._summary.items())) or '-'})
+
+    def _fit_workers_in_memory(self) -> int|None:
+        '''
+        Reduces the workers to fit in the memory limit.
+
+        :return: the memory limit of a worker
+        '''
+        if self._memory_limit is None:
+            return None
+        budget = ZsndMemoryBudget(self._memory_limit)
+        # a worker starts with about the same memory as this process
+        per_worker = budget.baseline + ZsndMemoryBudget.get_min_job_size(8)
+        self._num_workers = budget.fit_jobs(self._num_workers, per_worker)
+        return (self._memory_limit - budget.baseline) // self._num_workers
+
+    def _create_watcher(self) -> ZsndDirectoryWatcher:
+        if self._use_inotify and sys.platform.startswith('linux'):
+            try:
+                return ZsndInotifyWatcher(self._dirs)
+            except (OSError, AttributeError) as exc:
+                self.get_logger().warning(f'inotify is unavailable, falling back to polling: {exc}')
+        return ZsndPollingWatcher()
+
+    def _warm_up(self, pool: concurrent.futures.ProcessPoolExecutor):
+        '''
+        Starts all the workers before any file arrives.
+        '''
+        pids = set(pool.map(_warm_up_watch_worker, range(self._num_workers)))
+        self.get_logger().debug(f'workers: {sorted(pids)}')
+
+    def _scan(self) -> set[str]:
+        paths = set()
+        for d in self._dirs:
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_file() and self._matches(entry.path):
+                        paths.add(entry.path)
+        return paths
+
+    def _matches(self, path: str) -> bool:
+        name = os.path.basename(path)
+        return fnmatch.fnmatch(name.lower(), self._pattern.lower()) \
+                and os.path.dirname(os.path.abspath(path)) \
+                        not in (self._output_dir, *self._output_dirs.values())
+
+    def _dispatch(self, candidates: set[str], running: dict, record: ZsndCompletionRecord,
+            pool: concurrent.futures.ProcessPoolExecutor):
+        now = time.monotonic()
+        running_paths = {path for path, _key in running.values()}
+        for path in list(candidates):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                candidates.discard(path)
+                self._observations.pop(path, None)
+                continue
+            key = (st.st_size, st.st_mtime_ns)
+            if record.is_done(path, key) or path in running_paths:
+                candidates.discard(path)
+                continue
+            observed = self._observations.get(path)
+            if observed is None or observed[0] != key:
+                # still growing
+                self._observations[path] = (key, now)
+                continue
+            if now - observed[1] < self._settle_seconds:
+                continue
+            candidates.discard(path)
+            del self._observations[path]
+            output_dir = self._output_dirs[os.path.dirname(os.path.abspath(path))]
+            output_path = os.path.join(output_dir, os.path.basename(path))
+            self.get_logger().debug(f'dispatching {path}')
+            running[pool.submit(_run_watch_worker, path, output_path)] = (path, key)
+
+    def _collect(self, running: dict, record: ZsndCompletionRecord, block: bool):
+        if not running:
+            return
+        done, _not_done = concurrent.futures.wait(running, timeout=None if block else 0)
+        for future in done:
+            path, key = running.pop(future)
+            try:
+                result, status = future.result()
+            except (Exception, concurrent.futures.CancelledError) as exc:
+                self.get_logger().error(f'{path}: {exc!r}')
+                continue
+            status = status if 0 == result and status else StripZsndController.STATUS_FAILED
+            self._summary[status] = self._summary.get(status, 0) + 1
+            record.add(path, key, status)
+            self.get_logger().info(_('zsnd.watch_done') % {'f': path, 'status': status})
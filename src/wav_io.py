@@ -1,19 +1,56 @@
-from wave_format import WaveFormatParser, WaveFormat
+from wave_format import WaveFormatParser, WaveFormat, RiffScanner, RiffChunkIndex, RiffChunk
 from util import ZsndLogMixin, ZsndError
 
-import wave
+from i18n import t as _
+
 import io
+import os
+import struct
+from typing import Iterable
 from abc import ABC, abstractmethod
 
 class ZeroSoundPredicate(ABC):
+    # True if find_zero_runs() is faster than testing the samples one by one
+    bulk = False
+
     @abstractmethod
     def is_zero_sound_sample(self, frames_as_bytes: bytes, pos_in_bytes: int):
         pass
 
+    def find_zero_runs(self, frames_as_bytes: bytes, bytes_per_sample: int) \
+            -> list[tuple[int, int]]:
+        '''
+        Returns the maximal zero runs as (start, length) in samples, including the leading and
+        the trailing ones.
+        '''
+        runs = []
+        run_start = None
+        num_samples = len(frames_as_bytes) // bytes_per_sample
+        for i in range(num_samples):
+            if self.is_zero_sound_sample(frames_as_bytes, i * bytes_per_sample):
+                if run_start is None:
+                    run_start = i
+            elif run_start is not None:
+                runs.append((run_start, i - run_start))
+                run_start = None
+        if run_start is not None:
+            runs.append((run_start, num_samples - run_start))
+        return runs
+
+    @abstractmethod
+    def get_max_level(self) -> int|float:
+        '''
+        Returns the largest absolute amplitude of zero sound, in the unit of the samples.
+        For unsigned 8-bit samples, the amplitude is measured from the center 0x80.
+        '''
+        pass
+
 class ZsndWavChunk:
     def __init__(self, frames_as_bytes: bytes, bytes_per_sample: int):
         self._frames_as_bytes = frames_as_bytes
         self._bytes_per_sample = bytes_per_sample
+        # the zero runs found by a bulk predicate, and the predicate
+        self._zero_runs: tuple[ZeroSoundPredicate, list[tuple[int, int]]]|None = None
 
     def __len__(self):
         '''
@@ -22,6 +59,9 @@ class ZsndWavChunk:
         return len(self._frames_as_bytes) // self._bytes_per_sample
 
     def count_leading_zeros(self, predicate: ZeroSoundPredicate) -> int:
+        if predicate.bulk:
+            runs = self._find_zero_runs(predicate)
+            return runs[0][1] if runs and 0 == runs[0][0] else 0
         count = 0
         for i in range(0, len(self._frames_as_bytes), self._bytes_per_sample):
             if predicate.is_zero_sound_sample(self._frames_as_bytes, i):
@@ -31,6 +71,9 @@ class ZsndWavChunk:
         return count
 
     def count_trailing_zeros(self, predicate: ZeroSoundPredicate) -> int:
+        if predicate.bulk:
+            runs = self._find_zero_runs(predicate)
+            return runs[-1][1] if runs and len(self) == sum(runs[-1]) else 0
         count = 0
         i = len(self._frames_as_bytes) - self._bytes_per_sample
         while i >= 0 and predicate.is_zero_sound_sample(self._frames_as_bytes, i):
@@ -39,6 +82,12 @@ class ZsndWavChunk:
         return count
 
     def iterate_inner_zero_runs(self, predicate: ZeroSoundPredicate):
+        if predicate.bulk:
+            num_samples = len(self)
+            for run in self._find_zero_runs(predicate):
+                if 0 < run[0] and sum(run) < num_samples:
+                    yield run
+            return
         # skip leading and trailing zeros
         i = self.count_leading_zeros(predicate) * self._bytes_per_sample
 
@@ -57,6 +106,46 @@ class ZsndWavChunk:
                     zero_run_length = 0
             i += self._bytes_per_sample
 
+    def iterate_inner_zero_runs_strided(self, predicate: ZeroSoundPredicate, min_length: int):
+        '''
+        Yields the same runs as iterate_inner_zero_runs() as far as they are `min_length` or longer,
+        testing only every `min_length`-th sample outside of them. Shorter runs may be omitted.
+        '''
+        if 1 >= min_length or predicate.bulk:
+            for run in self.iterate_inner_zero_runs(predicate):
+                if run[1] >= min_length:
+                    yield run
+            return
+        frames_as_bytes = self._frames_as_bytes
+        bytes_per_sample = self._bytes_per_sample
+        num_samples = len(self)
+        # every min_length samples after a non-zero sample contain one of the probes
+        probe = self.count_leading_zeros(predicate) + min_length
+        while probe < num_samples:
+            if not predicate.is_zero_sound_sample(frames_as_bytes, probe * bytes_per_sample):
+                probe += min_length
+                continue
+            # refine the boundaries; the sample before the leading zeros is non-zero
+            start = probe
+            while predicate.is_zero_sound_sample(frames_as_bytes, (start - 1) * bytes_per_sample):
+                start -= 1
+            end = probe + 1
+            while end < num_samples \
+                    and predicate.is_zero_sound_sample(frames_as_bytes, end * bytes_per_sample):
+                end += 1
+            if end >= num_samples:
+                # trailing zeros
+                return
+            if end - start >= min_length:
+                yield (start, end - start)
+            probe = end + min_length
+
+    def _find_zero_runs(self, predicate: ZeroSoundPredicate) -> list[tuple[int, int]]:
+        if self._zero_runs is None or self._zero_runs[0] is not predicate:
+            self._zero_runs = (predicate,
+                    predicate.find_zero_runs(self._frames_as_bytes, self._bytes_per_sample))
+        return self._zero_runs[1]
+
     def __getitem__(self, key):
         assert isinstance(key, slice)
         assert key.start is not None
@@ -65,58 +154,275 @@ class ZsndWavChunk:
                 : key.stop * self._bytes_per_sample]
 
 class ZsndWavReader(ZsndLogMixin):
+    # "fact" holds the number of samples, which stripping changes
+    _AUDIO_CHUNK_IDS = (b'fmt ', b'data', b'fact')
+    # written by streaming encoders which cannot patch the header
+    _UNKNOWN_SIZES = (0, 0xFFFFFFFF)
+
     def __init__(self, f: io.BufferedIOBase):
+        '''
+        :param f: if not seekable, the reader reads it forward only, e.g. from a pipe or a socket
+        '''
         logger = self.get_logger()
 
+        self._seekable = f.seekable()
         try:
-            self._wave_format = WaveFormatParser().parse(f)
+            self._chunk_index = RiffScanner().scan(f, stop_at_data=not self._seekable)
+            logger.debug(self._chunk_index)
+            self._wave_format = WaveFormatParser().parse(f, self._chunk_index)
             logger.debug(self._wave_format)
+            self._data_chunk = self._chunk_index.get(b'data')
         except Exception as exc:
             raise ZsndError(_('zsnd.failed_to_detect_file_type') + str(exc)) from exc
-
-        f.seek(0)
-
-        self._wave_read: wave.Wave_read = wave.open(f)
-        self.get_logger().debug(self._wave_read.getparams())
-        if 2 <= self._wave_read.getnchannels():
-            self._wave_read.close()
+        if not self._wave_format.is_pcm() and not self._wave_format.is_float():
+            raise ZsndError(_('zsnd.failed_to_detect_file_type') + f'format tag {self._wave_format.wFormatTag}')
+        if 2 <= self._wave_format.nChannels:
             raise ZsndError(_('zsnd.mono_only_supported'))
 
+        self._f = f
+        self._bytes_per_sample = self._wave_format.get_bytes_per_sample()
+        self._num_frames = self._data_chunk.size // self._bytes_per_sample
+        self._is_length_known = self._seekable or self._data_chunk.size not in self._UNKNOWN_SIZES
+        if not self._is_length_known:
+            self._num_frames = 0xFFFFFFFF // self._bytes_per_sample
+        self._pos = 0
+        self._num_bytes_read = 0
+        if self._seekable:
+            self.setpos(0)
+
     def close(self):
-        self._wave_read.close()
+        # does not close the file, like Wave_read created by an opened file
+        pass
 
     def read(self, num_frames: int) -> ZsndWavChunk:
-        frames_as_bytes = self._wave_read.readframes(num_frames)
-        return ZsndWavChunk(frames_as_bytes, self._wave_format.get_bytes_per_sample())
-    
+        num_frames = max(0, min(num_frames, self._num_frames - self._pos))
+        frames_as_bytes = self._f.read(num_frames * self._bytes_per_sample)
+        if len(frames_as_bytes) < num_frames * self._bytes_per_sample and not self._is_length_known:
+            # the stream ended
+            frames_as_bytes = frames_as_bytes[: len(frames_as_bytes)
+                    - len(frames_as_bytes) % self._bytes_per_sample]
+            self._num_frames = self._pos + len(frames_as_bytes) // self._bytes_per_sample
+            self._is_length_known = True
+        self._num_bytes_read += len(frames_as_bytes)
+        self._pos += len(frames_as_bytes) // self._bytes_per_sample
+        return ZsndWavChunk(frames_as_bytes, self._bytes_per_sample)
+
     def tell(self):
-        return self._wave_read.tell()
+        return self._pos
+
+    def get_num_bytes_read(self) -> int:
+        """
+        Returns the number of audio bytes read so far, including re-reads after seeking.
+        """
+        return self._num_bytes_read
+
+    def rewind(self):
+        self.setpos(0)
+
+    def setpos(self, pos: int):
+        if not 0 <= pos <= self._num_frames:
+            raise ZsndError(f'position {pos} out of range')
+        if not self._seekable:
+            if pos != self._pos:
+                raise ZsndError(f'cannot seek to {pos} in a stream')
+            return
+        self._f.seek(self._data_chunk.offset + pos * self._bytes_per_sample)
+        self._pos = pos
 
     def count_frames(self) -> int:
         """
         Return the number of frames.
         Each frame consists of one sample from every channel.
+        For a stream without its length in the header, an upper bound until its end is read.
         """
-        return self._wave_read.getnframes()
-    
+        return self._num_frames
+
     def get_sample_rate(self) -> int:
-        return self._wave_read.getframerate()
-    
+        return self._wave_format.nSamplesPerSec
+
     def get_wave_format(self) -> WaveFormat:
         return self._wave_format
 
-class ZsndWavWriter:
-    def __init__(self, f: io.BufferedIOBase, bytes_per_sample: int, sample_rate: int):
-        self._wave_write: wave.Wave_write = wave.open(f, 'wb')
-        self._wave_write.setnchannels(1)
-        self._wave_write.setsampwidth(bytes_per_sample)
-        self._wave_write.setframerate(sample_rate)
+    def get_chunk_index(self) -> RiffChunkIndex:
+        return self._chunk_index
+
+    def get_data_offset(self) -> int:
+        """
+        Returns the offset of the first sample in the file, in bytes.
+        """
+        return self._data_chunk.offset
+
+    def get_metadata_chunks(self) -> list[RiffChunk]:
+        """
+        Returns chunks other than audio, e.g. LIST, bext, iXML or cue.
+        Always empty for a stream, whose chunks cannot be read again.
+        """
+        if not self._seekable:
+            return []
+        return [chunk for chunk in self._chunk_index if chunk.id not in self._AUDIO_CHUNK_IDS]
+
+class ZsndWavWriter(ZsndLogMixin):
+    '''
+    Writes a mono WAV file, with the same bytes as wave.Wave_write for PCM.
+
+    The header is written once with the sizes unknown, and patched when closed.
+    The audio data is buffered, so that small segments are written at once.
+    '''
+    _COPY_BLOCK_SIZE = 1024 * 1024
+    _BUFFER_SIZE = 1024 * 1024
+    # RIFF, WAVE, fmt (16 bytes) and the header of data
+    _HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+    _RIFF_SIZE_OFFSET = 4
+    _DATA_SIZE_OFFSET = _HEADER.size - 4
+
+    def __init__(self, f: io.BufferedIOBase, bytes_per_sample: int, sample_rate: int,
+            num_resumed_frames: int = 0, copy_block_size: int = _COPY_BLOCK_SIZE,
+            buffer_size: int = _BUFFER_SIZE, preallocate_frames: int|None = None,
+            format_tag: int = WaveFormat.FORMAT_TAG_PCM):
+        '''
+        :param num_resumed_frames: keeps this number of frames already written in `f`,
+                and appends to them
+        :param copy_block_size: bytes copied at once by copy_chunks()
+        :param buffer_size: bytes of audio data written at once
+        :param preallocate_frames: reserves the disk space for this number of frames,
+                e.g. an upper bound. The space not used is released when closed.
+        :param format_tag: of the header, e.g. WaveFormat.get_plain_format_tag() of the input
+        '''
+        self._f = f
+        self._bytes_per_sample = bytes_per_sample
+        self._copy_block_size = copy_block_size
+        self._buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._num_frames_written = num_resumed_frames
+        self._passthrough_chunks: list[tuple[io.BufferedIOBase, RiffChunk]] = []
+        # for PCM, the same header as Wave_write
+        header = self._HEADER.pack(b'RIFF', self._HEADER.size - 8, b'WAVE',
+                b'fmt ', 16, format_tag, 1, sample_rate,
+                sample_rate * bytes_per_sample, bytes_per_sample, bytes_per_sample * 8,
+                b'data', 0)
+        f.seek(0)
+        f.write(header)
+        if 0 < num_resumed_frames:
+            f.seek(num_resumed_frames * bytes_per_sample, io.SEEK_CUR)
+            f.truncate()
+        if preallocate_frames is not None:
+            self._preallocate(self._HEADER.size + preallocate_frames * bytes_per_sample)
+
+    def _preallocate(self, size: int):
+        if not hasattr(os, 'posix_fallocate'):  # not on Windows or macOS
+            return
+        self._f.flush()
+        try:
+            os.posix_fallocate(self._f.fileno(), 0, size)
+        except (OSError, io.UnsupportedOperation) as exc:
+            # e.g. unsupported by the file system, or the disk is full
+            self.get_logger().debug(f'preallocating {size} bytes failed ({exc})')
 
     def write(self, data: bytes):
-        self._wave_write.writeframes(data)
+        self._num_frames_written += len(data) // self._bytes_per_sample
+        if len(self._buffer) + len(data) > self._buffer_size:
+            self._write_buffer()
+            if len(data) >= self._buffer_size:
+                self._f.write(data)
+                return
+        self._buffer += data
+
+    def copy_chunks(self, f: io.BufferedIOBase, chunks: Iterable[RiffChunk]):
+        '''
+        Copies the chunks of `f` as raw bytes after the audio data, when closed.
+
+        Note:
+            Sample positions in the chunks (e.g. cue points) are not adjusted.
+        '''
+        self._passthrough_chunks.extend((f, chunk) for chunk in chunks)
+
+    def flush(self):
+        self._write_buffer()
+        self._f.flush()
 
     def close(self):
-        self._wave_write.close()
+        self._write_buffer()
+        data_size = self._num_frames_written * self._bytes_per_sample
+        data_end = self._HEADER.size + data_size
+        f = self._f
+        f.seek(self._DATA_SIZE_OFFSET)
+        f.write(struct.pack('<I', data_size))
+        f.seek(data_end)
+        if self._passthrough_chunks:
+            self._write_passthrough_chunks()
+            self._passthrough_chunks.clear()
+        else:
+            f.seek(self._RIFF_SIZE_OFFSET)
+            f.write(struct.pack('<I', data_end - 8))
+            f.seek(data_end)
+        # releases the preallocated space, and anything left by a resumed run
+        f.truncate()
+        f.flush()
+
+    def tell(self):
+        return self._num_frames_written
+
+    def _write_buffer(self):
+        if self._buffer:
+            self._f.write(self._buffer)
+            self._buffer = bytearray()
+
+    def _write_passthrough_chunks(self):
+        f = self._f
+        if 1 & (self.tell() * self._bytes_per_sample):
+            f.write(b'\0')
+        for src, chunk in self._passthrough_chunks:
+            f.write(struct.pack('<4sI', chunk.id, chunk.size))
+            src.seek(chunk.offset)
+            remaining = chunk.size
+            while remaining > 0:
+                copied = src.read(min(remaining, self._copy_block_size))
+                if 0 >= len(copied):
+                    raise ZsndError(f'Unexpected EOF in {chunk.id!r} chunk')
+                f.write(copied)
+                remaining -= len(copied)
+            if 1 & chunk.size:
+                f.write(b'\0')
+        end = f.tell()
+        f.seek(self._RIFF_SIZE_OFFSET)
+        f.write(struct.pack('<I', end - 8))
+        f.seek(end)
+
+class ZsndStreamingWavWriter:
+    '''
+    Writes a WAV file to a non-seekable stream, e.g. a pipe or a socket.
+
+    The header cannot be patched afterwards, so its sizes are left unknown (0xFFFFFFFF)
+    as streaming encoders do. Chunks other than audio are not written.
+    '''
+    UNKNOWN_SIZE = 0xFFFFFFFF
+
+    def __init__(self, f: io.BufferedIOBase, bytes_per_sample: int, sample_rate: int,
+            format_tag: int = WaveFormat.FORMAT_TAG_PCM):
+        '''
+        :param format_tag: see ZsndWavWriter
+        '''
+        self._f = f
+        self._bytes_per_sample = bytes_per_sample
+        self._num_frames_written = 0
+        # the same fmt chunk as ZsndWavWriter
+        f.write(struct.pack('<4sI4s4sIHHIIHH4sI',
+                b'RIFF', self.UNKNOWN_SIZE, b'WAVE',
+                b'fmt ', 16, format_tag, 1, sample_rate,
+                sample_rate * bytes_per_sample, bytes_per_sample, bytes_per_sample * 8,
+                b'data', self.UNKNOWN_SIZE))
+
+    def write(self, data: bytes):
+        self._f.write(data)
+        self._num_frames_written += len(data) // self._bytes_per_sample
 
     def tell(self):
-        return self._wave_write.tell()
+        return self._num_frames_written
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        if 1 & (self._num_frames_written * self._bytes_per_sample):
+            self._f.write(b'\0')
+        self._f.flush()
@@ -1,9 +1,22 @@
 from wav_io import ZsndWavReader, ZeroSoundPredicate
 from util import ZsndError, ZsndLogMixin
 
+from i18n import t as _
+from abc import ABC, abstractmethod
+import io
+import json
+import os
+import re
 import struct
+import threading
+import time
 from typing_extensions import override
 
+try:
+    import numpy as np
+except ImportError:  # the backend "numpy" is unavailable
+    np = None
+
 class _ZeroSoundPredicateImpl(ZeroSoundPredicate, ZsndLogMixin):
     def __init__(self, sample_width_in_bytes: int):
         assert 0 < sample_width_in_bytes
@@ -47,6 +60,10 @@ class _PcmIntZeroSoundPredicate(_ZeroSoundPredicateImpl):
             return self._are_upper_bytes(0xFF, frames_as_bytes, pos_in_bytes)
         return False
 
+    @override
+    def get_max_level(self):
+        return self._positive_threshold
+
     def _are_upper_bytes(self, expected, frames_as_bytes, pos_in_bytes):
         for i in range(1, self.sample_width_in_bytes):
             if expected != frames_as_bytes[i + pos_in_bytes]:
@@ -73,6 +90,10 @@ class _PcmInt8ZeroSoundPredicate(_ZeroSoundPredicateImpl):
                 <= frames_as_bytes[pos_in_bytes] \
                 <= self._max_amp
 
+    @override
+    def get_max_level(self):
+        return self._max_amp - 0x80
+
 class _FloatZeroSoundPredicate(_ZeroSoundPredicateImpl):
     '''
     Float PCM: -1.0 < x < 1.0 (normalized)
@@ -98,14 +119,301 @@ class _FloatZeroSoundPredicate(_ZeroSoundPredicateImpl):
         fp = self._unpacker.unpack(sliced)[0]
         return self._min_amp <= fp <= self._max_amp
 
-class WavZeroSoundPredicateFactory:
-    def create(self, wave_reader: ZsndWavReader, threshold_in_db: float) ->  ZeroSoundPredicate:
-        wave_format =  wave_reader.get_wave_format()
-        bytes_per_sample = wave_format.get_bytes_per_sample()
-        if wave_format.is_float():
+    @override
+    def get_max_level(self):
+        return self._max_amp
+
+class _BulkZeroSoundPredicate(ZeroSoundPredicate):
+    '''
+    Finds the zero runs of a chunk at once, and tests single samples with `sample_predicate`.
+    '''
+    bulk = True
+
+    def __init__(self, sample_predicate: ZeroSoundPredicate):
+        self._sample_predicate = sample_predicate
+
+    @override
+    def is_zero_sound_sample(self, frames_as_bytes, pos_in_bytes):
+        return self._sample_predicate.is_zero_sound_sample(frames_as_bytes, pos_in_bytes)
+
+    @override
+    def get_max_level(self):
+        return self._sample_predicate.get_max_level()
+
+class _RegexZeroSoundPredicate(_BulkZeroSoundPredicate):
+    '''
+    Integer PCM: matches the byte patterns of zero sound with a regular expression,
+    alternating between zero runs and the runs of other samples.
+    '''
+    def __init__(self, sample_predicate: ZeroSoundPredicate, bytes_per_sample: int):
+        super().__init__(sample_predicate)
+        level = sample_predicate.get_max_level()
+        if 1 == bytes_per_sample:
+            zero = self._byte_range(0x80 - level, 0x80 + level)
+        else:
+            upper_bytes = bytes_per_sample - 1
+            zero = self._byte_range(0, level) + re.escape(b'\x00' * upper_bytes)
+            if 0 < level:
+                zero += b'|' + self._byte_range(0x100 - level, 0xFF) \
+                        + re.escape(b'\xFF' * upper_bytes)
+            zero = b'(?:' + zero + b')'
+        self._pattern = re.compile(b'(' + zero + b'+)|(?:(?!' + zero + b')'
+                + b'.' * bytes_per_sample + b')+', re.DOTALL)
+
+    @override
+    def find_zero_runs(self, frames_as_bytes, bytes_per_sample):
+        return [(match.start() // bytes_per_sample,
+                (match.end() - match.start()) // bytes_per_sample)
+                for match in self._pattern.finditer(frames_as_bytes) if match.lastindex]
+
+    @staticmethod
+    def _byte_range(first: int, last: int) -> bytes:
+        return b'[' + re.escape(bytes((first,))) + b'-' + re.escape(bytes((last,))) + b']'
+
+class _NumpyZeroSoundPredicate(_BulkZeroSoundPredicate):
+    '''
+    Compares all samples of a chunk to the threshold at once.
+    '''
+    def __init__(self, sample_predicate: ZeroSoundPredicate, is_float: bool,
+            bytes_per_sample: int):
+        super().__init__(sample_predicate)
+        self._dtype = {(False, 1): np.uint8, (False, 2): '<i2', (False, 3): np.uint8,
+                (False, 4): '<i4', (True, 4): '<f4', (True, 8): '<f8'}[(is_float, bytes_per_sample)]
+        self._is_int24 = not is_float and 3 == bytes_per_sample
+        level = sample_predicate.get_max_level()
+        if not is_float and 1 == bytes_per_sample:
+            self._min_level, self._max_level = 0x80 - level, 0x80 + level
+        else:
+            self._min_level, self._max_level = -level, level
+
+    @override
+    def find_zero_runs(self, frames_as_bytes, bytes_per_sample):
+        samples = np.frombuffer(frames_as_bytes, self._dtype)
+        if self._is_int24:
+            # sign-extended from the upper 3 bytes of 32-bit integers
+            widened = np.zeros((len(samples) // 3, 4), np.uint8)
+            widened[:, 1:] = samples.reshape(-1, 3)
+            samples = widened.view('<i4').reshape(-1) >> 8
+        is_zero = (self._min_level <= samples) & (samples <= self._max_level)
+        # the edges of the runs, at the changes between False and True
+        edges = np.flatnonzero(np.diff(is_zero, prepend=False, append=False))
+        starts = edges[0::2]
+        return list(zip(starts.tolist(), (edges[1::2] - starts).tolist()))
+
+class ZsndDetectionBackend(ABC):
+    '''
+    An implementation of detecting zero sound, for the formats it supports.
+    '''
+    name = ''
+
+    def is_available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def supports(self, is_float: bool, bytes_per_sample: int) -> bool:
+        pass
+
+    @abstractmethod
+    def create(self, is_float: bool, bytes_per_sample: int, threshold_in_db: float) \
+            -> ZeroSoundPredicate:
+        pass
+
+class _PythonDetectionBackend(ZsndDetectionBackend):
+    '''
+    Tests the samples one by one. The reference of the others.
+    '''
+    name = 'python'
+
+    @override
+    def supports(self, is_float, bytes_per_sample):
+        return bytes_per_sample in ((4, 8) if is_float else (1, 2, 3, 4))
+
+    @override
+    def create(self, is_float, bytes_per_sample, threshold_in_db):
+        if is_float:
             return _FloatZeroSoundPredicate(bytes_per_sample, threshold_in_db)
         else: # int
             if 1 == bytes_per_sample:
                 return _PcmInt8ZeroSoundPredicate(threshold_in_db)
             else:
                 return _PcmIntZeroSoundPredicate(bytes_per_sample, threshold_in_db)
+
+class _RegexDetectionBackend(_PythonDetectionBackend):
+    name = 'regex'
+
+    @override
+    def supports(self, is_float, bytes_per_sample):
+        return not is_float and super().supports(is_float, bytes_per_sample)
+
+    @override
+    def create(self, is_float, bytes_per_sample, threshold_in_db):
+        return _RegexZeroSoundPredicate(
+                super().create(is_float, bytes_per_sample, threshold_in_db), bytes_per_sample)
+
+class _NumpyDetectionBackend(_PythonDetectionBackend):
+    name = 'numpy'
+
+    @override
+    def is_available(self):
+        return np is not None
+
+    @override
+    def create(self, is_float, bytes_per_sample, threshold_in_db):
+        return _NumpyZeroSoundPredicate(
+                super().create(is_float, bytes_per_sample, threshold_in_db),
+                is_float, bytes_per_sample)
+
+BACKEND_AUTO = 'auto'
+DETECTION_BACKENDS: dict[str, ZsndDetectionBackend] = {}
+
+def register_detection_backend(backend: ZsndDetectionBackend):
+    DETECTION_BACKENDS[backend.name] = backend
+
+for _backend in (_PythonDetectionBackend(), _RegexDetectionBackend(), _NumpyDetectionBackend()):
+    register_detection_backend(_backend)
+
+class ZsndBackendProfile(ZsndLogMixin):
+    '''
+    The backends chosen by calibration on this machine, saved as JSON.
+    '''
+    def __init__(self, path: str):
+        self._path = path
+        self._choices: dict[str, str]|None = None
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str|None:
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key: str, name: str):
+        '''
+        Saves it, or logs why not.
+        '''
+        with self._lock:
+            choices = self._load()
+            choices[key] = name
+            try:
+                os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+                temp_path = f'{self._path}.{os.getpid()}.tmp'
+                with io.open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(choices, f, indent=1, sort_keys=True)
+                os.replace(temp_path, self._path)
+            except OSError as exc:
+                self.get_logger().debug(f'Backend profile not saved ({exc})')
+
+    def _load(self) -> dict[str, str]:
+        if self._choices is None:
+            try:
+                with io.open(self._path, encoding='utf-8') as f:
+                    self._choices = dict(json.load(f))
+            except (OSError, ValueError, TypeError):
+                self._choices = {}
+        return self._choices
+
+class _AutotunedZeroSoundPredicate(_BulkZeroSoundPredicate, ZsndLogMixin):
+    '''
+    Runs every candidate on the first chunks, drops the ones disagreeing with the reference,
+    and then uses the fastest one, or the one in the profile.
+    '''
+    CALIBRATION_CHUNKS = 4
+
+    def __init__(self, candidates: dict[str, ZeroSoundPredicate], format_name: str,
+            profile: ZsndBackendProfile|None):
+        '''
+        :param candidates: the first one is the reference
+        '''
+        self._candidates = candidates
+        super().__init__(next(iter(candidates.values())))
+        self._format_name = format_name
+        self._profile = profile
+        self._elapsed = dict.fromkeys(candidates, 0.0)
+        self._num_calibrated = 0
+        self._chosen: ZeroSoundPredicate|None = None
+        self._lock = threading.Lock()
+
+    @override
+    def find_zero_runs(self, frames_as_bytes, bytes_per_sample):
+        if self._chosen is not None:
+            return self._chosen.find_zero_runs(frames_as_bytes, bytes_per_sample)
+        with self._lock:
+            if self._chosen is None:
+                return self._calibrate(frames_as_bytes, bytes_per_sample)
+        return self._chosen.find_zero_runs(frames_as_bytes, bytes_per_sample)
+
+    def _calibrate(self, frames_as_bytes, bytes_per_sample) -> list[tuple[int, int]]:
+        num_samples = len(frames_as_bytes) // bytes_per_sample
+        # chunks of similar sizes share the choice
+        key = f'{self._format_name}/{"zero" if 0 == self.get_max_level() else "level"}' \
+                f'/{1 << max(0, num_samples - 1).bit_length()}'
+        name = None if self._profile is None else self._profile.get(key)
+        if name in self._candidates and 0 == self._num_calibrated:
+            self._choose(name, f'the profile for {key}')
+            return self._chosen.find_zero_runs(frames_as_bytes, bytes_per_sample)
+
+        expected = None
+        for name, candidate in list(self._candidates.items()):
+            start_time = time.perf_counter()
+            runs = candidate.find_zero_runs(frames_as_bytes, bytes_per_sample)
+            self._elapsed[name] += time.perf_counter() - start_time
+            if expected is None:
+                expected = runs
+            elif runs != expected:
+                self.get_logger().warning(
+                        f'Backend {name} disagrees with the reference on {self._format_name}')
+                del self._candidates[name]
+                del self._elapsed[name]
+        self._num_calibrated += 1
+        if self._num_calibrated >= self.CALIBRATION_CHUNKS:
+            name = min(self._elapsed, key=self._elapsed.get)
+            self._choose(name, ', '.join(f'{name} {elapsed * 1000:.2f} ms'
+                    for name, elapsed in self._elapsed.items()))
+            if self._profile is not None:
+                self._profile.put(key, name)
+        return expected
+
+    def _choose(self, name: str, reason: str):
+        self._chosen = self._candidates[name]
+        self.bulk = self._chosen.bulk
+        self.get_logger().debug(f'Backend {name} chosen for {self._format_name} ({reason})')
+
+class WavZeroSoundPredicateFactory:
+    '''
+    The predicates created are reused for the same format and threshold, also by concurrent
+    requests. Only the calibration of BACKEND_AUTO has a state, guarded by a lock.
+    '''
+    def __init__(self, backend: str = BACKEND_AUTO, profile: ZsndBackendProfile|None = None):
+        '''
+        :param backend: a name in DETECTION_BACKENDS, or BACKEND_AUTO to calibrate the available ones
+        :param profile: the choices of BACKEND_AUTO on this machine
+        '''
+        self._backend = backend
+        self._profile = profile
+        self._predicates: dict[tuple[bool, int, float], ZeroSoundPredicate] = {}
+
+    def create(self, wave_reader: ZsndWavReader, threshold_in_db: float) ->  ZeroSoundPredicate:
+        '''
+        :raises ZsndError: if the backend does not support the format
+        '''
+        wave_format =  wave_reader.get_wave_format()
+        key = (wave_format.is_float(), wave_format.get_bytes_per_sample(), threshold_in_db)
+        predicate = self._predicates.get(key)
+        if predicate is None:
+            predicate = self._create_with_backend(*key)
+            self._predicates[key] = predicate
+        return predicate
+
+    def _create_with_backend(self, is_float: bool, bytes_per_sample: int,
+            threshold_in_db: float) -> ZeroSoundPredicate:
+        format_name = f'{"float" if is_float else "int"}{bytes_per_sample * 8}'
+        if BACKEND_AUTO != self._backend:
+            backend = DETECTION_BACKENDS[self._backend]
+            if not backend.is_available() or not backend.supports(is_float, bytes_per_sample):
+                raise ZsndError(_('zsnd.backend_unsupported') %
+                        {'backend': backend.name, 'format': format_name})
+            return backend.create(is_float, bytes_per_sample, threshold_in_db)
+        candidates = {backend.name: backend.create(is_float, bytes_per_sample, threshold_in_db)
+                for backend in DETECTION_BACKENDS.values()
+                if backend.is_available() and backend.supports(is_float, bytes_per_sample)}
+        if 1 == len(candidates):
+            return next(iter(candidates.values()))
+        return _AutotunedZeroSoundPredicate(candidates, format_name, self._profile)
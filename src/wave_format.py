@@ -45,24 +45,114 @@ class WaveFormat:
             return self.SubFormat == self.KSDATAFORMAT_SUBTYPE_IEEE_FLOAT
         return False
 
-class WaveFormatParser:
-    def parse(self, f: BufferedIOBase):
+    def get_plain_format_tag(self) -> int:
+        '''
+        Returns the format tag of a plain (not extensible) fmt chunk with the same samples.
+        '''
+        return self.FORMAT_TAG_FLOAT if self.is_float() else self.FORMAT_TAG_PCM
+
+@dataclass(frozen=True)
+class RiffChunk:
+    id: bytes
+    offset: int  # of the payload, in bytes from the start of the file
+    size: int
+
+    def get_padded_end(self) -> int:
+        # chunks are word aligned
+        return self.offset + self.size + (self.size & 1)
+
+class RiffChunkIndex:
+    def __init__(self, chunks: list[RiffChunk], payloads: dict[bytes, bytes]):
+        self._chunks = chunks
+        self._payloads = payloads
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __repr__(self):
+        return f'RiffChunkIndex({self._chunks!r})'
+
+    def find(self, chunk_id: bytes) -> RiffChunk|None:
+        for chunk in self._chunks:
+            if chunk.id == chunk_id:
+                return chunk
+        return None
+
+    def get(self, chunk_id: bytes) -> RiffChunk:
+        chunk = self.find(chunk_id)
+        if chunk is None:
+            raise WaveFormatError(f'{chunk_id.decode("latin-1")!r} chunk not found')
+        return chunk
+
+    def get_payload(self, chunk_id: bytes) -> bytes:
+        """
+        Returns the contents of a chunk read while scanning.
+        """
+        if chunk_id not in self._payloads:
+            raise WaveFormatError(f'{chunk_id.decode("latin-1")!r} chunk not found')
+        return self._payloads[chunk_id]
+
+class RiffScanner:
+    """
+    Builds the index of all chunks in a RIFF WAVE file, reading only their headers.
+    """
+    # small chunks read while scanning
+    PRELOADED_CHUNK_IDS = (b'fmt ',)
+
+    def scan(self, f: BufferedIOBase, stop_at_data: bool = False) -> RiffChunkIndex:
+        """
+        :param stop_at_data: scans no further than the data chunk, e.g. for non-seekable streams
+        """
         if not hasattr(f, 'readable') or not f.readable():
             raise WaveFormatError('passed stream is not readable')
         try:
-            magic_riff, size, magic_wave = struct.unpack('<4sI4s', f.read(12))
+            magic_riff, riff_size, magic_wave = struct.unpack('<4sI4s', f.read(12))
             if b'RIFF' != magic_riff or b'WAVE' != magic_wave:
                 raise WaveFormatError('magic bytes not found')
+            file_size = None if stop_at_data else f.seek(0, 2)
+            chunks = []
+            payloads = {}
+            pos = 12
             while True:
+                if not stop_at_data:
+                    f.seek(pos)
                 header = f.read(8)
                 if len(header) < 8:
-                        raise WaveFormatError('fmt chunk not found')
+                    break
                 chunk_id, chunk_size = struct.unpack('<4sI', header)
-                if chunk_id == b'fmt ':
-                    fmt_chunk = f.read(chunk_size)
-                    return self._parse_fmt_chunk(fmt_chunk)
+                chunk = RiffChunk(chunk_id, pos + 8, chunk_size)
+                if file_size is not None and chunk.offset + chunk.size > file_size:
+                    # e.g. the size of a streamed data chunk is unknown (0xFFFFFFFF)
+                    chunk = RiffChunk(chunk_id, chunk.offset, file_size - chunk.offset)
+                chunks.append(chunk)
+                if b'data' == chunk_id and stop_at_data:
+                    break
+                if chunk_id in self.PRELOADED_CHUNK_IDS:
+                    payloads[chunk_id] = f.read(chunk.size)
+                    skipped = chunk.size & 1
                 else:
-                    f.seek(chunk_size, 1)
+                    skipped = chunk.get_padded_end() - chunk.offset
+                if stop_at_data:
+                    f.read(skipped)
+                pos = chunk.get_padded_end()
+            return RiffChunkIndex(chunks, payloads)
+        except WaveFormatError as exc:
+            raise
+        except Exception as exc:
+            raise WaveFormatError(str(exc)) from exc
+
+class WaveFormatParser:
+    def parse(self, f: BufferedIOBase, index: RiffChunkIndex|None = None) -> WaveFormat:
+        """
+        :param index: chunk index of `f`, if already scanned
+        """
+        try:
+            if index is None:
+                index = RiffScanner().scan(f)
+            return self._parse_fmt_chunk(index.get_payload(b'fmt '))
         except WaveFormatError as exc:
             raise
         except Exception as exc:
@@ -0,0 +1,405 @@
+from controller import StripZsndController
+from memory import ZsndMemoryBudget
+from checkpoint import ZsndCheckpointer
+from watch import ZsndStripOptions, _ZsndWatchWorker
+from util import ZsndLogMixin, ZsndError
+import r_framework as r
+
+from i18n import t as _
+import _thread
+import concurrent.futures
+import fnmatch
+import io
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable
+from typing_extensions import override
+
+class ZsndLease(ZsndLogMixin):
+    '''
+    A claim of a file of ZsndWorkQueue, renewed by touching its lock file until released.
+
+    The lock file holds the token of the claim, so that the holder notices when the lease has
+    expired and has been taken over by another worker.
+    '''
+    def __init__(self, input_path: str, lock_path: str, token: str, lease_seconds: float):
+        self.input_path = input_path
+        self.lock_path = lock_path
+        self.token = token
+        self.lost = False
+        self._lease_seconds = lease_seconds
+        self._stopped = threading.Event()
+        self._thread: threading.Thread|None = None
+
+    def start_heartbeat(self, on_lost: Callable[[], None]|None = None):
+        '''
+        :param on_lost: called on the heartbeat thread when the lease is lost
+        '''
+        self._thread = threading.Thread(target=self._heartbeat, args=(on_lost,),
+                name='zsnd-lease', daemon=True)
+        self._thread.start()
+
+    def stop_heartbeat(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_held(self) -> bool:
+        try:
+            with io.open(self.lock_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('token') == self.token
+        except (OSError, ValueError):
+            return False
+
+    def renew(self) -> bool:
+        '''
+        :return: False if the lease has been lost
+        '''
+        if not self.is_held():
+            self.lost = True
+            return False
+        try:
+            # set to the time of the file server, see ZsndWorkQueue._get_server_time()
+            os.utime(self.lock_path)
+        except OSError as exc:
+            self.get_logger().debug(f'{self.lock_path}: renewal failed ({exc})')
+        return True
+
+    def _heartbeat(self, on_lost: Callable[[], None]|None):
+        while not self._stopped.wait(self._lease_seconds / 4):
+            if not self.renew():
+                self.get_logger().warning(_('zsnd.queue_lease_lost') % self.input_path)
+                if on_lost is not None:
+                    on_lost()
+                return
+
+class ZsndWorkQueue(ZsndLogMixin):
+    '''
+    Shares the files of a directory among workers on any number of nodes
+    through a shared file system, e.g. NFS, without any coordinator.
+
+    A worker claims a file by creating its lock file exclusively (O_EXCL is atomic on NFSv3
+    and later), and keeps the claim by touching it. A lock file not touched for `lease_seconds`
+    is taken over by renaming it away, which only one worker can do. A file is finished
+    by its marker, written atomically before the lock file is removed.
+
+    Each lease writes its own work file next to the output, renamed to the output when completed,
+    so that a holder which has lost its lease does not overwrite the output or the checkpoint
+    of the worker taking it over.
+    '''
+    STATE_DIR_NAME = '.strip-zsnd-queue'
+    LOCK_SUFFIX = '.lock'
+    MARKER_SUFFIX = '.done.json'
+    WORK_SUFFIX = '.part'
+
+    def __init__(self, queue_dir: str, output_dir: str, pattern: str = '*.wav',
+            lease_seconds: float = 600.0, state_dir: str|None = None,
+            worker_id: str|None = None):
+        '''
+        :param lease_seconds: longer than the clock skew between the nodes and the file server
+        '''
+        self._queue_dir = os.path.abspath(queue_dir)
+        self._output_dir = os.path.abspath(output_dir)
+        self._pattern = pattern
+        self._lease_seconds = lease_seconds
+        self._state_dir = state_dir or os.path.join(self._queue_dir, self.STATE_DIR_NAME)
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.summary: dict[str, int] = {}
+
+    def scan(self) -> list[str]:
+        '''
+        :return: the input files without markers, in an order of this worker
+                so that workers starting together do not race for the same files
+        '''
+        paths = []
+        with os.scandir(self._queue_dir) as it:
+            for entry in it:
+                if entry.is_file() and fnmatch.fnmatch(entry.name.lower(), self._pattern.lower()) \
+                        and not os.path.exists(self._get_marker_path(entry.path)):
+                    paths.append(entry.path)
+        paths.sort()
+        if paths:
+            offset = random.Random(self.worker_id).randrange(len(paths))
+            paths = paths[offset:] + paths[:offset]
+        return paths
+
+    def claim(self, input_path: str) -> ZsndLease|None:
+        '''
+        :return: None if another worker holds it, or it has been finished
+        '''
+        os.makedirs(self._state_dir, exist_ok=True)
+        lock_path = self._get_lock_path(input_path)
+        token = uuid.uuid4().hex
+        for _attempt in range(2):
+            try:
+                fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                if not self._take_over_expired(lock_path, token):
+                    return None
+                continue
+            with io.open(fd, 'w', encoding='utf-8') as f:
+                json.dump({'token': token, 'worker': self.worker_id, 'path': input_path,
+                        'claimed_at': time.time()}, f)
+            lease = ZsndLease(input_path, lock_path, token, self._lease_seconds)
+            if os.path.exists(self._get_marker_path(input_path)):
+                # finished since scanned
+                self.release(lease)
+                return None
+            return lease
+        return None
+
+    def release(self, lease: ZsndLease):
+        lease.stop_heartbeat()
+        if lease.is_held():
+            try:
+                os.remove(lease.lock_path)
+            except FileNotFoundError:
+                pass
+
+    def complete(self, lease: ZsndLease, output_path: str, result: int, status: str|None,
+            started_at: float) -> bool:
+        '''
+        Moves the work file of the lease to the output, and writes the marker of the file,
+        unless the lease has been lost.
+
+        :return: True if the marker is written
+        '''
+        lease.stop_heartbeat()
+        if lease.lost or not lease.is_held():
+            self._discard_work(lease)
+            return False
+        work_path = self.get_work_path(lease)
+        if os.path.exists(work_path):
+            os.replace(work_path, output_path)
+        # left by a failure
+        self._remove_work_files(work_path)
+        status = status if 0 == result and status else StripZsndController.STATUS_FAILED
+        marker_path = self._get_marker_path(lease.input_path)
+        temp_path = f'{marker_path}.{lease.token}.tmp'
+        with io.open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'path': lease.input_path, 'output': output_path, 'status': status,
+                    'result': result, 'worker': self.worker_id, 'started_at': started_at,
+                    'finished_at': time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, marker_path)
+        self.summary[status] = self.summary.get(status, 0) + 1
+        self.release(lease)
+        return True
+
+    def run(self, process: Callable[[str, str], tuple[int, str|None]], poll_interval: float):
+        '''
+        Processes the files until all of them have markers.
+
+        :param process: strips the input path to the work path of the lease,
+                resuming its checkpoint, and returns (exit code, StripZsndController.status)
+        '''
+        logger = self.get_logger()
+        os.makedirs(self._output_dir, exist_ok=True)
+        while True:
+            pending = self.scan()
+            if not pending:
+                return
+            num_claimed = 0
+            for input_path in pending:
+                lease = self.claim(input_path)
+                if lease is None:
+                    continue
+                num_claimed += 1
+                output_path = os.path.join(self._output_dir, os.path.basename(input_path))
+                logger.debug(f'{self.worker_id}: claimed {input_path}')
+                started_at = time.time()
+                # until complete() stops the heartbeat, which may interrupt it at any point
+                try:
+                    work_path = self._adopt_work(lease)
+                    lease.start_heartbeat(_thread.interrupt_main)
+                    try:
+                        result, status = process(input_path, work_path)
+                    except Exception as exc:
+                        logger.error(f'{input_path}: {exc!r}')
+                        result, status = 1, None
+                    if self.complete(lease, output_path, result, status, started_at):
+                        logger.info(_('zsnd.watch_done') % {'f': input_path,
+                                'status': status or StripZsndController.STATUS_FAILED})
+                except KeyboardInterrupt:
+                    if not lease.lost:
+                        self.release(lease)
+                        raise
+                    # another worker resumes it from the checkpoint of its own work file
+                    self._discard_work(lease)
+            if 0 == num_claimed:
+                # the rest are held by others, which may crash
+                time.sleep(poll_interval)
+
+    def get_work_path(self, lease: ZsndLease) -> str:
+        return os.path.join(self._output_dir,
+                f'.{os.path.basename(lease.input_path)}.{lease.token}{self.WORK_SUFFIX}')
+
+    def _adopt_work(self, lease: ZsndLease) -> str:
+        '''
+        Takes over the work file and the checkpoint left by the latest of the previous holders
+        of the file, to resume it, and removes the others.
+
+        :return: the work path of the lease
+        '''
+        work_path = self.get_work_path(lease)
+        pattern = re.compile(re.escape(f'.{os.path.basename(lease.input_path)}.')
+                + r'[0-9a-f]{32}' + re.escape(self.WORK_SUFFIX))
+        left: list[tuple[float, str]] = []
+        with os.scandir(self._output_dir) as it:
+            for entry in it:
+                if pattern.fullmatch(entry.name) and entry.path != work_path:
+                    try:
+                        left.append((os.stat(entry.path + ZsndCheckpointer.SUFFIX).st_mtime,
+                                entry.path))
+                    except FileNotFoundError:
+                        left.append((-1.0, entry.path))
+        left.sort()
+        if left and 0 <= left[-1][0]:
+            latest_path = left[-1][1]
+            try:
+                # in the reverse order of saving, so that the copies of the dropouts and the output
+                # hold at least what the copy of the checkpoint refers to
+                for suffix in (ZsndCheckpointer.SUFFIX, ZsndCheckpointer.RUNS_SUFFIX, ''):
+                    shutil.copyfile(latest_path + suffix, work_path + suffix)
+            except FileNotFoundError:
+                # discarded by its holder meanwhile, so starts over
+                self._remove_work_files(work_path)
+        for _mtime, path in left:
+            self._remove_work_files(path)
+        return work_path
+
+    def _discard_work(self, lease: ZsndLease):
+        self._remove_work_files(self.get_work_path(lease))
+
+    @staticmethod
+    def _remove_work_files(work_path: str):
+        for path in (work_path, work_path + ZsndCheckpointer.SUFFIX,
+                work_path + ZsndCheckpointer.RUNS_SUFFIX):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _take_over_expired(self, lock_path: str, token: str) -> bool:
+        '''
+        :return: True if the lock file has been removed, by this worker or its holder
+        '''
+        try:
+            st = os.stat(lock_path)
+        except FileNotFoundError:
+            return True
+        if self._get_server_time() - st.st_mtime <= self._lease_seconds:
+            return False
+        # only one of the workers taking it over at once succeeds
+        stale_path = f'{lock_path}.{token}.stale'
+        try:
+            os.rename(lock_path, stale_path)
+        except FileNotFoundError:
+            return True
+        stale_st = os.stat(stale_path)
+        if (stale_st.st_ino, stale_st.st_mtime_ns) != (st.st_ino, st.st_mtime_ns):
+            # renewed or claimed again since stat(), so puts it back unless claimed yet again
+            try:
+                os.link(stale_path, lock_path)
+            except FileExistsError:
+                pass
+            os.remove(stale_path)
+            return False
+        os.remove(stale_path)
+        self.get_logger().info(_('zsnd.queue_lease_expired') % lock_path)
+        return True
+
+    def _get_server_time(self) -> float:
+        '''
+        Returns the current time of the file server, to compare with the mtimes of lock files
+        on the nodes with their own clocks.
+        '''
+        probe_path = os.path.join(self._state_dir, f'.clock.{socket.gethostname()}')
+        with io.open(probe_path, 'a'):
+            pass
+        os.utime(probe_path)
+        return os.stat(probe_path).st_mtime
+
+    def _get_lock_path(self, input_path: str) -> str:
+        return os.path.join(self._state_dir, os.path.basename(input_path) + self.LOCK_SUFFIX)
+
+    def _get_marker_path(self, input_path: str) -> str:
+        return os.path.join(self._state_dir, os.path.basename(input_path) + self.MARKER_SUFFIX)
+
+class _ZsndQueueWorker(_ZsndWatchWorker):
+    '''
+    Interrupted by KeyboardInterrupt when its lease is lost, see ZsndWorkQueue.run().
+    '''
+    instance: '_ZsndQueueWorker|None' = None
+    _IGNORES_SIGINT = False
+
+    @override
+    def strip(self, input_path: str, output_path: str) -> tuple[int, str|None]:
+        return self._strip(input_path, output_path)
+
+def _init_queue_worker(*args):
+    _ZsndQueueWorker.instance = _ZsndQueueWorker(*args)
+
+def _run_queue_worker(queue_args: tuple, poll_interval: float) -> dict[str, int]:
+    queue = ZsndWorkQueue(*queue_args)
+    try:
+        queue.run(_ZsndQueueWorker.instance.strip, poll_interval)
+    except KeyboardInterrupt:
+        pass
+    return queue.summary
+
+class ZsndQueueRunner(ZsndLogMixin):
+    '''
+    Runs workers of ZsndWorkQueue in processes of this node.
+    '''
+    def __init__(self, queue_dir: str, output_dir: str, pattern: str, options: ZsndStripOptions,
+            num_workers: int, lease_seconds: float, poll_interval: float,
+            state_dir: str|None = None, memory_limit: int|None = None):
+        '''
+        :param memory_limit: in bytes, for this process and the workers altogether
+        '''
+        if not os.path.isdir(queue_dir):
+            raise ZsndError(_('zsnd.queue_dir_not_found') % queue_dir)
+        self._queue_args = (queue_dir, output_dir, pattern, lease_seconds, state_dir)
+        self._options = options
+        self._num_workers = num_workers
+        self._poll_interval = poll_interval
+        self._memory_limit = memory_limit
+
+    def run(self, app_name: str, app_dir: Path, verbosity: int) -> dict[str, int]:
+        logger = self.get_logger()
+        worker_memory_limit = None
+        if self._memory_limit is not None:
+            budget = ZsndMemoryBudget(self._memory_limit)
+            per_worker = budget.baseline + ZsndMemoryBudget.get_min_job_size(8)
+            self._num_workers = budget.fit_jobs(self._num_workers, per_worker)
+            worker_memory_limit = (self._memory_limit - budget.baseline) // self._num_workers
+        logger.info(_('zsnd.queue_started') % {'dir': os.path.abspath(self._queue_args[0]),
+                'n': self._num_workers})
+        summary: dict[str, int] = {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self._num_workers,
+                initializer=_init_queue_worker,
+                initargs=(app_name, app_dir, r.DEBUG, verbosity, self._options,
+                        worker_memory_limit)) as pool:
+            futures = [pool.submit(_run_queue_worker, self._queue_args, self._poll_interval)
+                    for _i in range(self._num_workers)]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    for status, count in future.result().items():
+                        summary[status] = summary.get(status, 0) + count
+            except KeyboardInterrupt:
+                # the workers release the files they hold
+                logger.info(_('zsnd.watch_stopping'))
+        logger.info(_('zsnd.watch_summary') % {'summary': ', '.join(
+                f'{status}: {count}' for status, count in sorted(summary.items())) or '-'})
+        return summary
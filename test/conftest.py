@@ -1,10 +1,11 @@
 import pytest
-# from strip_zsnd import LogConfigurator
+from pathlib import Path
+from r_framework.r_i18n import I18nConfigurator
 
 @pytest.fixture(scope='session', autouse=True)
 def global_setup():
     print('=== GLOBAL SETUP ===')
-    # LogConfigurator().configre()
+    I18nConfigurator().configure('strip-zsnd', Path(__file__).resolve().parents[1])
 
     yield
 
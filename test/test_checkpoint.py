@@ -0,0 +1,107 @@
+from checkpoint import ZsndCheckpointer
+from service import StripZsndService, StripZsndState, DropoutCollector
+from wav_io import ZsndWavReader, ZsndWavWriter
+from dropout_runs import ZsndDropoutRuns
+from util import ZsndError
+
+import io
+import json
+import os
+import tempfile
+import wave
+import unittest
+
+class TestZsndCheckpointer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmp_dir.name, 'input.wav')
+        self.output_path = os.path.join(self.tmp_dir.name, 'output.wav')
+        chunk_size = StripZsndService._CHUNK_SIZE
+        barr = bytearray([0x40] * (2 * 8 * chunk_size))
+        for start in (chunk_size + 100, 3 * chunk_size + 1000, 5 * chunk_size - 300):
+            barr[2 * start : 2 * (start + 600)] = bytes(2 * 600)
+        with wave.open(self.input_path, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(barr)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_resume(self):
+        chunk_size = StripZsndService._CHUNK_SIZE
+        expected_frames, expected_dropouts = self._strip_all()
+
+        # interrupted run
+        checkpointer = ZsndCheckpointer(self.input_path, self.output_path, 10, -80.0, 0.0)
+        with io.open(self.input_path, 'rb') as in_file, io.open(self.output_path, 'wb') as out_file:
+            reader = ZsndWavReader(in_file)
+            writer = ZsndWavWriter(out_file, 2, 44100)
+            state = StripZsndState()
+            collector = DropoutCollector()
+            progression = StripZsndService(quiet=True).strip(reader, writer,
+                    listeners=(collector,), state=state)
+            for _ in range(5):
+                next(progression)
+                checkpointer.update(state, out_file, writer, collector)
+            # half-written chunk after the checkpoint
+            writer.write(bytes([0x7F] * 2 * 100))
+            writer.close()
+
+        checkpointer = ZsndCheckpointer(self.input_path, self.output_path, 10, -80.0)
+        with io.open(checkpointer.path, 'r', encoding='utf-8') as f:
+            # only scalars, with the dropouts next to it
+            self.assertFalse([value for value in json.load(f).values()
+                    if isinstance(value, (list, dict))])
+        runs = ZsndDropoutRuns.load(checkpointer.runs_path)
+        self.assertEqual([(chunk_size + 100, 600), (3 * chunk_size + 1000, 600)], runs)
+        runs.close()
+        checkpoint = checkpointer.load()
+        self.assertEqual(2, checkpoint.num_dropouts)
+        self.assertEqual(5 * StripZsndService._CHUNK_SIZE, checkpoint.input_frames)
+        self.assertEqual(300, checkpoint.num_trailing_zeros)
+        with io.open(self.input_path, 'rb') as in_file, io.open(self.output_path, 'r+b') as out_file:
+            reader = ZsndWavReader(in_file)
+            writer = ZsndWavWriter(out_file, 2, 44100, checkpoint.output_frames)
+            state = StripZsndState(checkpoint.input_frames - checkpoint.num_trailing_zeros)
+            collector = DropoutCollector()
+            collector.dropouts = checkpoint.dropouts
+            for _ in StripZsndService(quiet=True).strip(reader, writer,
+                    listeners=(collector,), state=state):
+                pass
+            writer.close()
+
+        self.assertEqual(expected_dropouts, collector.dropouts)
+        with wave.open(self.output_path, 'rb') as w:
+            self.assertEqual(expected_frames, w.readframes(w.getnframes()))
+
+    def test_load_rejects_changed_options(self):
+        checkpointer = ZsndCheckpointer(self.input_path, self.output_path, 10, -80.0, 0.0)
+        checkpointer._snapshot = (0, 0, 0, 0)
+        with io.open(self.output_path, 'wb') as out_file:
+            checkpointer.save(out_file, DropoutCollector())
+        with self.assertRaises(ZsndError):
+            ZsndCheckpointer(self.input_path, self.output_path, 20, -80.0).load()
+
+    def test_load_rejects_missing_runs(self):
+        checkpointer = ZsndCheckpointer(self.input_path, self.output_path, 10, -80.0, 0.0)
+        checkpointer._snapshot = (0, 0, 0, 0)
+        with io.open(self.output_path, 'wb') as out_file:
+            checkpointer.save(out_file, DropoutCollector())
+        os.remove(checkpointer.runs_path)
+        with self.assertRaises(ZsndError):
+            checkpointer.load()
+
+    def _strip_all(self):
+        buf = io.BytesIO()
+        collector = DropoutCollector()
+        with io.open(self.input_path, 'rb') as in_file:
+            reader = ZsndWavReader(in_file)
+            writer = ZsndWavWriter(buf, 2, 44100)
+            for _ in StripZsndService(quiet=True).strip(reader, writer, listeners=(collector,)):
+                pass
+            writer.close()
+        buf.seek(0)
+        with wave.open(buf, 'rb') as w:
+            return w.readframes(w.getnframes()), collector.dropouts
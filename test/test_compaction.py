@@ -0,0 +1,137 @@
+from compaction import ZsndInPlaceCompactor, ZsndCompactionJournal
+from wave_format import RiffScanner
+
+import io
+import os
+import struct
+import tempfile
+import wave
+import unittest
+
+class TestZsndInPlaceCompactor(unittest.TestCase):
+    _DROPOUTS = [(1000, 500), (3001, 777), (9000, 1000)]
+    _NUM_FRAMES = 10000
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        samples = bytearray()
+        for i in range(self._NUM_FRAMES):
+            samples += struct.pack('<h', 1 + i % 1000)
+        self.expected = bytearray()
+        kept_start = 0
+        for start, length in self._DROPOUTS:
+            samples[2 * start : 2 * (start + length)] = bytes(2 * length)
+            self.expected += samples[2 * kept_start : 2 * start]
+            kept_start = start + length
+        self.expected += samples[2 * kept_start:]
+        self.samples = bytes(samples)
+        with io.open(self.path, 'wb') as f:
+            with wave.open(f, 'wb') as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(44100)
+                w.writeframes(samples)
+            f.write(b'LIST' + struct.pack('<I', 4) + b'INFO')
+            f.seek(4)
+            f.write(struct.pack('<I', 36 + len(samples) + 12))
+
+    def tearDown(self):
+        for path in (self.path, ZsndCompactionJournal.path_for(self.path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_compact(self):
+        compactor = ZsndInPlaceCompactor(block_size=4096)
+        for _ in compactor.compact(self.path, self._plan(compactor)):
+            pass
+        self._assert_compacted()
+
+    def test_resume(self):
+        compactor = ZsndInPlaceCompactor(block_size=1024)
+        progression = compactor.compact(self.path, self._plan(compactor))
+        for _ in range(5):
+            next(progression)
+        # simulates a crash
+        progression.close()
+        self.assertTrue(os.path.exists(ZsndCompactionJournal.path_for(self.path)))
+
+        for _ in ZsndInPlaceCompactor().resume(self.path):
+            pass
+        self._assert_compacted()
+
+    def test_resume_with_torn_slot(self):
+        compactor = ZsndInPlaceCompactor(block_size=1024)
+        progression = compactor.compact(self.path, self._plan(compactor))
+        for _ in range(4):
+            next(progression)
+        progression.close()
+        # breaks the latest slot as if the crash happened while writing it
+        journal = ZsndCompactionJournal.open(self.path)
+        seq, move_index, move_offset, data = journal.last_record()
+        data_pos = journal._slot_position(seq % 2) + journal._SLOT_HEADER.size
+        journal.close()
+        with io.open(ZsndCompactionJournal.path_for(self.path), 'r+b') as f:
+            f.seek(data_pos)
+            f.write(bytes(0xFF ^ b for b in data[:10]))
+
+        for _ in ZsndInPlaceCompactor().resume(self.path):
+            pass
+        self._assert_compacted()
+
+    def _plan(self, compactor: ZsndInPlaceCompactor):
+        with io.open(self.path, 'rb') as f:
+            return compactor.plan(f, self._DROPOUTS, self._NUM_FRAMES, 2)
+
+    def _assert_compacted(self):
+        self.assertFalse(os.path.exists(ZsndCompactionJournal.path_for(self.path)))
+        with wave.open(self.path, 'rb') as w:
+            self.assertEqual(len(self.expected) // 2, w.getnframes())
+            self.assertEqual(self.expected, w.readframes(w.getnframes()))
+        with io.open(self.path, 'rb') as f:
+            contents = f.read()
+        self.assertEqual(len(contents) - 8, struct.unpack('<I', contents[4:8])[0])
+        self.assertEqual(b'LIST' + struct.pack('<I', 4) + b'INFO', contents[-12:])
+
+    def _write_chunks(self, format_tag: int, bytes_per_sample: int,
+            chunks: list[tuple[bytes, bytes]]):
+        fmt = struct.pack('<HHIIHH', format_tag, 1, 44100, 44100 * bytes_per_sample,
+                bytes_per_sample, 8 * bytes_per_sample)
+        body = b'WAVE'
+        for chunk_id, payload in [(b'fmt ', fmt)] + chunks:
+            body += chunk_id + struct.pack('<I', len(payload)) + payload + bytes(len(payload) & 1)
+        with io.open(self.path, 'wb') as f:
+            f.write(b'RIFF' + struct.pack('<I', len(body)) + body)
+
+    def test_keeps_trailer_after_partial_sample(self):
+        list_chunk = b'INFOISFT' + struct.pack('<I', 4) + b'zsnd'
+        self._write_chunks(1, 2, [(b'data', self.samples + b'\x7f'), (b'LIST', list_chunk)])
+
+        compactor = ZsndInPlaceCompactor(block_size=4096)
+        for _ in compactor.compact(self.path, self._plan(compactor)):
+            pass
+        with wave.open(self.path, 'rb') as w:
+            self.assertEqual(self.expected, w.readframes(w.getnframes()))
+        with io.open(self.path, 'rb') as f:
+            contents = f.read()
+        self.assertEqual(len(contents) - 8, struct.unpack('<I', contents[4:8])[0])
+        self.assertEqual(b'LIST' + struct.pack('<I', len(list_chunk)) + list_chunk,
+                contents[-8 - len(list_chunk):])
+
+    def test_updates_fact(self):
+        num_frames = 1000
+        data = b''.join(struct.pack('<f', 0.0 if 100 <= i < 400 else 0.5)
+                for i in range(num_frames))
+        self._write_chunks(3, 4, [(b'fact', struct.pack('<I', num_frames)), (b'data', data)])
+
+        compactor = ZsndInPlaceCompactor(block_size=1024)
+        with io.open(self.path, 'rb') as f:
+            plan = compactor.plan(f, [(100, 300)], num_frames, 4)
+        for _ in compactor.compact(self.path, plan):
+            pass
+        with io.open(self.path, 'rb') as f:
+            index = RiffScanner().scan(f)
+            fact = index.get(b'fact')
+            f.seek(fact.offset)
+            self.assertEqual(700, struct.unpack('<I', f.read(4))[0])
+            self.assertEqual(4 * 700, index.get(b'data').size)
@@ -0,0 +1,66 @@
+from dropout_runs import ZsndDropoutRuns
+
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+class TestZsndDropoutRuns(unittest.TestCase):
+    def test_append_merges(self):
+        runs = ZsndDropoutRuns()
+        runs.append(100, 50)
+        # across a chunk boundary
+        runs.append(150, 30)
+        # overlapping
+        runs.append(170, 5)
+        runs.append(300, 0)
+        runs.append(400, 10)
+        self.assertEqual([(100, 80), (400, 10)], runs)
+        self.assertEqual(90, runs.get_total_length())
+        self.assertEqual((400, 10), runs[-1])
+        self.assertEqual([(100, 80)], runs[:1])
+        with self.assertRaises(ValueError):
+            runs.append(399, 1)
+
+    def test_filter(self):
+        runs = ZsndDropoutRuns([(0, 5), (10, 20), (40, 3), (50, 100)])
+        self.assertEqual([(10, 20), (50, 100)], runs.filter(20))
+        self.assertEqual(4, len(runs))
+
+    def test_save_and_load(self):
+        runs = ZsndDropoutRuns((i * 1000, i + 1) for i in range(1000))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'runs.bin')
+            with open(path, 'wb') as f:
+                runs.save(f)
+            self.assertEqual(16 + 16 * 1000, os.path.getsize(path))
+            loaded = ZsndDropoutRuns.load(path)
+            self.assertEqual(runs, loaded)
+            self.assertEqual(runs.get_total_length(), loaded.get_total_length())
+            ZsndDropoutRuns.load(path).close()
+            # copied out of the map to append
+            loaded.append(2_000_000, 7)
+            self.assertEqual(1001, len(loaded))
+            loaded.close()
+
+            empty_path = os.path.join(tmp_dir, 'empty.bin')
+            with open(empty_path, 'wb') as f:
+                ZsndDropoutRuns().save(f)
+            self.assertEqual([], ZsndDropoutRuns.load(empty_path))
+            with open(empty_path, 'ab') as f:
+                f.write(b'\0' * 8)
+            with open(empty_path, 'r+b') as f:
+                f.write(b'XXXXXXXX')
+            with self.assertRaises(ValueError):
+                ZsndDropoutRuns.load(empty_path)
+
+    def test_compact(self):
+        tracemalloc.start()
+        try:
+            runs = ZsndDropoutRuns((i * 100, 10 + i % 50) for i in range(100_000))
+            size, _peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(100_000, len(runs))
+        # 16 bytes per run, and the spare capacity of the arrays
+        self.assertLess(size, 100_000 * 16 * 1.5)
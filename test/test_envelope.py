@@ -0,0 +1,123 @@
+from envelope import ZsndPeakEnvelope, ZsndPeakEnvelopeBuilder, ZsndEnvelopeCache, \
+    ZsndEnvelopeRecordingReader
+from service import StripZsndService, DropoutCollector, DropoutListener
+from wav_io import ZsndWavReader
+
+import wave
+import io
+import os
+import random
+import struct
+import tempfile
+import unittest
+
+class TestZsndPeakEnvelope(unittest.TestCase):
+    def _create_samples(self, rng: random.Random, silence: list, loud: list) -> list:
+        samples = []
+        while len(samples) < 30000:
+            # each silence has its own level
+            levels = rng.choice(silence)
+            samples += [rng.choice(levels) for _i in range(rng.randint(1, 1500))]
+            samples += [rng.choice(loud) for _i in range(rng.randint(1, 300))]
+        return samples
+
+    def _create_wav(self, sample_width: int, frames: bytes) -> io.BytesIO:
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(sample_width)
+            w.setframerate(44100)
+            w.writeframes(frames)
+        buf.seek(0)
+        return buf
+
+    def _assert_same_dropouts(self, buf: io.BytesIO, thresholds=(-90.0, -80.0, -60.0)):
+        reader = ZsndWavReader(buf)
+        builder = ZsndPeakEnvelopeBuilder(reader.get_wave_format())
+        for _progress in StripZsndService(quiet=True, chunk_size=1000).strip(
+                ZsndEnvelopeRecordingReader(reader, builder), None, 10, -80.0, True):
+            pass
+        envelope = builder.finish()
+        self.assertEqual(reader.count_frames(), envelope.num_frames)
+
+        for threshold in thresholds:
+            expected = _DetailsRecorder()
+            reader.rewind()
+            for _progress in StripZsndService(quiet=True).strip(reader, None, 5, threshold, True,
+                    (expected,)):
+                pass
+            actual = _DetailsRecorder()
+            for _progress in StripZsndService(quiet=True).detect_with_envelope(reader, envelope,
+                    5, threshold, (actual,)):
+                pass
+            self.assertTrue(expected.details)
+            self.assertEqual(expected.details, actual.details, f'{threshold} dBFS')
+
+    def test_int16(self):
+        rng = random.Random(38)
+        samples = self._create_samples(rng, [[0], [1, -1], [3, -3, 0], [30, -30]], [-20000, 1000, 32767, -32768])
+        self._assert_same_dropouts(self._create_wav(2, struct.pack(f'<{len(samples)}h', *samples)))
+
+    def test_int24(self):
+        rng = random.Random(24)
+        samples = self._create_samples(rng, [[0], [1, -1], [200, -200], [256 * 30]], [-(1 << 23), 1 << 20])
+        frames = b''.join(sample.to_bytes(3, 'little', signed=True) for sample in samples)
+        self._assert_same_dropouts(self._create_wav(3, frames))
+
+    def test_uint8(self):
+        rng = random.Random(8)
+        samples = self._create_samples(rng, [[0x80], [0x81, 0x7F], [0x70, 0x90]], [0x00, 0xFF, 0x40])
+        self._assert_same_dropouts(self._create_wav(1, bytes(samples)), (-40.0, -10.0))
+
+    def test_short_duration_falls_back(self):
+        samples = [100] + [0] * 100 + [100]
+        buf = self._create_wav(2, struct.pack(f'<{len(samples)}h', *samples))
+        reader = ZsndWavReader(buf)
+        envelope = ZsndPeakEnvelope(len(samples), 2, False, [])
+        collector = DropoutCollector()
+        for _progress in StripZsndService(quiet=True).detect_with_envelope(reader, envelope,
+                1, -80.0, (collector,)):
+            pass
+        self.assertEqual([(1, 100)], collector.dropouts)
+
+class TestZsndEnvelopeCache(unittest.TestCase):
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, 'input.wav')
+            with open(input_path, 'wb') as f:
+                f.write(b'RIFF')
+            builder = ZsndPeakEnvelopeBuilder(_FakeWaveFormat())
+            builder.add(struct.pack('<200h', *range(200)))
+            envelope = builder.finish()
+            cache = ZsndEnvelopeCache(os.path.join(tmp_dir, 'cache'))
+            self.assertIsNone(cache.load(input_path))
+
+            cache.save(input_path, envelope)
+            loaded = cache.load(input_path)
+            self.assertEqual(200, loaded.num_frames)
+            self.assertEqual([[63, 127, 191, 199], [63], [63]],
+                    [list(values) for values in loaded.levels])
+
+            # modified input
+            with open(input_path, 'ab') as f:
+                f.write(b'\0')
+            self.assertIsNone(cache.load(input_path))
+
+class _DetailsRecorder(DropoutListener):
+    wants_details = True
+
+    def __init__(self):
+        self.details = []
+
+    def on_dropout(self, input_start, length):
+        pass
+
+    def on_dropout_details(self, input_start, length, output_start, peak_level):
+        self.details.append((input_start, length, peak_level))
+
+class _FakeWaveFormat:
+    def get_bytes_per_sample(self):
+        return 2
+
+    def is_float(self):
+        return False
@@ -0,0 +1,63 @@
+from io_policy import ZsndIoPolicy
+
+import io
+import os
+import random
+import tempfile
+from unittest.mock import patch
+import unittest
+
+@unittest.skipIf(not hasattr(os, 'posix_fadvise'), 'posix_fadvise is unavailable')
+class TestZsndIoPolicy(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp_dir.name, 'data')
+        self.data = random.Random(41).randbytes(3 * 1024 * 1024 + 123)
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_stream_drops_pages_behind(self):
+        policy = ZsndIoPolicy(ZsndIoPolicy.STREAM, 64 * 1024)
+        policy._WINDOW_SIZE = 1024 * 1024
+        with patch('os.posix_fadvise') as mock_fadvise:
+            with policy.open_input(self.path) as f:
+                self.assertEqual(self.data[:100], f.read(100))
+                f.seek(0)
+                self.assertEqual(self.data, b''.join(iter(lambda: f.read(100_000), b'')))
+        advices = [call.args[1:] for call in mock_fadvise.call_args_list]
+        self.assertIn((0, 0, os.POSIX_FADV_SEQUENTIAL), advices)
+        self.assertIn((0, 1_100_000, os.POSIX_FADV_DONTNEED), advices)
+
+    def test_stream_writes_the_same_bytes(self):
+        out_path = os.path.join(self._tmp_dir.name, 'out')
+        policy = ZsndIoPolicy(ZsndIoPolicy.STREAM, 64 * 1024)
+        policy._WINDOW_SIZE = 1024 * 1024
+        with patch('os.posix_fadvise') as mock_fadvise:
+            with policy.open_output(out_path, 'wb') as f:
+                f.write(b'header')
+                for i in range(0, len(self.data), 100_000):
+                    f.write(self.data[i : i + 100_000])
+                f.seek(0)
+                f.write(b'HEADER')
+        with open(out_path, 'rb') as f:
+            self.assertEqual(b'HEADER' + self.data, f.read())
+        self.assertIn(os.POSIX_FADV_DONTNEED, [call.args[3] for call in mock_fadvise.call_args_list])
+
+    @unittest.skipIf(not hasattr(os, 'O_DIRECT'), 'O_DIRECT is unavailable')
+    def test_direct_reads_the_same_bytes(self):
+        try:
+            os.close(os.open(self.path, os.O_RDONLY | os.O_DIRECT))
+        except OSError:
+            self.skipTest('O_DIRECT is unsupported by the file system')
+        rng = random.Random(1)
+        with ZsndIoPolicy(ZsndIoPolicy.DIRECT, 100_000).open_input(self.path) as f:
+            for _i in range(50):
+                offset = rng.randrange(len(self.data))
+                size = rng.randrange(1, 300_000)
+                f.seek(offset)
+                self.assertEqual(self.data[offset : offset + size], f.read(size))
+            f.seek(-10, io.SEEK_END)
+            self.assertEqual(self.data[-10:], f.read())
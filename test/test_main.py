@@ -1,9 +1,17 @@
-from service import StripZsndService
-from wav_io import ZsndWavReader, ZsndWavChunk
+from service import StripZsndService, StripZsndState, DropoutCollector, ZsndPosition
+from controller import StripZsndController
+from wav_io import ZsndWavReader, ZsndWavWriter, ZsndWavChunk
 from wav_logic import _PcmIntZeroSoundPredicate
+from wave_format import WaveFormat
 
 import wave
+import contextlib
 import io
+import json
+import os
+import random
+import struct
+import tempfile
 from unittest.mock import patch
 import unittest
 
@@ -43,6 +51,105 @@ class TestStripZsndService(unittest.TestCase):
                 pass
         mock_handler.assert_called_once_with(start//2, 1000, 44100)
 
+    def test_strip_stops_when_listener_is_satisfied(self):
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            barr = bytearray([0x40] * (2 * 4 * StripZsndService._CHUNK_SIZE))
+            barr[2000:4000] = bytes(2000)
+            barr[-4000:-2000] = bytes(2000)
+            w.writeframes(barr)
+        buf.seek(0)
+        reader = ZsndWavReader(buf)
+        collector = DropoutCollector(limit=1)
+        for _ in StripZsndService(quiet=True).strip(reader, None, listeners=(collector,)):
+            pass
+        self.assertEqual([(1000, 1000)], collector.dropouts)
+        self.assertEqual(StripZsndService._CHUNK_SIZE, reader.tell())
+
+    def test_strided_strip_matches_exhaustive(self):
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            barr = bytearray([0x40] * (2 * 4 * StripZsndService._CHUNK_SIZE))
+            for start, length in ((0, 500), (5000, 441), (8000, 440), (8190, 1000), (20000, 3000)):
+                barr[2 * start : 2 * (start + length)] = bytes(2 * length)
+            w.writeframes(barr)
+        results = []
+        for strided in (False, True):
+            buf.seek(0)
+            out = io.BytesIO()
+            collector = DropoutCollector()
+            writer = ZsndWavWriter(out, 2, 44100)
+            for _ in StripZsndService(quiet=True, strided=strided).strip(ZsndWavReader(buf),
+                    writer, listeners=(collector,)):
+                pass
+            writer.close()
+            results.append((out.getvalue(), collector.dropouts))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(4, len(results[1][1]))
+
+    def test_strip_keeps_short_zero_runs_across_chunks(self):
+        chunk_size = StripZsndService._CHUNK_SIZE
+        barr = bytearray([0x40] * (2 * 4 * chunk_size))
+        # short ones across the boundaries and at the end, and a long one across a boundary
+        for start, length in ((chunk_size - 10, 20), (2 * chunk_size - 1, 2),
+                (3 * chunk_size - 220, 440), (4 * chunk_size - 5, 5)):
+            barr[2 * start : 2 * (start + length)] = bytes(2 * length)
+        expected = barr[:]
+        barr[2 * (3 * chunk_size - 500) : 2 * (3 * chunk_size - 220)] = bytes(2 * 280)
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(barr)
+        buf.seek(0)
+        out = io.BytesIO()
+        collector = DropoutCollector()
+        writer = ZsndWavWriter(out, 2, 44100)
+        for _ in StripZsndService(quiet=True).strip(ZsndWavReader(buf), writer,
+                listeners=(collector,)):
+            pass
+        writer.close()
+        self.assertEqual([(3 * chunk_size - 500, 720)], collector.dropouts)
+        del expected[2 * (3 * chunk_size - 500) : 2 * (3 * chunk_size + 220)]
+        out.seek(0)
+        with wave.open(out, 'rb') as w:
+            self.assertEqual(bytes(expected), w.readframes(w.getnframes()))
+
+    def test_strip_range(self):
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            barr = bytearray([0x40] * (2 * 3 * StripZsndService._CHUNK_SIZE))
+            for start, length in ((1000, 1000), (5000, 1000), (9000, 1000), (13000, 1000)):
+                barr[2 * start : 2 * (start + length)] = bytes(2 * length)
+            w.writeframes(barr)
+        buf.seek(0)
+        collector = DropoutCollector()
+        for _ in StripZsndService(quiet=True).strip(ZsndWavReader(buf), None,
+                listeners=(collector,), state=StripZsndState(5500), end=13500):
+            pass
+        # cut at the ends of the range
+        self.assertEqual([(5500, 500), (9000, 1000), (13000, 500)], collector.dropouts)
+
+    def test_parse_position(self):
+        self.assertEqual(ZsndPosition(frames=5760000), ZsndPosition.parse('5760000'))
+        self.assertEqual(ZsndPosition(seconds=7800.0), ZsndPosition.parse('02:10:00'))
+        self.assertEqual(ZsndPosition(seconds=600.5), ZsndPosition.parse('10:00.5'))
+        self.assertEqual(ZsndPosition(seconds=90.5), ZsndPosition.parse('90.5s'))
+        self.assertEqual(88200, ZsndPosition.parse('0:02').to_frames(44100))
+        for text in ('1.5', '-1s', '1:2:3:4', ':30', 'abc'):
+            with self.assertRaises(ValueError, msg=text):
+                ZsndPosition.parse(text)
+
 class TestWavChunk(unittest.TestCase):
     def test_count_leading_zeros(self):
         predicate = _PcmIntZeroSoundPredicate(2, -80)
@@ -69,6 +176,23 @@ class TestWavChunk(unittest.TestCase):
             (594, 680-594),
         ])
 
+    def test_iterate_inner_zero_runs_strided(self):
+        predicate = _PcmIntZeroSoundPredicate(2, -80)
+        rng = random.Random(1234)
+        for min_length in (1, 2, 7, 50):
+            for _ in range(50):
+                bbuf = bytearray([0x40] * 2 * 2000)
+                for _ in range(rng.randint(0, 30)):
+                    start = rng.randrange(2000)
+                    length = rng.randint(1, 3 * min_length)
+                    bbuf[2 * start : 2 * (start + length)] = bytes(2 * length)
+                chunk = ZsndWavChunk(bbuf, 2)
+                expected = [run for run in chunk.iterate_inner_zero_runs(predicate)
+                        if run[1] >= min_length]
+                actual = [run for run in chunk.iterate_inner_zero_runs_strided(predicate, min_length)
+                        if run[1] >= min_length]
+                self.assertEqual(expected, actual)
+
 class TestZsndWavReader(unittest.TestCase):
     def test_read(self):
         buf = io.BytesIO()
@@ -86,3 +210,171 @@ class TestZsndWavReader(unittest.TestCase):
             b = reader.read(777)
             pos += len(b)
         self.assertEqual(pos, 40000)
+
+    def test_read_float(self):
+        frames_as_bytes = struct.pack('<4f', 0.5, 0.0, -0.5, 0.25)
+        fmt = struct.pack('<HHIIHH', 3, 1, 48000, 4 * 48000, 4, 32)
+        chunks = b'fmt ' + struct.pack('<I', len(fmt)) + fmt \
+                + b'data' + struct.pack('<I', len(frames_as_bytes)) + frames_as_bytes
+        buf = io.BytesIO(b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks)
+        reader = ZsndWavReader(buf)
+        self.assertTrue(reader.get_wave_format().is_float())
+        self.assertEqual(4, reader.count_frames())
+        self.assertEqual(48000, reader.get_sample_rate())
+        reader.setpos(2)
+        self.assertEqual(frames_as_bytes[8:], reader.read(100)[0:2])
+        self.assertEqual(4, reader.tell())
+
+class TestZsndWavWriter(unittest.TestCase):
+    def test_copy_chunks(self):
+        src = io.BytesIO()
+        with wave.open(src, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(1)
+            w.setframerate(8000)
+            w.writeframes(bytes(10))
+        src.write(b'LIST' + struct.pack('<I', 3) + b'abc\0')
+        src.seek(4)
+        src.write(struct.pack('<I', len(src.getvalue()) - 8))
+        src.seek(0)
+        reader = ZsndWavReader(src)
+
+        buf = io.BytesIO()
+        writer = ZsndWavWriter(buf, 1, 8000)
+        writer.copy_chunks(src, reader.get_metadata_chunks())
+        writer.write(b'\x80' * 3)
+        writer.close()
+
+        buf.seek(0)
+        with wave.open(buf, 'rb') as w:
+            self.assertEqual(b'\x80' * 3, w.readframes(100))
+        output = buf.getvalue()
+        self.assertEqual(len(output) - 8, struct.unpack('<I', output[4:8])[0])
+        # padded after the odd-sized data
+        self.assertEqual(b'\0' + b'LIST' + struct.pack('<I', 3) + b'abc\0', output[-13:])
+
+    def test_same_bytes_as_wave_write(self):
+        segments = [bytes([i]) * (2 * i + 1) for i in range(1, 200)]
+        for sample_width in (1, 3):
+            expected = io.BytesIO()
+            with wave.open(expected, 'wb') as w:
+                w.setnchannels(1)
+                w.setsampwidth(sample_width)
+                w.setframerate(44100)
+                for segment in segments:
+                    w.writeframes(segment[: len(segment) - len(segment) % sample_width])
+            buf = io.BytesIO()
+            writer = ZsndWavWriter(buf, sample_width, 44100, buffer_size=100)
+            for segment in segments:
+                writer.write(segment[: len(segment) - len(segment) % sample_width])
+            writer.close()
+            self.assertEqual(expected.getvalue(), buf.getvalue())
+
+    def test_resume_and_preallocate(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'output.wav')
+            with open(path, 'wb') as f:
+                writer = ZsndWavWriter(f, 2, 44100, preallocate_frames=100000)
+                writer.write(b'\1\0' * 300)
+                writer.flush()
+            # interrupted with more frames than the checkpoint
+            with open(path, 'r+b') as f:
+                writer = ZsndWavWriter(f, 2, 44100, num_resumed_frames=200,
+                        preallocate_frames=100000)
+                self.assertEqual(200, writer.tell())
+                writer.write(b'\2\0' * 50)
+                writer.close()
+            with wave.open(path, 'rb') as w:
+                self.assertEqual(b'\1\0' * 200 + b'\2\0' * 50, w.readframes(1000))
+            self.assertEqual(44 + 2 * 250, os.path.getsize(path))
+
+class TestStripZsndController(unittest.TestCase):
+    def test_probe_clean(self):
+        reader = self._create_reader(bytes([0x40] * (2 * 40000)))
+        controller = StripZsndController()
+        self.assertTrue(controller._probe_clean(reader, 10, -80.0))
+        self.assertEqual(0, reader.tell())
+
+    def test_probe_dirty(self):
+        barr = bytearray([0x40] * (2 * 40000))
+        barr[2000:4000] = bytes(2000)
+        reader = self._create_reader(barr)
+        controller = StripZsndController()
+        self.assertFalse(controller._probe_clean(reader, 10, -80.0))
+        self.assertEqual(0, reader.tell())
+
+    def test_strip_range(self):
+        barr = bytearray([0x40] * (2 * 40000))
+        for start in (1000, 11000, 31000):
+            barr[2 * start : 2 * (start + 1000)] = bytes(2 * 1000)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, 'input.wav')
+            with wave.open(input_path, 'wb') as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(44100)
+                w.writeframes(barr)
+            for copy_outside, expected in ((False, barr[2 * 10000 : 2 * 11000]
+                    + barr[2 * 12000 : 2 * 30000]), (True, barr[: 2 * 11000] + barr[2 * 12000 :])):
+                output_path = os.path.join(tmp_dir, 'output.wav')
+                controller = StripZsndController(show_progress=False)
+                self.assertEqual(0, controller.strip(input_path, output_path, True, 10, -80.0,
+                        False, start=ZsndPosition(frames=10000),
+                        end=ZsndPosition(seconds=30000 / 44100), copy_outside=copy_outside))
+                with wave.open(output_path, 'rb') as w:
+                    self.assertEqual(expected, w.readframes(w.getnframes()), copy_outside)
+
+    def test_strip_float(self):
+        samples = [0.25] * 3000
+        samples[1000:2000] = [0.0] * 1000
+        frames_as_bytes = struct.pack(f'<{len(samples)}f', *samples)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, 'input.wav')
+            output_path = os.path.join(tmp_dir, 'output.wav')
+            with open(input_path, 'wb') as f:
+                writer = ZsndWavWriter(f, 4, 44100, format_tag=WaveFormat.FORMAT_TAG_FLOAT)
+                writer.write(frames_as_bytes)
+                writer.close()
+            controller = StripZsndController(show_progress=False)
+            self.assertEqual(0, controller.strip(input_path, output_path, True, 10, -80.0, False))
+            with open(output_path, 'rb') as f:
+                reader = ZsndWavReader(f)
+                wave_format = reader.get_wave_format()
+                self.assertEqual(WaveFormat.FORMAT_TAG_FLOAT, wave_format.wFormatTag)
+                self.assertEqual(32, wave_format.wBitsPerSample)
+                self.assertEqual(frames_as_bytes[: 4 * 1000] + frames_as_bytes[4 * 2000 :],
+                        reader.read(10000)[0 : 2000])
+
+    def test_check(self):
+        barr = bytearray([0x40] * (2 * 3 * StripZsndService._CHUNK_SIZE))
+        for start in (1000, 11000):
+            barr[2 * start : 2 * (start + 1000)] = bytes(2 * 1000)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, 'input.wav')
+            with wave.open(input_path, 'wb') as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(44100)
+                w.writeframes(barr)
+            for args, code, status in (((1,), 3, {'dropouts': 1, 'capped': True}),
+                    ((5,), 3, {'dropouts': 2, 'capped': False}),
+                    ((1, ZsndPosition(frames=12000)), 0, {'dropouts': 0, 'capped': False})):
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    self.assertEqual(code, StripZsndController().check(input_path, 10, -80.0,
+                            *args))
+                result = json.loads(out.getvalue())
+                self.assertEqual(status, {key: result[key] for key in status})
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(StripZsndController.EXIT_FAILED,
+                        StripZsndController().check(tmp_dir, 10, -80.0))
+
+    def _create_reader(self, frames_as_bytes: bytes) -> ZsndWavReader:
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(frames_as_bytes)
+        buf.seek(0)
+        return ZsndWavReader(buf)
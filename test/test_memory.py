@@ -0,0 +1,78 @@
+from memory import ZsndMemoryBudget, parse_byte_size
+from util import ZsndError
+
+import os
+import subprocess
+import sys
+import tempfile
+import wave
+import unittest
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MiB = 1024 * 1024
+
+_LAUNCHER = '''
+import os, subprocess, sys
+process = subprocess.Popen(sys.argv[1:], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+_pid, status, rusage = os.wait4(process.pid, 0)
+print(os.waitstatus_to_exitcode(status), rusage.ru_maxrss)
+'''
+
+class TestZsndMemoryBudget(unittest.TestCase):
+    def test_parse_byte_size(self):
+        self.assertEqual(512 * MiB, parse_byte_size('512M'))
+        self.assertEqual(1536 * MiB, parse_byte_size('1.5GiB'))
+        self.assertEqual(4096, parse_byte_size('4k'))
+        self.assertEqual(100, parse_byte_size('100'))
+        with self.assertRaises(ValueError):
+            parse_byte_size('12X')
+
+    def test_chunk_frames(self):
+        budget = ZsndMemoryBudget(40 * MiB, baseline=32 * MiB)
+        self.assertEqual(8192, budget.get_chunk_frames(2, 8192))
+        budget = ZsndMemoryBudget(40 * MiB, 4, baseline=32 * MiB)
+        # (2 MiB - 1 MiB) / (3 copies * 8 bytes)
+        self.assertEqual(43690, budget.get_chunk_frames(8, 1 << 20))
+
+    def test_too_small(self):
+        with self.assertRaises(ZsndError):
+            ZsndMemoryBudget(32 * MiB, baseline=32 * MiB)
+        budget = ZsndMemoryBudget(33 * MiB + 1000, baseline=32 * MiB)
+        with self.assertRaises(ZsndError):
+            budget.get_chunk_frames(8, 8192)
+
+    def test_fit_jobs(self):
+        budget = ZsndMemoryBudget(40 * MiB, baseline=32 * MiB)
+        self.assertEqual(4, budget.fit_jobs(4, 2 * MiB))
+        self.assertEqual(2, budget.fit_jobs(4, 3 * MiB))
+        with self.assertRaises(ZsndError):
+            budget.fit_jobs(4, 9 * MiB)
+
+    @unittest.skipIf(resource is None or not hasattr(os, 'wait4'), 'rusage of a child is unavailable')
+    def test_peak_rss_within_budget(self):
+        limit = 64 * MiB
+        script = os.path.join(os.path.dirname(__file__), '..', 'strip-zsnd.py')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, 'input.wav')
+            with wave.open(input_path, 'wb') as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(44100)
+                block = bytes([0x40] * 2 * 44100) + bytes(2 * 441)
+                for _ in range(120):
+                    w.writeframes(block)
+            # A child started by vfork() inherits the peak RSS of this process at exec(),
+            # so a small launcher starts it and reports its rusage.
+            launcher = subprocess.run([sys.executable, '-c', _LAUNCHER, sys.executable, script,
+                    input_path, os.path.join(tmp_dir, 'output.wav'), '-f', '--on-clean', 'encode',
+                    '--max-memory', str(limit)], capture_output=True, text=True, check=True)
+            returncode, max_rss = map(int, launcher.stdout.split())
+            self.assertEqual(0, returncode)
+            with wave.open(os.path.join(tmp_dir, 'output.wav'), 'rb') as w:
+                self.assertEqual(120 * 44100, w.getnframes())
+            max_rss = max_rss if 'darwin' == sys.platform else max_rss * 1024
+            self.assertLessEqual(max_rss, limit)
@@ -0,0 +1,55 @@
+from metrics import ZsndHistogram, ZsndMetrics, ZsndPrometheusMetricsFormatter
+
+import re
+import unittest
+
+class TestZsndHistogram(unittest.TestCase):
+    def test_observe(self):
+        histogram = ZsndHistogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0, 3.0):
+            histogram.observe(value)
+        self.assertEqual([2, 1, 2], histogram.counts)
+        self.assertAlmostEqual(5.65, histogram.sum)
+
+class TestZsndMetrics(unittest.TestCase):
+    def test_aggregate(self):
+        metrics = ZsndMetrics()
+        for path, dropouts in (('a.wav', [(100, 441), (5000, 44100)]), ('b.wav', [])):
+            file_metrics = metrics.start_file(path, 44100, 2, 100_000)
+            for start, length in dropouts:
+                file_metrics.on_dropout(start, length)
+            file_metrics.update(100_000, 100_000 - sum(length for _, length in dropouts))
+            file_metrics.finish('dirty' if dropouts else 'clean')
+        aggregate = metrics.to_dict()['aggregate']
+        self.assertEqual({'dirty': 1, 'clean': 1}, aggregate['statuses'])
+        self.assertEqual(2, aggregate['dropouts'])
+        self.assertEqual(2 * 200_000, aggregate['bytes_read'])
+        self.assertAlmostEqual((441 + 44100) / 44100, aggregate['removed_seconds'])
+        self.assertEqual(2, aggregate['dropout_length_seconds']['count'])
+
+    def test_prometheus_format(self):
+        metrics = ZsndMetrics()
+        file_metrics = metrics.start_file('a"b.wav', 44100, 2, 1000)
+        file_metrics.on_dropout(0, 441)
+        text = ZsndPrometheusMetricsFormatter().format(metrics.to_dict())
+        self.assertIn('strip_zsnd_dropouts_total{file="a\\"b.wav"} 1\n', text)
+        self.assertIn('strip_zsnd_dropout_length_seconds_bucket{le="0.01"} 1\n', text)
+        self.assertIn('strip_zsnd_dropout_length_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('strip_zsnd_files{status="running"} 1\n', text)
+
+    def test_prometheus_format_parsable(self):
+        metrics = ZsndMetrics()
+        for path, status in (('a.wav', 'dirty'), ('b.wav', 'clean')):
+            file_metrics = metrics.start_file(path, 44100, 2, 1000)
+            file_metrics.on_dropout(0, 441)
+            file_metrics.update(1000, 559)
+            file_metrics.finish(status)
+        text = ZsndPrometheusMetricsFormatter().format(metrics.to_dict())
+        sample = re.compile(r'[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-z]+="(?:[^"\\]|\\.)*"'
+                r'(?:,[a-z]+="(?:[^"\\]|\\.)*")*\})? (\S+)')
+        for line in text.splitlines():
+            if line.startswith('#'):
+                continue
+            match = sample.fullmatch(line)
+            self.assertIsNotNone(match, line)
+            float(match.group(2))
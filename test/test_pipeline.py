@@ -0,0 +1,69 @@
+from pipeline import ZsndPrefetchingReader, ZsndWriteBehindWriter
+from service import StripZsndService, DropoutCollector
+from wav_io import ZsndWavReader, ZsndWavWriter
+
+import io
+import wave
+import unittest
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        chunk_size = StripZsndService._CHUNK_SIZE
+        barr = bytearray([0x40] * (2 * 10 * chunk_size))
+        for start in (chunk_size - 300, 4 * chunk_size + 100, 7 * chunk_size + 1000):
+            barr[2 * start : 2 * (start + 600)] = bytes(2 * 600)
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(barr)
+        self.wav = buf.getvalue()
+
+    def _strip(self, pipelined: bool) -> tuple[bytes, list]:
+        reader = ZsndWavReader(io.BytesIO(self.wav))
+        out = io.BytesIO()
+        writer = ZsndWavWriter(out, 2, 44100)
+        if pipelined:
+            reader = ZsndPrefetchingReader(reader, StripZsndService._CHUNK_SIZE, 2)
+            writer = ZsndWriteBehindWriter(writer, 2, 2)
+        collector = DropoutCollector()
+        for _ in StripZsndService(quiet=True).strip(reader, writer, listeners=(collector,)):
+            pass
+        reader.close()
+        writer.close()
+        return out.getvalue(), collector.dropouts
+
+    def test_same_as_sequential(self):
+        self.assertEqual(self._strip(False), self._strip(True))
+
+    def test_setpos(self):
+        chunk_size = StripZsndService._CHUNK_SIZE
+        reader = ZsndPrefetchingReader(ZsndWavReader(io.BytesIO(self.wav)), chunk_size, 2)
+        first = reader.read(chunk_size)
+        reader.read(chunk_size)
+        reader.rewind()
+        self.assertEqual(0, reader.tell())
+        self.assertEqual(first[0 : chunk_size], reader.read(chunk_size)[0 : chunk_size])
+        reader.setpos(9 * chunk_size)
+        self.assertEqual(chunk_size, len(reader.read(chunk_size)))
+        self.assertEqual(0, len(reader.read(chunk_size)))
+        self.assertEqual(0, len(reader.read(chunk_size)))
+        reader.close()
+
+    def test_write_error_is_raised(self):
+        class BrokenWriter:
+            def tell(self):
+                return 0
+            def write(self, data):
+                raise OSError('disk full')
+            def flush(self):
+                pass
+            def close(self):
+                pass
+        writer = ZsndWriteBehindWriter(BrokenWriter(), 2, 2)
+        writer.write(b'\0\0')
+        with self.assertRaises(OSError):
+            writer.flush()
+        with self.assertRaises(OSError):
+            writer.close()
@@ -0,0 +1,96 @@
+from reporting import ZsndDropoutReporter, ZsndDropoutReportWriter
+from service import StripZsndService
+from wav_io import ZsndWavReader, ZsndWavWriter
+
+import wave
+import csv
+import io
+import json
+import os
+import struct
+import tempfile
+from unittest.mock import patch
+import unittest
+
+class TestZsndDropoutReporter(unittest.TestCase):
+    def test_rate_limit(self):
+        reporter = ZsndDropoutReporter(max_lines_per_second=3)
+        with patch.object(reporter, '_log_dropout') as mock_log, \
+                patch('time.monotonic', return_value=100.0):
+            for i in range(10):
+                reporter.report(i * 1000, 441, 44100)
+        self.assertEqual(3, mock_log.call_count)
+        self.assertEqual(7, reporter._num_suppressed)
+        self.assertEqual(10, reporter.count)
+
+        with patch.object(reporter, '_log_dropout') as mock_log, \
+                patch('time.monotonic', return_value=101.0):
+            reporter.report(20000, 441, 44100)
+        mock_log.assert_called_once_with(20000, 441, 44100)
+
+    def test_ends(self):
+        reporter = ZsndDropoutReporter(num_ends=2)
+        with patch.object(reporter, '_log_dropout') as mock_log:
+            for i in range(10):
+                reporter.report(i, 1, 44100)
+            self.assertEqual([((0, 1, 44100),), ((1, 1, 44100),)], mock_log.call_args_list)
+            mock_log.reset_mock()
+            reporter.summarize()
+            self.assertEqual([((8, 1, 44100),), ((9, 1, 44100),)], mock_log.call_args_list)
+        self.assertEqual(6, reporter._num_suppressed)
+
+    def test_summary(self):
+        reporter = ZsndDropoutReporter(max_lines_per_second=0)
+        for length in (441, 441, 882, 44100 * 3):
+            reporter.report(0, length, 44100)
+        self.assertEqual(4, reporter.count)
+        self.assertAlmostEqual(3.04, reporter.total_length_in_seconds)
+        self.assertAlmostEqual(3.0, reporter.longest_in_seconds)
+        self.assertEqual([('<=10ms', 2), ('<=20ms', 1), ('<=5s', 1)],
+                [(label, count) for label, count in reporter._iterate_histogram() if count])
+
+class TestZsndDropoutReportWriter(unittest.TestCase):
+    def _create_reader(self) -> ZsndWavReader:
+        # zero runs with peaks of 3 and 2, crossing chunks of 256 frames
+        samples = [1000] * 500 + [0, 3, -3] * 300 + [1000] * 500 + [-2, 1] * 400
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(1000)
+            w.writeframes(struct.pack(f'<{len(samples)}h', *samples))
+        buf.seek(0)
+        return ZsndWavReader(buf)
+
+    def test_jsonl(self):
+        reader = self._create_reader()
+        f = io.StringIO()
+        report = ZsndDropoutReportWriter(f, ZsndDropoutReportWriter.FORMAT_JSONL,
+                reader.get_wave_format(), reader.get_sample_rate())
+        writer = ZsndWavWriter(io.BytesIO(), 2, 1000)
+        for _progress in StripZsndService(quiet=True, chunk_size=256).strip(reader, writer,
+                10, -80.0, listeners=(report,)):
+            pass
+        records = [json.loads(line) for line in f.getvalue().splitlines()]
+        self.assertEqual([(500, 1400, 900, 500, 3), (1900, 2700, 800, 1000, 2)],
+                [(record['input_start'], record['input_end'], record['length'],
+                        record['output_start'], record['peak_level']) for record in records])
+        self.assertEqual(0.5, records[0]['start_seconds'])
+        self.assertEqual(0.9, records[0]['length_seconds'])
+        self.assertEqual(-80.77, records[0]['peak_dbfs'])
+
+    def test_csv_without_output(self):
+        reader = self._create_reader()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'report.CSV')
+            report = ZsndDropoutReportWriter.open(path, reader.get_wave_format(),
+                    reader.get_sample_rate())
+            for _progress in StripZsndService(quiet=True, chunk_size=256).strip(reader, None,
+                    10, -80.0, True, (report,)):
+                pass
+            report.close()
+            with open(path, newline='') as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(list(ZsndDropoutReportWriter.FIELDS), rows[0])
+        self.assertEqual(['500', '1400', '900', '0.5', '0.9', '', '3', '-80.77'], rows[1])
+        self.assertEqual(3, len(rows))
@@ -0,0 +1,69 @@
+from server import ZsndStripServer
+from service import StripZsndService
+
+import http.client
+import io
+import json
+import threading
+import wave
+import unittest
+
+class TestZsndStripServer(unittest.TestCase):
+    def setUp(self):
+        self.server = ZsndStripServer(2, 10, -80.0)
+        self.host, self.port = self.server.bind_tcp('127.0.0.1', 0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            barr = bytearray([0x40] * (2 * 3 * StripZsndService._CHUNK_SIZE))
+            barr[2000:4000] = bytes(2000)
+            barr[-6000:-4000] = bytes(2000)
+            w.writeframes(barr)
+        self.wav = buf.getvalue()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+
+    def _post(self, path: str, body, headers={}) -> tuple[int, bytes]:
+        conn = http.client.HTTPConnection(self.host, self.port)
+        try:
+            conn.request('POST', path, body, headers,
+                    encode_chunked='chunked' == headers.get('Transfer-Encoding'))
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+    def test_strip_chunked(self):
+        def chunks():
+            for i in range(0, len(self.wav), 1000):
+                yield self.wav[i : i + 1000]
+        status, body = self._post('/strip', chunks(), {'Transfer-Encoding': 'chunked'})
+        self.assertEqual(200, status)
+        with wave.open(io.BytesIO(body), 'rb') as w:
+            # sizes in the header are unknown
+            frames = w.readframes(0x7FFFFFFF)
+        self.assertEqual(2 * 3 * StripZsndService._CHUNK_SIZE - 2000 * 2, len(frames))
+        self.assertNotIn(bytes(4), frames)
+
+    def test_detect(self):
+        status, body = self._post('/detect?duration=10', self.wav)
+        self.assertEqual(200, status)
+        report = json.loads(body)
+        self.assertEqual(2, report['count'])
+        self.assertEqual({'start': 1000, 'length': 1000}, {k: report['dropouts'][0][k]
+                for k in ('start', 'length')})
+        self.assertEqual(3 * StripZsndService._CHUNK_SIZE, report['frames'])
+
+    def test_rejects_invalid_input(self):
+        status, body = self._post('/strip', b'not a wav file')
+        self.assertEqual(400, status)
+        self.assertIn('error', json.loads(body))
+        status, _body = self._post('/strip?threshold=0', self.wav)
+        self.assertEqual(400, status)
@@ -0,0 +1,77 @@
+from sweep import ZsndParameterSweep
+from service import StripZsndService, DropoutCounter
+from wav_io import ZsndWavReader
+from wav_logic import DETECTION_BACKENDS, BACKEND_AUTO
+
+import wave
+import io
+import random
+import struct
+import unittest
+
+class TestZsndParameterSweep(unittest.TestCase):
+    def _create_wav(self, samples: list[int]) -> io.BytesIO:
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(8000)
+            w.writeframes(struct.pack(f'<{len(samples)}h', *samples))
+        buf.seek(0)
+        return buf
+
+    def _create_silences(self) -> io.BytesIO:
+        rng = random.Random(37)
+        samples = []
+        while len(samples) < 20000:
+            # silence at various levels between loud sounds
+            level = rng.choice((0, 1, 3, 8, 30, 100))
+            samples += [rng.randint(-level, level) for _i in range(rng.randint(1, 300))]
+            samples += [rng.choice((-1, 1)) * rng.randint(1000, 20000)
+                    for _i in range(rng.randint(0, 50))]
+        return self._create_wav(samples)
+
+    def test_sweep_matches_separate_runs(self):
+        buf = self._create_silences()
+        thresholds = [-100.0, -80.0, -70.0, -60.0, -50.0]
+        durations = [1, 5, 10, 20]
+
+        sweep = ZsndParameterSweep(thresholds, durations, chunk_size=1000)
+        for _progress in sweep.sweep(ZsndWavReader(buf)):
+            pass
+        result = sweep.result
+        self.assertEqual(sorted(thresholds, reverse=True), result.thresholds)
+
+        for i, threshold in enumerate(result.thresholds):
+            for j, duration in enumerate(result.durations):
+                buf.seek(0)
+                counter = DropoutCounter()
+                service = StripZsndService(quiet=True, chunk_size=777)
+                for _progress in service.strip(ZsndWavReader(buf), None, duration, threshold,
+                        True, (counter,)):
+                    pass
+                self.assertEqual((counter.count, counter.total_length),
+                        (result.counts[i][j], result.removed[i][j]),
+                        f'{threshold} dBFS, {duration} ms')
+
+    def test_run_across_chunks(self):
+        buf = self._create_wav([0] * 2500 + [1000] + [0] * 10)
+        sweep = ZsndParameterSweep([-80.0], [1, 100], chunk_size=1000)
+        for _progress in sweep.sweep(ZsndWavReader(buf)):
+            pass
+        self.assertEqual([[2, 1]], sweep.result.counts)
+        self.assertEqual([[2510, 2500]], sweep.result.removed)
+
+    def test_backends_agree(self):
+        buf = self._create_silences()
+        results = []
+        for backend in (BACKEND_AUTO, *(name for name, detection_backend
+                in DETECTION_BACKENDS.items() if detection_backend.is_available())):
+            buf.seek(0)
+            sweep = ZsndParameterSweep([-100.0, -80.0, -60.0], [1, 10], chunk_size=1000,
+                    backend=backend)
+            for _progress in sweep.sweep(ZsndWavReader(buf)):
+                pass
+            results.append((backend, sweep.result.counts, sweep.result.removed))
+        for backend, counts, removed in results[1:]:
+            self.assertEqual((results[0][1], results[0][2]), (counts, removed), backend)
@@ -0,0 +1,86 @@
+from synth import ZsndSynthesizer, ZsndSynthSpec, ZsndSynthRegion, SYNTH_FORMATS
+from service import StripZsndService, DropoutCollector
+from wav_io import ZsndWavReader, ZsndWavWriter
+from wav_logic import DETECTION_BACKENDS
+from util import ZsndError
+
+import io
+import json
+from unittest.mock import patch
+import unittest
+
+class TestZsndSynthesizer(unittest.TestCase):
+    def _synthesize(self, spec: ZsndSynthSpec, block_size: int = 10000) \
+            -> tuple[ZsndSynthesizer, io.BytesIO]:
+        synthesizer = ZsndSynthesizer(spec, block_size)
+        synthesizer.plan()
+        buf = io.BytesIO()
+        writer = ZsndWavWriter(buf, spec.format.bytes_per_sample, spec.sample_rate,
+                format_tag=spec.format.get_format_tag())
+        for _progress in synthesizer.synthesize(writer):
+            pass
+        writer.close()
+        buf.seek(0)
+        return synthesizer, buf
+
+    def _detect(self, buf: io.BytesIO, threshold: float) -> list[tuple[int, int]]:
+        collector = DropoutCollector()
+        for _progress in StripZsndService(quiet=True).strip(ZsndWavReader(buf), None, 1,
+                threshold, True, (collector,)):
+            pass
+        return collector.dropouts
+
+    def test_plan(self):
+        spec = ZsndSynthSpec(SYNTH_FORMATS['int16'], 441000, num_dropouts=50, num_noises=20,
+                seed=3)
+        regions = ZsndSynthesizer(spec).plan()
+        self.assertEqual(regions, ZsndSynthesizer(spec).plan())
+        self.assertEqual(50, sum(ZsndSynthRegion.KIND_DROPOUT == region.kind
+                for region in regions))
+        min_gap = 220
+        prev_end = 0
+        for region in regions:
+            self.assertTrue(220 <= region.length <= 2205)
+            self.assertGreaterEqual(region.start - prev_end, min_gap)
+            prev_end = region.start + region.length
+        self.assertGreaterEqual(spec.num_frames - prev_end, min_gap)
+        # 1 for -90 dBFS in 16 bits
+        self.assertEqual({0, 1}, {region.peak_level for region in regions})
+
+    def test_detected_as_planned(self):
+        # the noise is either under the threshold, or far over it in every sample
+        for name, threshold, noise_level in (('int8', -30.0, -90.0), ('int16', -80.0, -90.0),
+                ('int24', -80.0, -50.0), ('int32', -80.0, -50.0), ('float32', -80.0, -90.0),
+                ('float64', -80.0, -50.0)):
+            spec = ZsndSynthSpec(SYNTH_FORMATS[name], 100000, num_dropouts=10, num_noises=5,
+                    noise_level=noise_level, seed=1)
+            synthesizer, buf = self._synthesize(spec)
+            self.assertEqual(44 + 100000 * spec.format.bytes_per_sample, len(buf.getvalue()))
+            max_level = DETECTION_BACKENDS['python'].create(spec.format.is_float,
+                    spec.format.bytes_per_sample, threshold).get_max_level()
+            expected = [(region.start, region.length) for region in synthesizer.regions
+                    if region.peak_level <= max_level]
+            self.assertEqual(expected, self._detect(buf, threshold), name)
+
+    def test_without_numpy(self):
+        spec = ZsndSynthSpec(SYNTH_FORMATS['int24'], 30000, num_dropouts=5, seed=2)
+        with patch('synth.np', None):
+            synthesizer, buf = self._synthesize(spec, 7000)
+        self.assertEqual([(region.start, region.length) for region in synthesizer.regions],
+                self._detect(buf, -80.0))
+
+    def test_too_many_regions(self):
+        spec = ZsndSynthSpec(SYNTH_FORMATS['int16'], 1000, num_dropouts=10)
+        with self.assertRaises(ZsndError):
+            ZsndSynthesizer(spec).plan()
+
+    def test_truth(self):
+        spec = ZsndSynthSpec(SYNTH_FORMATS['float32'], 20000, num_dropouts=2, seed=4)
+        synthesizer = ZsndSynthesizer(spec)
+        synthesizer.plan()
+        f = io.StringIO()
+        synthesizer.save_truth(f)
+        truth = json.loads(f.getvalue())
+        self.assertEqual('float32', truth['format'])
+        self.assertEqual([{'kind': 'dropout', 'start': region.start, 'length': region.length,
+                'peak_level': 0} for region in synthesizer.regions], truth['regions'])
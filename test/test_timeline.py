@@ -0,0 +1,87 @@
+from timeline import ZsndTimelineMap
+from service import StripZsndService, DropoutCollector
+from wav_io import ZsndWavReader, ZsndWavWriter
+
+import io
+import os
+import tempfile
+import wave
+import unittest
+
+class TestZsndTimelineMap(unittest.TestCase):
+    def test_lookup(self):
+        # input: 1000 frames from 100, without 200-249 and 600-609
+        timeline = ZsndTimelineMap.from_runs([(200, 50), (600, 10)], 1000, 100, 1100)
+        self.assertEqual(2, len(timeline))
+        self.assertEqual(940, timeline.get_num_output_frames())
+        for output_frame, input_frame in ((0, 100), (99, 199), (100, 250), (449, 599),
+                (450, 610), (940, 1100), (-1, None), (941, None)):
+            self.assertEqual(input_frame, timeline.to_input(output_frame), output_frame)
+        for input_frame, output_frame in ((100, 0), (199, 99), (200, 100), (249, 100),
+                (250, 100), (605, 450), (610, 450), (1100, 940), (99, None), (1101, None)):
+            self.assertEqual(output_frame, timeline.to_output(input_frame), input_frame)
+
+    def test_round_trip(self):
+        runs = [(i * 100 + 7, 1 + i % 60) for i in range(10000)]
+        timeline = ZsndTimelineMap.from_runs(runs, 44100, 0, 1_000_000)
+        removed = {start + i for start, length in runs for i in range(length)}
+        for input_frame in range(0, 1_000_000, 37):
+            output_frame = timeline.to_output(input_frame)
+            if input_frame not in removed:
+                self.assertEqual(input_frame, timeline.to_input(output_frame))
+
+    def test_save_and_load(self):
+        timeline = ZsndTimelineMap.from_runs(((i * 1000, i + 1) for i in range(1000)),
+                48000, 0, 2_000_000)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'out.wav.zmap')
+            with open(path, 'wb') as f:
+                timeline.save(f)
+            self.assertEqual(40 + 16 * 1000, os.path.getsize(path))
+            loaded = ZsndTimelineMap.load(path)
+            self.assertEqual((48000, 1000), (loaded.sample_rate, len(loaded)))
+            for frame in range(0, 2_000_000, 999):
+                self.assertEqual(timeline.to_input(frame), loaded.to_input(frame))
+                self.assertEqual(timeline.to_output(frame), loaded.to_output(frame))
+            loaded.close()
+
+            with open(path, 'wb') as f:
+                ZsndTimelineMap(8000, 0, 100).save(f)
+            empty = ZsndTimelineMap.load(path)
+            self.assertEqual(100, empty.to_input(100))
+            with open(path, 'r+b') as f:
+                f.write(b'XXXXXXXX')
+            with self.assertRaises(ValueError):
+                ZsndTimelineMap.load(path)
+
+    def test_maps_stripped_output(self):
+        # long and short zero runs, inside and across the chunks of 1000 frames
+        frames = bytearray(b'\x40\x00' * 10000)
+        for start, length in ((500, 600), (1990, 20), (2999, 2), (4000, 1000), (6000, 441),
+                (7980, 440), (9990, 10)):
+            frames[2 * start : 2 * (start + length)] = bytes(2 * length)
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(44100)
+            w.writeframes(frames)
+        buf.seek(0)
+        out = io.BytesIO()
+        writer = ZsndWavWriter(out, 2, 44100)
+        collector = DropoutCollector()
+        for _ in StripZsndService(quiet=True, chunk_size=1000).strip(ZsndWavReader(buf), writer,
+                listeners=(collector,)):
+            pass
+        writer.close()
+        self.assertEqual([(500, 600), (4000, 1000), (6000, 441)], collector.dropouts)
+
+        timeline = ZsndTimelineMap.from_runs(collector.dropouts, 44100, 0, 10000)
+        out.seek(0)
+        with wave.open(out, 'rb') as w:
+            output = w.readframes(w.getnframes())
+        self.assertEqual(timeline.get_num_output_frames() * 2, len(output))
+        for output_frame in range(timeline.get_num_output_frames()):
+            input_frame = timeline.to_input(output_frame)
+            self.assertEqual(frames[2 * input_frame : 2 * input_frame + 2],
+                    output[2 * output_frame : 2 * output_frame + 2], output_frame)
@@ -0,0 +1,100 @@
+from watch import ZsndWatchDaemon, ZsndCompletionRecord, ZsndStripOptions
+from util import ZsndError
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+class TestZsndWatchDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.in_dir = os.path.join(self.tmp_dir.name, 'in')
+        os.mkdir(self.in_dir)
+        self.daemon = ZsndWatchDaemon([self.in_dir], os.path.join(self.tmp_dir.name, 'out'),
+                '*.wav', ZsndStripOptions(10, -80.0, 'clone'), 1, 5.0, 1.0)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_dispatch_waits_until_stable(self):
+        path = os.path.join(self.in_dir, 'a.wav')
+        with open(path, 'wb') as f:
+            f.write(b'RIFF')
+        record = ZsndCompletionRecord(os.path.join(self.tmp_dir.name, 'done.jsonl'))
+        pool = MagicMock()
+        running = {}
+        candidates = self.daemon._scan()
+        self.assertEqual({path}, candidates)
+
+        with patch('time.monotonic', return_value=100.0):
+            self.daemon._dispatch(candidates, running, record, pool)
+        with open(path, 'ab') as f:
+            f.write(b'....')
+        with patch('time.monotonic', return_value=104.0):
+            self.daemon._dispatch(candidates, running, record, pool)
+        with patch('time.monotonic', return_value=108.0):
+            self.daemon._dispatch(candidates, running, record, pool)
+        # still growing at 104.0
+        pool.submit.assert_not_called()
+
+        with patch('time.monotonic', return_value=109.0):
+            self.daemon._dispatch(candidates, running, record, pool)
+        pool.submit.assert_called_once()
+        self.assertEqual(set(), candidates)
+        record.close()
+
+    def test_ignores_output_dir_and_pattern(self):
+        self.assertTrue(self.daemon._matches(os.path.join(self.in_dir, 'A.WAV')))
+        self.assertFalse(self.daemon._matches(os.path.join(self.in_dir, 'a.flac')))
+        self.assertFalse(self.daemon._matches(os.path.join(self.tmp_dir.name, 'out', 'a.wav')))
+
+    def test_outputs_of_several_dirs(self):
+        in_dir2 = os.path.join(self.tmp_dir.name, 'in2')
+        os.mkdir(in_dir2)
+        out_dir = os.path.join(self.tmp_dir.name, 'out')
+        daemon = ZsndWatchDaemon([self.in_dir, in_dir2], out_dir, '*.wav',
+                ZsndStripOptions(10, -80.0, 'clone'), 1, 0.0, 1.0)
+        paths = [os.path.join(d, 'a.wav') for d in (self.in_dir, in_dir2)]
+        for path in paths:
+            with open(path, 'wb') as f:
+                f.write(b'RIFF')
+        record = ZsndCompletionRecord(os.path.join(self.tmp_dir.name, 'done.jsonl'))
+        pool = MagicMock()
+        running = {}
+        candidates = daemon._scan()
+        for now in (100.0, 101.0):
+            with patch('time.monotonic', return_value=now):
+                daemon._dispatch(candidates, running, record, pool)
+        self.assertEqual({(paths[0], os.path.join(out_dir, 'in', 'a.wav')),
+                (paths[1], os.path.join(out_dir, 'in2', 'a.wav'))},
+                {call.args[1:] for call in pool.submit.call_args_list})
+        self.assertFalse(daemon._matches(os.path.join(out_dir, 'in2', 'a.wav')))
+        record.close()
+
+        with self.assertRaises(ZsndError):
+            ZsndWatchDaemon([self.in_dir, os.path.join(in_dir2, 'in')], out_dir, '*.wav',
+                    ZsndStripOptions(10, -80.0, 'clone'), 1, 0.0, 1.0)
+
+class TestZsndCompletionRecord(unittest.TestCase):
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'done.jsonl')
+            record = ZsndCompletionRecord(path)
+            record.add('/in/a.wav', (100, 1), 'clean')
+            record.close()
+            with open(path, 'a') as f:
+                # torn by a crash
+                f.write('{"path": "/in/b.w')
+
+            record = ZsndCompletionRecord(path)
+            self.assertTrue(record.is_done('/in/a.wav', (100, 1)))
+            # replaced by a new recording
+            self.assertFalse(record.is_done('/in/a.wav', (200, 2)))
+            self.assertFalse(record.is_done('/in/b.wav', (100, 1)))
+            record.add('/in/c.wav', (300, 3), 'dirty')
+            record.close()
+
+            record = ZsndCompletionRecord(path)
+            self.assertTrue(record.is_done('/in/c.wav', (300, 3)))
+            record.close()
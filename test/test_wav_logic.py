@@ -1,10 +1,18 @@
 from wav_logic import \
     _PcmIntZeroSoundPredicate, \
     _PcmInt8ZeroSoundPredicate, \
-     _FloatZeroSoundPredicate
+     _FloatZeroSoundPredicate, \
+    _AutotunedZeroSoundPredicate, \
+    _RegexZeroSoundPredicate, \
+    WavZeroSoundPredicateFactory, ZsndBackendProfile, DETECTION_BACKENDS
+from wav_io import ZsndWavChunk
+from util import ZsndError
 
 import numpy as np
+import os
 import random
+import tempfile
+from unittest.mock import MagicMock
 import unittest
 
 class TestPcmIntZeroSoundPredicate(unittest.TestCase):
@@ -177,3 +185,75 @@ class TestFloatZeroSoundPredicate(unittest.TestCase):
         for i in range(0, 4000):
             self.assertFalse(predicate.is_zero_sound_sample(buf, i*width),
                     f'{i}: {buf[i*width:i*width+width]}')
+
+class TestDetectionBackends(unittest.TestCase):
+    FORMATS = ((False, 1), (False, 2), (False, 3), (False, 4), (True, 4), (True, 8))
+
+    def test_backends_agree(self):
+        rng = random.Random(0)
+        for is_float, width in self.FORMATS:
+            for threshold in (-10.0, -80.0, -200.0):
+                predicates = {name: backend.create(is_float, width, threshold)
+                        for name, backend in DETECTION_BACKENDS.items()
+                        if backend.supports(is_float, width)}
+                for _trial in range(50):
+                    buf = self._make_samples(rng, is_float, width, rng.randint(0, 200))
+                    expected = predicates['python'].find_zero_runs(buf, width)
+                    expected_inner = list(ZsndWavChunk(buf, width).iterate_inner_zero_runs(
+                            predicates['python']))
+                    for name, predicate in predicates.items():
+                        self.assertEqual(expected, predicate.find_zero_runs(buf, width),
+                                f'{name} int{width * 8} {threshold} dBFS: {buf}')
+                        self.assertEqual(expected_inner,
+                                list(ZsndWavChunk(buf, width).iterate_inner_zero_runs(predicate)),
+                                name)
+
+    def test_autotune(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            profile = ZsndBackendProfile(os.path.join(tmp_dir, 'backends.json'))
+            predicate = self._create(WavZeroSoundPredicateFactory(profile=profile))
+            self.assertIsInstance(predicate, _AutotunedZeroSoundPredicate)
+            buf = bytes(1000) + bytes(range(1, 201)) * 10
+            for _i in range(_AutotunedZeroSoundPredicate.CALIBRATION_CHUNKS):
+                self.assertEqual([(0, 500)], predicate.find_zero_runs(buf, 2))
+            chosen = ZsndBackendProfile(os.path.join(tmp_dir, 'backends.json')).get(
+                    'int16/level/2048')
+            self.assertIn(chosen, DETECTION_BACKENDS)
+            self.assertIs(predicate._candidates[chosen], predicate._chosen)
+
+            # from the profile without calibration
+            profile.put('int16/level/2048', 'regex')
+            predicate = self._create(WavZeroSoundPredicateFactory(profile=profile))
+            self.assertEqual([(0, 500)], predicate.find_zero_runs(buf, 2))
+            self.assertIs(predicate._candidates['regex'], predicate._chosen)
+
+    def test_wrong_backend_dropped(self):
+        predicate = self._create(WavZeroSoundPredicateFactory())
+        predicate._candidates['regex'].find_zero_runs = lambda *args: []
+        buf = bytes(1000) + bytes(range(1, 201)) * 10
+        for _i in range(_AutotunedZeroSoundPredicate.CALIBRATION_CHUNKS):
+            self.assertEqual([(0, 500)], predicate.find_zero_runs(buf, 2))
+        self.assertNotIn('regex', predicate._candidates)
+
+    def test_forced_backend(self):
+        self.assertIsInstance(self._create(WavZeroSoundPredicateFactory('regex')),
+                _RegexZeroSoundPredicate)
+        with self.assertRaises(ZsndError):
+            self._create(WavZeroSoundPredicateFactory('regex'), True, 4)
+
+    @staticmethod
+    def _create(factory: WavZeroSoundPredicateFactory, is_float: bool = False, width: int = 2):
+        reader = MagicMock()
+        reader.get_wave_format().is_float.return_value = is_float
+        reader.get_wave_format().get_bytes_per_sample.return_value = width
+        return factory.create(reader, -80.0)
+
+    @staticmethod
+    def _make_samples(rng: random.Random, is_float: bool, width: int, count: int) -> bytes:
+        if is_float:
+            values = [rng.choice((0.0, -0.0, 1e-9, -1e-9, 1e-4, 0.5, float('nan'),
+                    rng.uniform(-1, 1))) for _i in range(count)]
+            return np.array(values, '<f4' if 4 == width else '<f8').tobytes()
+        return bytes(rng.choice((0, 0, 1, 0x7F, 0x80, 0xFE, 0xFF, 0xFF, rng.randrange(0x100)))
+                for _i in range(count * width))
+
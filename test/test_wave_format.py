@@ -0,0 +1,40 @@
+from wave_format import RiffScanner, WaveFormatParser, WaveFormat
+
+import io
+import struct
+import unittest
+
+class TestRiffScanner(unittest.TestCase):
+    def test_scan(self):
+        f = io.BytesIO(self._build_wav())
+        index = RiffScanner().scan(f)
+        self.assertEqual([b'fmt ', b'LIST', b'data', b'bext'], [c.id for c in index])
+        self.assertEqual((12 + 8, 16), (index.get(b'fmt ').offset, index.get(b'fmt ').size))
+        self.assertEqual((12 + 24 + 8, 5), (index.get(b'LIST').offset, index.get(b'LIST').size))
+        self.assertEqual((12 + 24 + 14 + 8, 6), (index.get(b'data').offset, index.get(b'data').size))
+        self.assertEqual(b'\x01\x02\x03\x04\x05\x06',
+                f.getvalue()[index.get(b'data').offset:][:6])
+        self.assertIsNone(index.find(b'cue '))
+
+    def test_scan_stops_at_data(self):
+        f = io.BytesIO(self._build_wav())
+        index = RiffScanner().scan(f, stop_at_data=True)
+        self.assertEqual([b'fmt ', b'LIST', b'data'], [c.id for c in index])
+        self.assertEqual(b'\x01\x02', f.read(2))
+
+    def test_scan_unknown_data_size(self):
+        wav = bytearray(self._build_wav(data_size=0xFFFFFFFF, trailer=False))
+        index = RiffScanner().scan(io.BytesIO(wav))
+        self.assertEqual(6, index.get(b'data').size)
+
+    def test_parse(self):
+        wave_format = WaveFormatParser().parse(io.BytesIO(self._build_wav()))
+        self.assertEqual(WaveFormat(1, 1, 44100, 88200, 2, 16), wave_format)
+
+    def _build_wav(self, data_size: int = 6, trailer: bool = True) -> bytes:
+        chunks = struct.pack('<4sIHHIIHH', b'fmt ', 16, 1, 1, 44100, 88200, 2, 16)
+        chunks += b'LIST' + struct.pack('<I', 5) + b'INFOx\0'
+        chunks += b'data' + struct.pack('<I', data_size) + b'\x01\x02\x03\x04\x05\x06'
+        if trailer:
+            chunks += b'bext' + struct.pack('<I', 2) + b'ab'
+        return b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks
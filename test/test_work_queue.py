@@ -0,0 +1,145 @@
+from work_queue import ZsndWorkQueue
+from checkpoint import ZsndCheckpointer
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+class TestZsndWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.in_dir = os.path.join(self.tmp_dir.name, 'in')
+        self.out_dir = os.path.join(self.tmp_dir.name, 'out')
+        os.mkdir(self.in_dir)
+        for name in ('a.wav', 'b.wav', 'c.WAV', 'd.flac'):
+            with open(os.path.join(self.in_dir, name), 'wb') as f:
+                f.write(b'RIFF')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _create_queue(self, worker_id: str, lease_seconds: float = 600.0) -> ZsndWorkQueue:
+        return ZsndWorkQueue(self.in_dir, self.out_dir, lease_seconds=lease_seconds,
+                worker_id=worker_id)
+
+    def test_claim_is_exclusive(self):
+        queue1 = self._create_queue('node1:1')
+        queue2 = self._create_queue('node2:1')
+        path = os.path.join(self.in_dir, 'a.wav')
+        lease = queue1.claim(path)
+        self.assertIsNotNone(lease)
+        self.assertIsNone(queue2.claim(path))
+
+        queue1.release(lease)
+        lease = queue2.claim(path)
+        self.assertIsNotNone(lease)
+        self.assertTrue(queue2.complete(lease, 'out.wav', 0, 'dirty', 0.0))
+        # finished
+        self.assertIsNone(queue1.claim(path))
+        self.assertNotIn(path, queue1.scan())
+
+    def test_expired_lease_is_taken_over(self):
+        crashed = self._create_queue('node1:1', lease_seconds=60.0)
+        queue = self._create_queue('node2:1', lease_seconds=60.0)
+        path = os.path.join(self.in_dir, 'a.wav')
+        stale_lease = crashed.claim(path)
+        self.assertIsNone(queue.claim(path))
+
+        st = os.stat(stale_lease.lock_path)
+        os.utime(stale_lease.lock_path, (st.st_atime - 120, st.st_mtime - 120))
+        lease = queue.claim(path)
+        self.assertIsNotNone(lease)
+        self.assertFalse(stale_lease.renew())
+        self.assertFalse(crashed.complete(stale_lease, 'out.wav', 0, 'clean', 0.0))
+        self.assertTrue(queue.complete(lease, 'out.wav', 0, 'clean', 0.0))
+
+    def test_each_file_is_processed_once(self):
+        processed = []
+        lock = threading.Lock()
+
+        def process(input_path, output_path):
+            with lock:
+                processed.append(os.path.basename(input_path))
+            return (1, None) if input_path.endswith('b.wav') else (0, 'clean')
+
+        queues = [self._create_queue(f'node{i}:1') for i in range(3)]
+        threads = [threading.Thread(target=queue.run, args=(process, 0.1)) for queue in queues]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(['a.wav', 'b.wav', 'c.WAV'], sorted(processed))
+        self.assertEqual({'clean': 2, 'failed': 1}, {status: sum(queue.summary.get(status, 0)
+                for queue in queues) for status in ('clean', 'failed')})
+        state_dir = os.path.join(self.in_dir, ZsndWorkQueue.STATE_DIR_NAME)
+        with open(os.path.join(state_dir, 'b.wav' + ZsndWorkQueue.MARKER_SUFFIX)) as f:
+            marker = json.load(f)
+        self.assertEqual('failed', marker['status'])
+        self.assertEqual(os.path.join(self.out_dir, 'b.wav'), marker['output'])
+        self.assertFalse([name for name in os.listdir(state_dir)
+                if name.endswith(ZsndWorkQueue.LOCK_SUFFIX)])
+
+    def _patch_claim(self, queue: ZsndWorkQueue) -> list:
+        leases = []
+        claim = queue.claim
+
+        def claim_and_record(input_path):
+            lease = claim(input_path)
+            if lease is not None:
+                leases.append(lease)
+            return lease
+        queue.claim = claim_and_record
+        return leases
+
+    def test_lost_lease_leaves_work_of_new_holder(self):
+        queue = self._create_queue('node1:1', lease_seconds=60.0)
+        leases = self._patch_claim(queue)
+        taker = self._create_queue('node2:1', lease_seconds=60.0)
+
+        def process(input_path, work_path):
+            if not input_path.endswith('a.wav'):
+                return (0, 'clean')
+            for path, data in ((work_path, b'old'), (work_path + ZsndCheckpointer.SUFFIX, b'{}'),
+                    (work_path + ZsndCheckpointer.RUNS_SUFFIX, b'')):
+                with open(path, 'wb') as f:
+                    f.write(data)
+            lease = leases[-1]
+            st = os.stat(lease.lock_path)
+            os.utime(lease.lock_path, (st.st_atime - 120, st.st_mtime - 120))
+            new_lease = taker.claim(input_path)
+            new_work_path = taker._adopt_work(new_lease)
+            with open(new_work_path, 'rb') as f:
+                self.assertEqual(b'old', f.read())
+            with open(new_work_path, 'ab') as f:
+                f.write(b'new')
+            # the lost holder goes on writing until it is interrupted
+            with open(work_path, 'ab') as f:
+                f.write(b'stale')
+            self.assertTrue(taker.complete(new_lease, os.path.join(self.out_dir, 'a.wav'),
+                    0, 'dirty', 0.0))
+            lease.lost = True
+            raise KeyboardInterrupt()
+
+        queue.run(process, 0.1)
+        self.assertEqual({'clean': 2}, queue.summary)
+        with open(os.path.join(self.out_dir, 'a.wav'), 'rb') as f:
+            self.assertEqual(b'oldnew', f.read())
+        self.assertEqual(['a.wav'], os.listdir(self.out_dir))
+
+    def test_interrupt_after_process_is_guarded(self):
+        queue = self._create_queue('node1:1')
+        complete = queue.complete
+
+        def complete_and_lose(lease, *args):
+            completed = complete(lease, *args)
+            if lease.input_path.endswith('a.wav'):
+                lease.lost = True
+                raise KeyboardInterrupt()
+            return completed
+        queue.complete = complete_and_lose
+
+        queue.run(lambda input_path, work_path: (0, 'clean'), 0.1)
+        self.assertEqual({'clean': 3}, queue.summary)